@@ -1,22 +1,51 @@
-from fastapi import FastAPI, UploadFile, File, Form, HTTPException, BackgroundTasks
-from fastapi.responses import FileResponse, JSONResponse
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Request
+from fastapi.responses import JSONResponse, StreamingResponse, PlainTextResponse, RedirectResponse
 from fastapi.middleware.cors import CORSMiddleware
+from starlette.background import BackgroundTask
+from starlette.concurrency import run_in_threadpool
 import uvicorn
+import asyncio
+import contextvars
+import functools
+import hashlib
+import hmac
+import logging
 import uuid
 import os
-import tempfile
 import shutil
-import io
-import PyPDF2
-import requests
-import gdown
-from urllib.parse import urlparse
+import signal
+import tempfile
 import time
+from typing import List, Optional
+from urllib.parse import urlparse
 from dotenv import load_dotenv
+from pydantic import BaseModel
+from worker_pool import SplitWorkerPool, PoolBusyError, blocked_signals
+from pdf_utils import (
+    PdfDocument, split_pdf, partition_ranges, SharedResources, optimize_part, record_output, OutputProfile,
+    SplitStrategy, chunk_ranges, strategy_ranges
+)
+from pdf_backends import open_document, resolve_backend
+import images
+from fetch import HttpFetcher, fetch_gdrive_pdf, PdfSpool, DownloadError, HEADER_SEARCH_SIZE, CHUNK_SIZE
+from range_fetch import RangeFile, prefetch_pages, BLOCK_SIZE
+from preflight import scan_pdf, MAX_TREE_DEPTH
+from source_cache import SourceCache
+from result_cache import ResultCache
+from expiry import ExpiryIndex
+from artifacts import create_artifact_store, PARTIAL_PREFIX
+from streaming import ZipStreamWriter, multipart_part_header, multipart_end, MULTIPART_PART_END
+from downloads import file_download_response
+from events import JobEventLog, format_sse
+from jobs import create_job_store, JOB_RUNNING, JOB_DONE, JOB_FAILED
+from profiling import PROFILERS, PROFILE_SUFFIXES, profile_call
+from metrics import MetricsRegistry, Counter, Gauge, Histogram, StageTimer, ServerTimingMiddleware
 
 # Nạp các biến môi trường từ file .env
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 app = FastAPI(title="PDF Splitter API")
 
 # Thêm CORS middleware để cho phép yêu cầu từ domain của bạn
@@ -26,14 +55,37 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing"],
 )
 
+# Stage timings of each request go into its Server-Timing header
+app.add_middleware(ServerTimingMiddleware)
+
 # Temporary directory to store processed files
 TEMP_DIR = os.path.join(tempfile.gettempdir(), "pdf_splitter")
 os.makedirs(TEMP_DIR, exist_ok=True)
 
+# Directories of TEMP_DIR holding the parts of a zip or multipart response until they are sent
+STREAM_SPOOL_PREFIX = "stream_"
+
+# Where split outputs are kept: "local" (ARTIFACT_DIR on this machine), "shared" (ARTIFACT_DIR on
+# a filesystem every instance mounts) or "s3" (an S3-compatible bucket; /download/ redirects there)
+ARTIFACT_STORE = os.environ.get("ARTIFACT_STORE", "local").lower()
+ARTIFACT_DIR = os.environ.get("ARTIFACT_DIR", TEMP_DIR)
+ARTIFACT_BUCKET = os.environ.get("ARTIFACT_BUCKET", "")
+ARTIFACT_PREFIX = os.environ.get("ARTIFACT_PREFIX", "")
+ARTIFACT_ENDPOINT_URL = os.environ.get("ARTIFACT_ENDPOINT_URL") or None  # e.g. a MinIO server
+ARTIFACT_REGION = os.environ.get("ARTIFACT_REGION") or None
+artifact_store = create_artifact_store(
+    ARTIFACT_STORE, ARTIFACT_DIR, ARTIFACT_BUCKET, ARTIFACT_PREFIX, ARTIFACT_ENDPOINT_URL, ARTIFACT_REGION
+)
+
 # Auto-cleanup old files (files older than 1 hour)
 MAX_FILE_AGE = int(os.environ.get("MAX_FILE_AGE", 3600))  # 1 hour in seconds
+CLEANUP_INTERVAL = int(os.environ.get("CLEANUP_INTERVAL", 60))  # seconds between reaper runs
+
+# Expiry times of the split outputs, so cleanup only touches expired files
+expiry_index = ExpiryIndex(artifact_store, MAX_FILE_AGE)
 
 # Lấy domain từ biến môi trường hoặc sử dụng mặc định
 BASE_DOMAIN = os.environ.get("BASE_DOMAIN", "localhost")
@@ -44,85 +96,306 @@ if BASE_DOMAIN == "localhost":
 else:
     BASE_URL = f"{BASE_PROTOCOL}://{BASE_DOMAIN}"
 
-def cleanup_old_files():
-    """Remove temporary files older than MAX_FILE_AGE"""
-    current_time = time.time()
-    for filename in os.listdir(TEMP_DIR):
-        file_path = os.path.join(TEMP_DIR, filename)
-        # Check if file is older than MAX_FILE_AGE
-        if os.path.isfile(file_path) and (current_time - os.path.getmtime(file_path)) > MAX_FILE_AGE:
-            os.remove(file_path)
-
-def is_valid_pdf(file_data):
-    """Check if the data is a valid PDF file."""
+# Let the reverse proxy send /download/ bodies: "x-accel-redirect" (nginx) or "x-sendfile".
+# The proxy must map DOWNLOAD_OFFLOAD_PREFIX to ARTIFACT_DIR as an internal location.
+DOWNLOAD_OFFLOAD = os.environ.get("DOWNLOAD_OFFLOAD", "").lower()
+DOWNLOAD_OFFLOAD_PREFIX = os.environ.get("DOWNLOAD_OFFLOAD_PREFIX", "/protected-downloads/")
+
+# Downloads are streamed to disk and rejected once they pass this size (0 = no limit)
+MAX_DOWNLOAD_BYTES = int(os.environ.get("MAX_DOWNLOAD_BYTES", 200 * 1024 * 1024))
+DOWNLOAD_TIMEOUT = int(os.environ.get("DOWNLOAD_TIMEOUT", 60))  # seconds
+
+# URL downloads share one async connection pool, with at most this many downloads per host at a time
+DOWNLOAD_CONNECTIONS_PER_HOST = int(os.environ.get("DOWNLOAD_CONNECTIONS_PER_HOST", 4))
+# Failed connections, timeouts and 429/5xx answers are retried after 0.5 s, 1 s, ...
+DOWNLOAD_RETRIES = int(os.environ.get("DOWNLOAD_RETRIES", 2))
+DOWNLOAD_RETRY_BACKOFF = float(os.environ.get("DOWNLOAD_RETRY_BACKOFF", 0.5))  # seconds
+http_fetcher = HttpFetcher(DOWNLOAD_CONNECTIONS_PER_HOST, DOWNLOAD_TIMEOUT, DOWNLOAD_RETRIES, DOWNLOAD_RETRY_BACKOFF)
+
+# A URL split by explicit ranges fetches only the trailer, the xref and the objects of the
+# requested pages with range requests, if the server supports them and the file is this big
+RANGE_FETCH = os.environ.get("RANGE_FETCH", "true").lower() in ("1", "true", "yes")
+RANGE_FETCH_MIN_BYTES = int(os.environ.get("RANGE_FETCH_MIN_BYTES", 16 * 1024 * 1024))
+# Past this share of the pages, many small range requests cost more than one plain download
+RANGE_FETCH_MAX_SHARE = 0.25
+
+# /split-batch/ takes at most BATCH_MAX_ITEMS items and downloads BATCH_DOWNLOADS sources at a time
+BATCH_MAX_ITEMS = int(os.environ.get("BATCH_MAX_ITEMS", 1000))
+BATCH_DOWNLOADS = int(os.environ.get("BATCH_DOWNLOADS", 8))
+
+# Cache of source PDFs, shared by every worker on the host
+SOURCE_CACHE_DIR = os.environ.get("SOURCE_CACHE_DIR", os.path.join(tempfile.gettempdir(), "pdf_splitter_sources"))
+SOURCE_CACHE_BYTES = int(os.environ.get("SOURCE_CACHE_BYTES", 1024 * 1024 * 1024))
+source_cache = SourceCache(SOURCE_CACHE_DIR, SOURCE_CACHE_BYTES)
+
+# Split outputs already in the artifact store, by source content hash and page range
+RESULT_CACHE_PATH = os.environ.get("RESULT_CACHE_PATH", os.path.join(tempfile.gettempdir(), "pdf_splitter_results.sqlite3"))
+result_cache = ResultCache(RESULT_CACHE_PATH, artifact_store, MAX_FILE_AGE)
+
+# Worker pool for the CPU-bound split work, so it never runs on the event loop
+SPLIT_WORKERS = int(os.environ.get("SPLIT_WORKERS", os.cpu_count() or 1))
+SPLIT_MAX_PENDING = int(os.environ.get("SPLIT_MAX_PENDING", SPLIT_WORKERS * 2))
+SPLIT_RETRY_AFTER = int(os.environ.get("SPLIT_RETRY_AFTER", 5))  # seconds, sent with 503 responses
+split_pool = SplitWorkerPool(max_workers=SPLIT_WORKERS, max_pending=SPLIT_MAX_PENDING)
+# Requests with more ranges than this are spread over several workers, one task per this many ranges
+SPLIT_RANGES_PER_TASK = int(os.environ.get("SPLIT_RANGES_PER_TASK", 16))
+
+# Engine that parses and writes PDFs: pypdf2 (default), or pikepdf / pymupdf when installed
+PDF_BACKEND = resolve_backend(os.environ.get("PDF_BACKEND", "pypdf2"))
+
+# Per-request limits (0 = no limit). Uploads over MAX_UPLOAD_BYTES get 413, the rest 422.
+# Page counts are checked from the trailer and xref before any worker parses the PDF where possible.
+MAX_UPLOAD_BYTES = int(os.environ.get("MAX_UPLOAD_BYTES", MAX_DOWNLOAD_BYTES))
+MAX_PAGES = int(os.environ.get("MAX_PAGES", 100000))
+MAX_OUTPUT_PAGES = int(os.environ.get("MAX_OUTPUT_PAGES", 100000))
+MAX_OUTPUT_BYTES = int(os.environ.get("MAX_OUTPUT_BYTES", 1024 * 1024 * 1024))
+SPLIT_TIME_BUDGET = int(os.environ.get("SPLIT_TIME_BUDGET", 300))  # seconds of split work per request
+
+# time.time() at which the split workers of the current request are stopped
+split_deadline = contextvars.ContextVar("split_deadline", default=None)
+
+# Split jobs: "memory" keeps them in this process, "sqlite" shares them between workers
+JOB_STORE = os.environ.get("JOB_STORE", "memory")
+JOB_DB_PATH = os.environ.get("JOB_DB_PATH", os.path.join(tempfile.gettempdir(), "pdf_splitter_jobs.sqlite3"))
+job_store = create_job_store(JOB_STORE, JOB_DB_PATH)
+
+# Keep references to running job tasks so they are not garbage collected
+job_tasks = set()
+reaper_task = None
+
+# Progress events of the jobs running in this process, for /jobs/{job_id}/events
+job_events = JobEventLog()
+SSE_KEEPALIVE = 15  # seconds between keep-alive comments on an idle event stream
+JOB_POLL_INTERVAL = 1  # seconds, when following a job that runs in another worker process
+JOB_PROGRESS_INTERVAL = 1  # seconds between progress writes of a running job to the job store
+
+# Metrics of this process, served at /metrics; gauges are only read when scraped
+metrics = MetricsRegistry()
+stage_timer = StageTimer(metrics.register(Histogram(
+    "pdf_splitter_stage_seconds", "Time spent in each stage of a split request.", label="stage"
+)))
+input_bytes = metrics.register(Counter(
+    "pdf_splitter_input_bytes_total", "Bytes of source PDFs received, by source.", label="source"
+))
+output_bytes = metrics.register(Counter(
+    "pdf_splitter_output_bytes_total", "Bytes of split parts written or streamed."
+))
+pages_written = metrics.register(Counter(
+    "pdf_splitter_pages_written_total", "Pages copied into split parts."
+))
+metrics.register(Gauge(
+    "pdf_splitter_active_jobs", "Split jobs running in this process.", lambda: len(job_tasks)
+))
+metrics.register(Gauge(
+    "pdf_splitter_split_pool_busy", "Split calls running or queued on the worker pool.",
+    lambda: split_pool.max_pending - split_pool.free_slots
+))
+metrics.register(Gauge(
+    "pdf_splitter_temp_dir", "Files and bytes in the output directory, as tracked by this process's expiry index.",
+    expiry_index.usage, label="unit"
+))
+metrics.register(Gauge(
+    "pdf_splitter_cache_hit_ratio", "Hit ratio of the source and result caches since start.",
+    lambda: {"source": source_cache.get_stats()["hit_ratio"], "result": result_cache.get_stats()["hit_ratio"]},
+    label="cache"
+))
+
+# profile=cprofile or sampling profiles a split in its worker; allowed for requests carrying
+# PROFILE_TOKEN in X-Profile-Token, or for every request when PROFILE_REQUESTS is set
+PROFILE_TOKEN = os.environ.get("PROFILE_TOKEN", "")
+PROFILE_REQUESTS = os.environ.get("PROFILE_REQUESTS", "").lower() in ("1", "true", "yes")
+
+# json returns download links; zip and multipart stream the parts in the response itself
+RESPONSE_FORMATS = ("json", "zip", "multipart")
+
+# ranges takes an explicit range list; pages, bookmarks and size let the server choose the ranges
+SPLIT_MODES = ("ranges", "pages", "bookmarks", "size")
+
+# Bounds of the image options of an output profile; Pillow advises against JPEG quality above 95
+MIN_IMAGE_DPI = 36
+MAX_IMAGE_DPI = 1200
+MAX_IMAGE_QUALITY = 95
+
+class SplitError(Exception):
+    """Error raised inside a split worker, carrying the HTTP status to report."""
+    def __init__(self, status_code, detail):
+        super().__init__(status_code, detail)
+        self.status_code = status_code
+        self.detail = detail
+
+class SplitTimeout(BaseException):
+    """Raised by SIGALRM in a split worker that reached its request's deadline.
+    
+    A BaseException, so the except Exception blocks around parsing and
+    splitting let it through to call_with_deadline.
+    """
+
+def raise_split_timeout(signum, frame):
+    raise SplitTimeout()
+
+def call_with_deadline(deadline, fn, *args, **kwargs):
+    """Run fn(*args, **kwargs) in a split worker, interrupting it at deadline (a time.time() value)."""
+    timeout_error = SplitError(422, f"Splitting the PDF took longer than the {SPLIT_TIME_BUDGET} second limit.")
+    remaining = deadline - time.time()
+    if remaining <= 0:
+        raise timeout_error
+    if not hasattr(signal, "setitimer"):
+        # No interval timers on this platform: the budget is only checked before starting
+        return fn(*args, **kwargs)
+    
+    # Workers run their calls on the main thread, where signal handlers run
+    previous = signal.signal(signal.SIGALRM, raise_split_timeout)
+    signal.setitimer(signal.ITIMER_REAL, remaining)
     try:
-        # Try to create a PdfReader object
-        if isinstance(file_data, io.BytesIO):
-            file_data.seek(0)
-        pdf_reader = PyPDF2.PdfReader(file_data)
-        # If we can get the number of pages, it's likely a valid PDF
-        num_pages = len(pdf_reader.pages)
-        if isinstance(file_data, io.BytesIO):
-            file_data.seek(0)
-        return True
-    except Exception as e:
-        return False
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            # An alarm between fn returning and here is still caught below
+            signal.setitimer(signal.ITIMER_REAL, 0)
+    except SplitTimeout:
+        raise timeout_error from None
+    finally:
+        signal.signal(signal.SIGALRM, previous)
+
+def start_time_budget():
+    """Start the SPLIT_TIME_BUDGET clock of the current request."""
+    if SPLIT_TIME_BUDGET:
+        split_deadline.set(time.time() + SPLIT_TIME_BUDGET)
 
-def download_file_from_url(url):
-    """Download file from a given URL."""
+def with_time_budget(worker):
+    """worker, wrapped to stop at the deadline of the current request if it has one."""
+    deadline = split_deadline.get()
+    if deadline is None:
+        return worker
+    return functools.partial(call_with_deadline, deadline, worker)
+
+def check_page_count(total_pages):
+    """Raise SplitError(422) for a document with more than MAX_PAGES pages."""
+    if MAX_PAGES and total_pages > MAX_PAGES:
+        raise SplitError(422, f"The PDF has {total_pages} pages, over the {MAX_PAGES} page limit.")
+
+def check_output_pages(ranges, total_pages):
+    """Raise SplitError(422) when splitting ranges would write more than MAX_OUTPUT_PAGES pages.
+    
+    ranges is anything resolve_ranges takes; overlapping ranges count every
+    time they are written, and a split_by strategy writes each page once.
+    """
+    if not MAX_OUTPUT_PAGES:
+        return
+    if isinstance(ranges, SplitStrategy):
+        pages = total_pages
+    else:
+        if isinstance(ranges, str):
+            ranges = parse_range_input(ranges, total_pages)
+        pages = sum(end - start + 1 for start, end in ranges)
+    if pages > MAX_OUTPUT_PAGES:
+        raise SplitError(422, f"The requested ranges add up to {pages} pages, over the {MAX_OUTPUT_PAGES} page limit.")
+
+def output_bytes_error():
+    return SplitError(422, f"The split parts add up to more than the {MAX_OUTPUT_BYTES} byte limit.")
+
+async def preflight(source_path, ranges):
+    """Reject a source over the page limits from a scan of its trailer and xref, before any worker parses it.
+    
+    What the scan cannot tell (e.g. with cross-reference streams) is checked
+    by the split worker right after it opens the PDF.
+    """
+    with stage_timer.time("preflight"):
+        summary = await run_in_threadpool(scan_pdf, source_path)
+    try:
+        if summary.tree_depth is not None and summary.tree_depth > MAX_TREE_DEPTH:
+            raise SplitError(422, f"The page tree of the PDF is nested more than {MAX_TREE_DEPTH} levels deep.")
+        if summary.page_count is not None:
+            check_page_count(summary.page_count)
+            check_output_pages(ranges, summary.page_count)
+    except SplitError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+
+def remove_stream_spool(spool_dir):
+    """Delete the spool directory of a streamed split; a worker still writing into it fails at its next part."""
+    # Renamed away first, so a part the worker creates meanwhile cannot keep the directory alive
+    removed = f"{spool_dir}.removed"
+    try:
+        os.rename(spool_dir, removed)
+    except FileNotFoundError:
+        return
+    shutil.rmtree(removed, ignore_errors=True)
+
+def remove_stale_spools(now=None):
+    """Delete stream spools of TEMP_DIR untouched for MAX_FILE_AGE, left behind by a crashed process."""
+    now = now if now is not None else time.time()
+    with os.scandir(TEMP_DIR) as it:
+        for entry in it:
+            if entry.name.startswith(STREAM_SPOOL_PREFIX) and entry.is_dir() and entry.stat().st_mtime + MAX_FILE_AGE <= now:
+                shutil.rmtree(entry.path, ignore_errors=True)
+
+def cleanup_old_files():
+    """Remove temporary files older than MAX_FILE_AGE, as found by the expiry index"""
+    with stage_timer.time("cleanup"):
+        expiry_index.reap()
+        remove_stale_spools()
+        
+        # Jobs and cached results expire together with the files they point to
+        job_store.purge(MAX_FILE_AGE)
+        result_cache.purge(MAX_FILE_AGE)
+
+async def download_file_from_url(url, progress=None):
+    """Fetch a PDF from a given URL into the source cache.
+    
+    A cached copy is revalidated with a conditional GET and reused if unchanged.
+    The body is read on the event loop through the shared http_fetcher pool;
+    cache bookkeeping runs in the threadpool.
+    If given, progress is called with "download" events as the body arrives,
+    possibly from another thread.
+    Returns (path, None) or (None, DownloadError).
+    """
     # Check if it's a Google Drive link
     if "drive.google.com" in url:
-        return download_from_gdrive(url)
+        return await run_in_threadpool(download_from_gdrive, url, progress)
     
     # Regular HTTP URL
+    cached = await run_in_threadpool(source_cache.lookup_url, url)
+    partial = source_cache.new_partial()
     try:
-        # Add user agent to mimic a browser request
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.114 Safari/537.36',
-        }
-        
-        response = requests.get(url, headers=headers, stream=True, allow_redirects=True)
-        response.raise_for_status()
-        
-        # Get the file content
-        file_data = io.BytesIO(response.content)
-        
-        # Validate that it's actually a PDF
-        if not is_valid_pdf(file_data):
-            return None, "The downloaded file is not a valid PDF."
-            
-        return file_data, None
-        
-    except Exception as e:
-        return None, f"Error downloading file: {str(e)}"
+        download = await http_fetcher.fetch_pdf(
+            url, MAX_DOWNLOAD_BYTES, file=partial,
+            etag=cached["etag"] if cached else None,
+            last_modified=cached["last_modified"] if cached else None,
+            progress=progress
+        )
+    except DownloadError as e:
+        os.unlink(partial.name)
+        return None, e
+    
+    partial.close()
+    if download is None:
+        # 304 Not Modified: the cached copy is still current
+        os.unlink(partial.name)
+        await run_in_threadpool(source_cache.record_hit, cached["sha256"])
+        return cached["path"], None
+    
+    source_cache.record_miss()
+    input_bytes.inc(download.size, "url")
+    path = await run_in_threadpool(
+        source_cache.commit, partial.name, download.sha256, download.size,
+        url=url, etag=download.etag, last_modified=download.last_modified
+    )
+    return path, None
 
-def download_from_gdrive(url):
-    """Download a file from Google Drive."""
+def download_from_gdrive(url, progress=None):
+    """Fetch a PDF from Google Drive into the source cache; returns (path, error)."""
+    partial = source_cache.new_partial()
     try:
-        # Create a temporary file
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf') as temp_file:
-            temp_path = temp_file.name
-        
-        # Use gdown to download the file
-        output = gdown.download(url=url, output=temp_path, quiet=True, fuzzy=True)
-        
-        if output is None:
-            return None, "Failed to download file from Google Drive."
-            
-        # Read the file into BytesIO
-        with open(temp_path, 'rb') as f:
-            file_data = io.BytesIO(f.read())
-        
-        # Clean up the temporary file
-        os.unlink(temp_path)
-        
-        # Validate PDF
-        if not is_valid_pdf(file_data):
-            return None, "The downloaded file from Google Drive is not a valid PDF."
-            
-        return file_data, None
-    except Exception as e:
-        return None, f"Error downloading from Google Drive: {str(e)}"
+        download = fetch_gdrive_pdf(url, MAX_DOWNLOAD_BYTES, file=partial, progress=progress)
+    except DownloadError as e:
+        os.unlink(partial.name)
+        return None, e
+    
+    # Google Drive sends no validators, so the blob is deduplicated but never revalidated
+    partial.close()
+    source_cache.record_miss()
+    input_bytes.inc(download.size, "gdrive")
+    return source_cache.commit(partial.name, download.sha256, download.size), None
 
 def parse_range_input(range_input, max_pages):
     """Parse the range input string and convert to list of tuples."""
@@ -155,220 +428,1244 @@ def parse_range_input(range_input, max_pages):
     
     return ranges
 
-def split_pdf(input_pdf, ranges):
-    """Split a PDF file based on the provided page ranges."""
-    if isinstance(input_pdf, str):
-        pdf_reader = PyPDF2.PdfReader(input_pdf)
-    else:
-        pdf_reader = PyPDF2.PdfReader(input_pdf)
+def parse_split_options(split_by, ranges, pages_per_part, target_bytes):
+    """Validate the split options of a request.
     
-    total_pages = len(pdf_reader.pages)
+    Returns the range string for split_by=ranges, otherwise the SplitStrategy
+    the split worker computes the ranges from.
+    """
+    if split_by not in SPLIT_MODES:
+        raise HTTPException(status_code=400, detail=f"split_by must be one of: {', '.join(SPLIT_MODES)}.")
     
-    # Create a list to store all the split PDFs
-    output_pdfs = []
+    if split_by == "ranges":
+        if not ranges:
+            raise HTTPException(status_code=400, detail="ranges is required when split_by=ranges.")
+        return ranges
+    if split_by == "pages":
+        if not pages_per_part or pages_per_part < 1:
+            raise HTTPException(status_code=400, detail="pages_per_part must be a positive number when split_by=pages.")
+        return SplitStrategy("pages", pages_per_part)
+    if split_by == "size":
+        if not target_bytes or target_bytes < 1:
+            raise HTTPException(status_code=400, detail="target_bytes must be a positive number when split_by=size.")
+        return SplitStrategy("size", target_bytes)
+    return SplitStrategy("bookmarks", None)
+
+def parse_output_profile(optimize, image_dpi, image_quality):
+    """Validate the output options of a request.
     
-    for page_range in ranges:
-        start_page, end_page = page_range
-        
-        # Adjust for zero-based indexing and ensure within bounds
-        start_idx = max(0, start_page - 1)
-        end_idx = min(end_page, total_pages)
-        
-        if start_idx < total_pages and start_idx <= end_idx:
-            # Create a PDF writer for this range
-            pdf_writer = PyPDF2.PdfWriter()
-            
-            # Add the specified pages
-            for page_num in range(start_idx, end_idx):
-                pdf_writer.add_page(pdf_reader.pages[page_num])
-            
-            # Add to our list of output PDFs
-            output_pdfs.append(pdf_writer)
-    
-    return output_pdfs
-
-def save_pdf_to_temp(pdf_writer, range_str):
-    """Save PDF writer object to temporary file and return path."""
+    Returns the OutputProfile the parts are written with, or None to write them
+    as they are. image_dpi and image_quality imply optimize.
+    """
+    if image_dpi is not None and not MIN_IMAGE_DPI <= image_dpi <= MAX_IMAGE_DPI:
+        raise HTTPException(status_code=400, detail=f"image_dpi must be between {MIN_IMAGE_DPI} and {MAX_IMAGE_DPI}.")
+    if image_quality is not None and not 1 <= image_quality <= MAX_IMAGE_QUALITY:
+        raise HTTPException(status_code=400, detail=f"image_quality must be between 1 and {MAX_IMAGE_QUALITY}.")
+    if image_dpi is None and image_quality is None:
+        return OutputProfile(None, None) if optimize else None
+    if PDF_BACKEND != "pymupdf" and not images.available():
+        raise HTTPException(status_code=400, detail="Image downsampling needs Pillow on the server: pip install Pillow.")
+    return OutputProfile(image_dpi, image_quality)
+
+def resolve_ranges(document, ranges):
+    """Turn a range string, a SplitStrategy or a list of tuples into (start, end) tuples for document."""
+    if isinstance(ranges, str):
+        return parse_range_input(ranges, document.total_pages)
+    if isinstance(ranges, SplitStrategy):
+        range_tuples = strategy_ranges(document, ranges)
+        if not range_tuples and ranges.mode == "bookmarks":
+            raise SplitError(400, "The PDF has no top-level bookmarks to split by.")
+        return range_tuples
+    return ranges
+
+def save_pdf_to_temp(pdf_writer, range_str, progress=None):
+    """Save PDF writer object to the artifact store and return (filename, size).
+    
+    The writer streams into the store as it serializes, e.g. as S3 multipart
+    upload parts, so the part is never held whole in memory.
+    If given, progress is called with a "range_saved" event once the file is written.
+    """
     # Create a unique filename
     filename = f"split_{range_str}_{uuid.uuid4().hex}.pdf"
-    output_path = os.path.join(TEMP_DIR, filename)
     
     # Save the PDF
-    with open(output_path, "wb") as output_file:
+    output_file = artifact_store.open(filename)
+    try:
         pdf_writer.write(output_file)
+        size = output_file.tell()
+    except BaseException:
+        with blocked_signals(signal.SIGALRM):
+            output_file.abort()
+        raise
+    # The deadline may stop the serializing, but not the rename or multipart
+    # upload completion that publishes the part, or the file would be orphaned
+    with blocked_signals(signal.SIGALRM):
+        output_file.close()
     
-    return output_path
-
-@app.on_event("startup")
-async def startup_event():
-    # Create temp directory if it doesn't exist
-    os.makedirs(TEMP_DIR, exist_ok=True)
+    if progress:
+        progress({"event": "range_saved", "range": range_str, "pages": len(pdf_writer.pages), "bytes": size})
     
-    # Clean up any old files
-    cleanup_old_files()
-
-@app.get("/")
-async def root():
-    return {"message": "PDF Splitter API is running. Use /docs for API documentation."}
+    return filename, size
 
-@app.post("/split-pdf-url/")
-async def split_pdf_url(
-    url: str = Form(...),
-    ranges: str = Form(...),
-    background_tasks: BackgroundTasks = None
-):
-    """Split a PDF from a URL by page ranges."""
-    # Clean up old files
-    cleanup_old_files()
+def split_pdf_file(source_path, ranges, progress=None, optimize=False):
+    """Split the PDF at source_path and save every part; runs inside a split worker.
     
-    # Download the PDF from URL
-    pdf_data, error = download_file_from_url(url)
-    if error:
-        raise HTTPException(status_code=400, detail=error)
-    
-    if not pdf_data:
-        raise HTTPException(status_code=400, detail="Failed to download valid PDF from URL.")
+    ranges is a range string like "1-5,8-10", a SplitStrategy, or a list of already normalized tuples.
+    If given, progress is called with an event dict after parsing and after each saved part.
+    With optimize, an OutputProfile, unused objects are dropped, identical ones merged,
+    streams compressed and images downsampled before saving, and the result
+    reports what that saved.
+    The result also carries the time spent per stage, for the parent to record.
+    """
+    timings = {}
+    started = time.perf_counter()
     
-    # Get total pages
+    # Parse the PDF once; this also validates it and gives the page count
     try:
-        pdf_reader = PyPDF2.PdfReader(pdf_data)
-        total_pages = len(pdf_reader.pages)
-        # Reset seek pointer
-        pdf_data.seek(0)
+        document = open_document(source_path, PDF_BACKEND)
+        total_pages = document.total_pages
     except Exception as e:
-        raise HTTPException(status_code=400, detail=f"Error reading PDF: {str(e)}")
+        raise SplitError(400, f"Error reading PDF: {str(e)}")
+    check_page_count(total_pages)
     
-    # Parse ranges
-    range_tuples = parse_range_input(ranges, total_pages)
+    # Parse ranges, or compute them from the page tree and outline in the same pass
+    range_tuples = resolve_ranges(document, ranges)
     if not range_tuples:
-        raise HTTPException(status_code=400, detail="No valid page ranges specified.")
+        raise SplitError(400, "No valid page ranges specified.")
+    check_output_pages(range_tuples, total_pages)
+    
+    # Callers that pass parsed tuples report the parse themselves
+    if progress and not isinstance(ranges, list):
+        progress({"event": "parsed", "total_pages": total_pages, "ranges_total": len(range_tuples)})
+    started = stage_elapsed(timings, "parse", started)
     
     # Split the PDF
     try:
-        output_pdfs = split_pdf(pdf_data, range_tuples)
+        output_pdfs = split_pdf(document, range_tuples)
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error splitting PDF: {str(e)}")
+        raise SplitError(500, f"Error splitting PDF: {str(e)}")
+    started = stage_elapsed(timings, "split", started)
     
-    # Save each split PDF and collect download URLs
-    result_files = []
+    # Save each split PDF
+    shared = SharedResources(optimize) if optimize else None
+    saved_files = []
+    file_sizes = {}
+    pages = size = 0
+    try:
+        for i, pdf_writer in enumerate(output_pdfs):
+            range_str = f"{range_tuples[i][0]}-{range_tuples[i][1]}"
+            if shared:
+                optimize_part(pdf_writer, shared)
+                started = stage_elapsed(timings, "optimize", started)
+            filename, part_size = save_pdf_to_temp(pdf_writer, range_str, progress)
+            started = stage_elapsed(timings, "save", started)
+            saved_files.append((range_str, filename))
+            file_sizes[filename] = part_size
+            pages += len(pdf_writer.pages)
+            size += part_size
+            if shared:
+                record_output(pdf_writer, shared, part_size)
+            if MAX_OUTPUT_BYTES and size > MAX_OUTPUT_BYTES:
+                raise output_bytes_error()
+    except BaseException:
+        # Parts of a split that failed or timed out are never handed out
+        remove_outputs(saved_files)
+        raise
+    
+    split_result = {"total_pages": total_pages, "files": saved_files, "file_sizes": file_sizes,
+                    "timings": timings, "pages_written": pages, "bytes_written": size}
+    if shared:
+        split_result["optimization"] = shared.get_stats()
+    return split_result
+
+def stream_pdf_parts(source_path, ranges, progress, spool_dir, optimize=False):
+    """Split the PDF at source_path, writing each part into spool_dir and announcing it as a progress event.
+    
+    Runs inside a split worker; nothing is written to the artifact store. The
+    parts go through files rather than the shared event queue, so a large part
+    never has to fit in one message. Removing spool_dir stops the split at the
+    next part.
+    """
+    timings = {}
+    started = time.perf_counter()
+    
+    try:
+        document = open_document(source_path, PDF_BACKEND)
+        total_pages = document.total_pages
+    except Exception as e:
+        raise SplitError(400, f"Error reading PDF: {str(e)}")
+    check_page_count(total_pages)
+    
+    range_tuples = resolve_ranges(document, ranges)
+    if not range_tuples:
+        raise SplitError(400, "No valid page ranges specified.")
+    check_output_pages(range_tuples, total_pages)
     
+    progress({"event": "parsed", "total_pages": total_pages, "ranges_total": len(range_tuples)})
+    started = stage_elapsed(timings, "parse", started)
+    
+    try:
+        output_pdfs = split_pdf(document, range_tuples)
+    except Exception as e:
+        raise SplitError(500, f"Error splitting PDF: {str(e)}")
+    started = stage_elapsed(timings, "split", started)
+    
+    # Serialize one part at a time so the response can go out while the rest are written
+    shared = SharedResources(optimize) if optimize else None
+    pages = size = 0
     for i, pdf_writer in enumerate(output_pdfs):
         range_str = f"{range_tuples[i][0]}-{range_tuples[i][1]}"
-        output_path = save_pdf_to_temp(pdf_writer, range_str)
-        filename = os.path.basename(output_path)
-        
-        # Add file to result
+        if shared:
+            optimize_part(pdf_writer, shared)
+            started = stage_elapsed(timings, "optimize", started)
+        part_path = os.path.join(spool_dir, f"{i}.pdf")
+        with open(part_path, "wb") as part_file:
+            pdf_writer.write(part_file)
+            part_size = part_file.tell()
+        started = stage_elapsed(timings, "save", started)
+        pages += len(pdf_writer.pages)
+        size += part_size
+        if MAX_OUTPUT_BYTES and size > MAX_OUTPUT_BYTES:
+            raise output_bytes_error()
+        progress({"event": "part", "range": range_str, "path": part_path, "bytes": part_size})
+    
+    return {"total_pages": total_pages, "files": [],
+            "timings": timings, "pages_written": pages, "bytes_written": size}
+
+def stage_elapsed(timings, stage, started):
+    """Add the time since started to timings[stage] and return the current time."""
+    now = time.perf_counter()
+    timings[stage] = timings.get(stage, 0.0) + now - started
+    return now
+
+def record_split_stats(split_result):
+    """Record the stage timings and output counts a split worker sent back."""
+    for stage, seconds in split_result.pop("timings", {}).items():
+        stage_timer.record(stage, seconds)
+    pages_written.inc(split_result.pop("pages_written", 0))
+    output_bytes.inc(split_result.pop("bytes_written", 0))
+
+def pool_busy_error():
+    """503 response telling the client to back off while the split pool is full."""
+    return HTTPException(
+        status_code=503,
+        detail="Server is busy splitting other PDFs, please retry later.",
+        headers={"Retry-After": str(SPLIT_RETRY_AFTER)}
+    )
+
+async def run_split(source_path, ranges, on_progress=None, worker=split_pdf_file, **kwargs):
+    """Run worker (split_pdf_file by default) on the worker pool, mapping failures to HTTP errors."""
+    worker = with_time_budget(worker)
+    try:
+        with stage_timer.time("worker"):
+            if on_progress:
+                split_result = await split_pool.run_with_progress(worker, on_progress, source_path, ranges, **kwargs)
+            else:
+                split_result = await split_pool.run(worker, source_path, ranges, **kwargs)
+    except PoolBusyError:
+        raise pool_busy_error()
+    except SplitError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    
+    record_split_stats(split_result)
+    return split_result
+
+def count_pages(source_path):
+    """Return the page count of the PDF at source_path; runs inside a split worker."""
+    try:
+        document = open_document(source_path, PDF_BACKEND)
+    except Exception as e:
+        raise SplitError(400, f"Error reading PDF: {str(e)}")
+    document.close()
+    check_page_count(document.total_pages)
+    return document.total_pages
+
+async def read_page_count(source_path):
+    """Run count_pages on the worker pool, mapping failures to HTTP errors."""
+    try:
+        with stage_timer.time("page_count"):
+            return await split_pool.run(with_time_budget(count_pages), source_path)
+    except PoolBusyError:
+        raise pool_busy_error()
+    except SplitError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+
+def split_task_count(range_count):
+    """How many worker tasks a split of range_count ranges is spread over."""
+    wanted = -(-range_count // SPLIT_RANGES_PER_TASK)
+    return max(1, min(wanted, split_pool.max_workers, split_pool.free_slots))
+
+async def split_ranges(source_path, range_tuples, on_progress=None, optimize=False):
+    """Split normalized ranges, spreading them over the worker pool when there are many.
+    
+    Each task opens the source by path and writes its own consecutive group of
+    ranges; the groups are joined back in request order.
+    """
+    groups = partition_ranges(range_tuples, split_task_count(len(range_tuples)))
+    try:
+        with stage_timer.time("worker"):
+            results = await split_pool.map(
+                with_time_budget(split_pdf_file), [(source_path, group) for group in groups], on_progress,
+                return_exceptions=True, optimize=optimize
+            )
+    except PoolBusyError:
+        raise pool_busy_error()
+    
+    errors = [result for result in results if isinstance(result, BaseException)]
+    if errors:
+        # The groups that did finish saved their parts already; none of them is handed out
+        remove_outputs([saved_file for result in results if not isinstance(result, BaseException)
+                        for saved_file in result["files"]])
+        if isinstance(errors[0], SplitError):
+            raise HTTPException(status_code=errors[0].status_code, detail=errors[0].detail)
+        raise errors[0]
+    
+    # Each task only saw its own parts, so the output limit is checked again on the total
+    size = sum(result["bytes_written"] for result in results)
+    for result in results:
+        record_split_stats(result)
+    
+    files = [saved_file for result in results for saved_file in result["files"]]
+    if MAX_OUTPUT_BYTES and size > MAX_OUTPUT_BYTES:
+        remove_outputs(files)
+        error = output_bytes_error()
+        raise HTTPException(status_code=error.status_code, detail=error.detail)
+    file_sizes = {filename: part_size for result in results for filename, part_size in result["file_sizes"].items()}
+    split_result = {"total_pages": results[0]["total_pages"], "files": files, "file_sizes": file_sizes}
+    if optimize:
+        split_result["optimization"] = merge_optimization_stats(result["optimization"] for result in results)
+    return split_result
+
+def merge_optimization_stats(stats_list):
+    """Add up the optimization stats of several split tasks."""
+    merged = {}
+    for stats in stats_list:
+        for name, value in stats.items():
+            merged[name] = merged.get(name, 0) + value
+    return merged
+
+def needs_document(ranges):
+    """Whether the ranges can only be computed from the PDF itself, not from its page count."""
+    return isinstance(ranges, SplitStrategy) and ranges.mode != "pages"
+
+def has_many_ranges(ranges):
+    """Whether a split is likely to give enough ranges to spread over several workers."""
+    if isinstance(ranges, SplitStrategy):
+        return ranges.mode == "pages"
+    return ranges.count(",") >= SPLIT_RANGES_PER_TASK
+
+def result_key(range_str, optimize):
+    """Result cache key of a part; the outputs of each output profile are cached apart from plain ones."""
+    if not optimize:
+        return range_str
+    key = f"{range_str}+optimized"
+    if isinstance(optimize, OutputProfile):
+        if optimize.image_dpi:
+            key += f"+dpi{optimize.image_dpi}"
+        if optimize.image_quality:
+            key += f"+q{optimize.image_quality}"
+    return key
+
+def add_source_bytes(split_result, source_path):
+    """Put the source size next to the output size in the optimization stats, if there are any."""
+    if "optimization" in split_result:
+        split_result["optimization"]["source_bytes"] = os.path.getsize(source_path)
+    return split_result
+
+def remove_outputs(files):
+    """Delete files saved by save_pdf_to_temp that will not be handed out."""
+    for _, filename in files:
+        artifact_store.delete(filename)
+
+def track_outputs(split_result):
+    """Add the files a split worker saved with save_pdf_to_temp to the expiry index."""
+    for _, filename in split_result["files"]:
+        expiry_index.add(filename, split_result["file_sizes"][filename])
+
+async def split_profiled(source_path, ranges, on_progress, optimize, profile):
+    """Split in one worker under the profile profiler, saving the raw profile next to the outputs."""
+    filename = f"profile_{uuid.uuid4().hex}{PROFILE_SUFFIXES[profile]}"
+    # The profiler writes a local file, which then joins the outputs in the artifact store
+    profile_path = os.path.join(TEMP_DIR, filename)
+    worker = functools.partial(profile_call, profile, profile_path, split_pdf_file)
+    split_result = await run_split(source_path, ranges, on_progress, worker=worker, optimize=optimize)
+    track_outputs(split_result)
+    profile_size = os.path.getsize(profile_path)
+    if artifact_store.path(filename) != profile_path:
+        await run_in_threadpool(artifact_store.save_file, profile_path, filename)
+    expiry_index.add(filename, profile_size)
+    split_result["profile"]["download_url"] = f"{BASE_URL}/download/{filename}"
+    return split_result
+
+async def split_source(source_path, ranges, on_progress=None, optimize=False, profile=None):
+    """Split a cached source PDF, reusing outputs already made for the same content and range."""
+    start_time_budget()
+    await preflight(source_path, ranges)
+    
+    if profile:
+        # A cached result would leave nothing to profile, so profiled splits always run in full
+        split_result = await split_profiled(source_path, ranges, on_progress, optimize, profile)
+        return add_source_bytes(split_result, source_path)
+    
+    sha256 = source_cache.sha256_of(source_path)
+    with stage_timer.time("result_cache"):
+        total_pages = await run_in_threadpool(result_cache.get_total_pages, sha256)
+    if total_pages is None or needs_document(ranges):
+        if not has_many_ranges(ranges):
+            # First split of this document, or ranges that depend on its contents:
+            # the worker finds the page count and the ranges
+            split_result = await run_split(source_path, ranges, on_progress, optimize=optimize)
+            track_outputs(split_result)
+            stored_files = [(result_key(range_str, optimize), filename) for range_str, filename in split_result["files"]]
+            await run_in_threadpool(result_cache.store, sha256, split_result["total_pages"], stored_files)
+            return add_source_bytes(split_result, source_path)
+        # Many ranges: count the pages first so they can be spread over the pool
+        total_pages = await read_page_count(source_path)
+    
+    if isinstance(ranges, SplitStrategy):
+        range_tuples = chunk_ranges(total_pages, ranges.value)
+    else:
+        range_tuples = parse_range_input(ranges, total_pages)
+    if not range_tuples:
+        raise HTTPException(status_code=400, detail="No valid page ranges specified.")
+    try:
+        check_page_count(total_pages)
+        check_output_pages(range_tuples, total_pages)
+    except SplitError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    
+    range_strs = [f"{start}-{end}" for start, end in range_tuples]
+    keys = {range_str: result_key(range_str, optimize) for range_str in range_strs}
+    with stage_timer.time("result_cache"):
+        cached_files = await run_in_threadpool(result_cache.get_parts, sha256, list(keys.values()))
+    missing = [range_tuple for range_tuple, range_str in zip(range_tuples, range_strs) if keys[range_str] not in cached_files]
+    
+    # Sizes may take a request each to the artifact store, so look them up off the event loop
+    sizes = {}
+    if on_progress or optimize:
+        sizes = await run_in_threadpool(lambda: {filename: artifact_store.size(filename) for filename in cached_files.values()})
+    if on_progress:
+        on_progress({"event": "parsed", "total_pages": total_pages, "ranges_total": len(range_tuples)})
+        for (start, end), range_str in zip(range_tuples, range_strs):
+            if keys[range_str] in cached_files:
+                on_progress({"event": "range_saved", "range": range_str, "pages": end - start + 1,
+                             "bytes": sizes[cached_files[keys[range_str]]], "cached": True})
+    
+    # Cached parts were already optimized when they were written, so they save nothing now
+    optimization = SharedResources().get_stats()
+    if missing:
+        split_result = await split_ranges(source_path, missing, on_progress, optimize=optimize)
+        track_outputs(split_result)
+        stored_files = [(keys[range_str], filename) for range_str, filename in split_result["files"]]
+        await run_in_threadpool(result_cache.store, sha256, total_pages, stored_files)
+        cached_files.update(stored_files)
+        optimization = split_result.get("optimization", optimization)
+    
+    split_result = {"total_pages": total_pages, "files": [(range_str, cached_files[keys[range_str]]) for range_str in range_strs]}
+    if optimize:
+        optimization["output_bytes"] += sum(sizes.values())
+        split_result["optimization"] = optimization
+    return add_source_bytes(split_result, source_path)
+
+def build_split_payload(split_result):
+    """Build the JSON payload describing a finished split."""
+    result_files = []
+    for range_str, filename in split_result["files"]:
         result_files.append({
             "range": range_str,
             "download_url": f"{BASE_URL}/download/{filename}",
             "filename": f"split_{range_str}.pdf"
         })
     
-    # Schedule cleanup of temporary files
-    if background_tasks:
-        background_tasks.add_task(cleanup_old_files)
-    
-    return JSONResponse(content={
-        "message": f"Successfully split PDF into {len(output_pdfs)} files.",
-        "total_pages": total_pages,
+    payload = {
+        "message": f"Successfully split PDF into {len(result_files)} files.",
+        "total_pages": split_result["total_pages"],
         "files": result_files
+    }
+    if "optimization" in split_result:
+        payload["optimization"] = split_result["optimization"]
+    if "profile" in split_result:
+        payload["profile"] = split_result["profile"]
+    return payload
+
+async def fetch_url_source(url, on_progress=None):
+    """Download the PDF at url into the source cache and return its path."""
+    progress = None
+    if on_progress:
+        loop = asyncio.get_running_loop()
+        
+        # Download events are sent from worker threads; hand them to the event loop
+        def progress(event):
+            loop.call_soon_threadsafe(on_progress, event)
+    
+    with stage_timer.time("download"):
+        source_path, error = await download_file_from_url(url, progress)
+    if error:
+        raise HTTPException(status_code=error.status_code, detail=str(error))
+    
+    if not source_path:
+        raise HTTPException(status_code=400, detail="Failed to download valid PDF from URL.")
+    
+    return source_path
+
+def range_fetch_spans(url, validator, loop):
+    """fetch_spans for a RangeFile read in the threadpool: the spans are fetched concurrently on loop."""
+    async def fetch_all(spans):
+        return await asyncio.gather(*(http_fetcher.fetch_range(url, start, end, validator) for start, end in spans))
+    
+    def fetch_spans(spans):
+        return asyncio.run_coroutine_threadsafe(fetch_all(spans), loop).result()
+    return fetch_spans
+
+def read_remote_pages(range_file, ranges):
+    """Fetch what splitting ranges reads from the PDF behind range_file; runs in the threadpool.
+    
+    Returns False without fetching the pages if the ranges cover more than
+    RANGE_FETCH_MAX_SHARE of them, where a plain download is cheaper.
+    """
+    try:
+        document = PdfDocument(range_file)
+        total_pages = document.total_pages
+        check_page_count(total_pages)
+        range_tuples = parse_range_input(ranges, total_pages)
+        check_output_pages(range_tuples, total_pages)
+        
+        pages = sorted({index for start, end in range_tuples for index in range(start - 1, min(end, total_pages))})
+        if len(pages) > total_pages * RANGE_FETCH_MAX_SHARE:
+            return False
+        prefetch_pages(document, range_file, pages)
+        return True
+    except (DownloadError, SplitError):
+        raise
+    except Exception as e:
+        raise SplitError(400, f"Error reading PDF: {str(e)}")
+
+def has_cached_parts(sha256, ranges, optimize):
+    """Whether the result cache holds every part of ranges for the source sha256."""
+    total_pages = result_cache.get_total_pages(sha256)
+    if total_pages is None:
+        return False
+    keys = {result_key(f"{start}-{end}", optimize) for start, end in parse_range_input(ranges, total_pages)}
+    return bool(keys) and len(result_cache.get_parts(sha256, list(keys))) == len(keys)
+
+async def fetch_url_pages(url, ranges, on_progress=None, optimize=False, profile=None):
+    """Fetch only the parts of the PDF at url that splitting ranges reads, with HTTP range requests.
+    
+    Returns the path of a sparse local copy holding those parts, which the
+    caller removes with its directory once the split is done, or None when a
+    plain download should be used instead: split_by strategies, a backend other
+    than pypdf2 (the prefetch follows PyPDF2's reads), a URL already in the
+    source cache, a server without range support or a small file.
+    The copy is named after the URL and its validator, so results cached for
+    it are reused as long as the file on the server does not change; when all
+    the parts are cached, nothing past the probe is fetched.
+    """
+    if not RANGE_FETCH or PDF_BACKEND != "pypdf2" or not isinstance(ranges, str) or "drive.google.com" in url:
+        return None
+    if await run_in_threadpool(source_cache.lookup_url, url):
+        return None
+    
+    with stage_timer.time("download"):
+        try:
+            probe = await http_fetcher.probe_ranges(url, BLOCK_SIZE)
+        except DownloadError as e:
+            raise HTTPException(status_code=e.status_code, detail=str(e))
+        if probe is None or probe.size < RANGE_FETCH_MIN_BYTES:
+            return None
+        if b"%PDF-" not in probe.head[:HEADER_SEARCH_SIZE]:
+            raise HTTPException(status_code=400, detail="The downloaded file is not a valid PDF.")
+        
+        # If-Range only takes a strong ETag or a date
+        validator = probe.etag if probe.etag and not probe.etag.startswith("W/") else probe.last_modified
+        key = hashlib.sha256(f"{url}\n{validator}\n{probe.size}".encode()).hexdigest() if validator else uuid.uuid4().hex
+        directory = tempfile.mkdtemp(prefix="ranged_", dir=source_cache.directory)
+        range_file = RangeFile(
+            os.path.join(directory, f"{key}.pdf"), probe.size,
+            range_fetch_spans(url, validator, asyncio.get_running_loop()), MAX_DOWNLOAD_BYTES, probe.head
+        )
+        try:
+            if validator and not profile and await run_in_threadpool(has_cached_parts, key, ranges, optimize):
+                # The split will only hand out cached parts and never read the source
+                worth_it = True
+            else:
+                worth_it = await run_in_threadpool(read_remote_pages, range_file, ranges)
+        except BaseException as e:
+            shutil.rmtree(directory, ignore_errors=True)
+            if isinstance(e, DownloadError):
+                raise HTTPException(status_code=e.status_code, detail=str(e))
+            if isinstance(e, SplitError):
+                raise HTTPException(status_code=e.status_code, detail=e.detail)
+            raise
+        finally:
+            range_file.close()
+    if not worth_it:
+        shutil.rmtree(directory, ignore_errors=True)
+        return None
+    
+    size = len(probe.head) + range_file.bytes_fetched
+    input_bytes.inc(size, "url")
+    if on_progress:
+        on_progress({"event": "download", "bytes": size, "total": size, "done": True})
+    return range_file.path
+
+async def split_url_source(url, ranges, on_progress=None, optimize=False, profile=None):
+    """Download the PDF at url, or only the parts the ranges need, and split it."""
+    source_path = await fetch_url_pages(url, ranges, on_progress, optimize, profile)
+    if source_path is not None:
+        try:
+            return await split_source(source_path, ranges, on_progress, optimize=optimize, profile=profile)
+        finally:
+            shutil.rmtree(os.path.dirname(source_path), ignore_errors=True)
+    
+    # The split worker opens the cached file by path
+    source_path = await fetch_url_source(url, on_progress)
+    return await split_source(source_path, ranges, on_progress, optimize=optimize, profile=profile)
+
+def failed_entry(index, url, error):
+    """Manifest entry of a batch item that could not be split."""
+    return {"index": index, "url": url, "status": JOB_FAILED,
+            "error": {"status_code": error.status_code, "detail": error.detail}}
+
+async def split_batch_source(url, specs, downloads, splits):
+    """Download url once and split it for every batch item that asked for it.
+    
+    specs are (index, ranges, optimize) tuples. The range strings of all items
+    with the same output profile go to the worker as one split, so the source is
+    parsed once for them and a range asked for twice is written once; split_by
+    strategies get a split each. Returns {index: manifest entry}.
+    """
+    try:
+        async with downloads:
+            source_path = await fetch_url_source(url)
+    except HTTPException as e:
+        return {index: failed_entry(index, url, e) for index, _, _ in specs}
+    
+    calls = {}
+    for index, ranges, optimize in specs:
+        key = ("ranges", optimize) if isinstance(ranges, str) else (index, optimize)
+        calls.setdefault(key, []).append((index, ranges))
+    
+    entries = {}
+    for (_, optimize), members in calls.items():
+        ranges = members[0][1]
+        if isinstance(ranges, str):
+            parts = (part.strip() for _, item_ranges in members for part in item_ranges.split(","))
+            ranges = ",".join(dict.fromkeys(part for part in parts if part))
+        try:
+            async with splits:
+                split_result = await split_source(source_path, ranges, optimize=optimize)
+        except HTTPException as e:
+            entries.update((index, failed_entry(index, url, e)) for index, _ in members)
+            continue
+        
+        total_pages = split_result["total_pages"]
+        files = dict(split_result["files"])
+        for index, item_ranges in members:
+            item_files = split_result["files"]
+            if isinstance(item_ranges, str):
+                range_strs = [f"{start}-{end}" for start, end in parse_range_input(item_ranges, total_pages)]
+                if not range_strs:
+                    error = HTTPException(status_code=400, detail="No valid page ranges specified.")
+                    entries[index] = failed_entry(index, url, error)
+                    continue
+                item_files = [(range_str, files[range_str]) for range_str in range_strs]
+            payload = build_split_payload({"total_pages": total_pages, "files": item_files})
+            del payload["message"]
+            entries[index] = {"index": index, "url": url, "status": JOB_DONE, **payload}
+    return entries
+
+async def split_batch(specs, invalid, on_progress=None):
+    """Split every item of a batch; sources are fetched concurrently and each URL only once.
+    
+    specs are (index, url, ranges, optimize) tuples of the valid items and
+    invalid maps the index of every other item to its manifest entry.
+    At most BATCH_DOWNLOADS downloads and one split per worker run at a time.
+    """
+    downloads = asyncio.Semaphore(BATCH_DOWNLOADS)
+    splits = asyncio.Semaphore(split_pool.max_workers)
+    sources = {}
+    for index, url, ranges, optimize in specs:
+        sources.setdefault(url, []).append((index, ranges, optimize))
+    
+    async def run_source(url, source_specs):
+        entries = await split_batch_source(url, source_specs, downloads, splits)
+        if on_progress:
+            on_progress({"event": "source_done", "url": url, "items": len(source_specs),
+                         "failed": sum(entry["status"] == JOB_FAILED for entry in entries.values())})
+        return entries
+    
+    entries = dict(invalid)
+    for source_entries in await asyncio.gather(*(run_source(url, source_specs) for url, source_specs in sources.items())):
+        entries.update(source_entries)
+    return {"sources": len(sources), "items": [entries[index] for index in sorted(entries)]}
+
+def build_batch_manifest(batch_result):
+    """Build the JSON manifest describing a finished batch."""
+    done = sum(entry["status"] == JOB_DONE for entry in batch_result["items"])
+    return {
+        "message": f"Split {done} of {len(batch_result['items'])} items from {batch_result['sources']} sources.",
+        **batch_result
+    }
+
+async def stream_split_response(source_path, ranges, response_format, optimize=False):
+    """Split on the worker pool and stream every part back as one ZIP or multipart/mixed body.
+    
+    The worker spools the parts to a directory of this request, and each one
+    is sent in CHUNK_SIZE pieces and deleted once sent, so neither process
+    holds a whole part in memory.
+    """
+    start_time_budget()
+    await preflight(source_path, ranges)
+    
+    spool_dir = tempfile.mkdtemp(prefix=STREAM_SPOOL_PREFIX, dir=TEMP_DIR)
+    events = asyncio.Queue()
+    task = asyncio.create_task(run_split(
+        source_path, ranges, events.put_nowait, worker=stream_pdf_parts, spool_dir=spool_dir, optimize=optimize
+    ))
+    # run_with_progress has delivered every event by the time the task is done
+    task.add_done_callback(lambda _: events.put_nowait(None))
+    
+    def cleanup():
+        # Synchronous, so a cancelled response cannot interrupt it; safe to call more than once
+        task.cancel()
+        remove_stream_spool(spool_dir)
+    
+    # Wait for the parse so a bad PDF or range still gets a normal error response
+    try:
+        first_event = await events.get()
+        if first_event is None:
+            task.result()
+    except BaseException:
+        cleanup()
+        raise
+    
+    async def parts():
+        while True:
+            event = await events.get()
+            if event is None:
+                # Raises if the worker failed half way, which aborts the response
+                task.result()
+                return
+            if event["event"] == "part":
+                yield f"split_{event['range']}.pdf", event["path"], event["bytes"]
+    
+    async def read_part(path):
+        with open(path, "rb") as part_file:
+            while True:
+                chunk = await run_in_threadpool(part_file.read, CHUNK_SIZE)
+                if not chunk:
+                    break
+                yield chunk
+        os.remove(path)
+    
+    headers = {"X-Total-Pages": str(first_event["total_pages"])}
+    
+    # The spool goes with the response: when the body ends, fails or is abandoned by a client that
+    # went away, and as a background task, which also runs when the body was never started
+    if response_format == "zip":
+        async def body():
+            try:
+                writer = ZipStreamWriter()
+                async for filename, path, size in parts():
+                    yield writer.begin(filename, size)
+                    async for chunk in read_part(path):
+                        yield writer.write(chunk)
+                    yield writer.end()
+                yield writer.close()
+            finally:
+                cleanup()
+        
+        headers["Content-Disposition"] = 'attachment; filename="split.zip"'
+        return StreamingResponse(body(), media_type="application/zip", headers=headers, background=BackgroundTask(cleanup))
+    
+    boundary = uuid.uuid4().hex
+    
+    async def body():
+        try:
+            async for filename, path, size in parts():
+                yield multipart_part_header(boundary, filename, size)
+                async for chunk in read_part(path):
+                    yield chunk
+                yield MULTIPART_PART_END
+            yield multipart_end(boundary)
+        finally:
+            cleanup()
+    
+    return StreamingResponse(body(), media_type=f"multipart/mixed; boundary={boundary}", headers=headers,
+                             background=BackgroundTask(cleanup))
+
+async def run_split_job(job_id, split_source, *args, build_payload=build_split_payload, **kwargs):
+    """Run a split in the background, recording progress and outcome in the job store.
+    
+    Every stage event is also published to job_events for /jobs/{job_id}/events.
+    The job's result is build_payload of what split_source returned.
+    """
+    job = await run_in_threadpool(job_store.get, job_id)
+    progress = job["progress"]
+    await run_in_threadpool(job_store.update, job_id, status=JOB_RUNNING)
+    
+    # Events reach this process's followers at once; the job store, which followers in
+    # other processes poll, gets at most one progress write per JOB_PROGRESS_INTERVAL
+    saving = None
+    last_saved = time.monotonic()
+    
+    def on_progress(event):
+        nonlocal saving, last_saved
+        if event["event"] == "download":
+            progress["bytes_downloaded"] = event["bytes"]
+        elif event["event"] == "parsed":
+            progress["total_pages"] = event["total_pages"]
+            progress["ranges_total"] = event["ranges_total"]
+        elif event["event"] == "range_saved":
+            progress["ranges_completed"] += 1
+            progress["pages_written"] += event["pages"]
+            progress["bytes_written"] += event["bytes"]
+        job_events.publish(job_id, event)
+        
+        now = time.monotonic()
+        if (saving is None or saving.done()) and now - last_saved >= JOB_PROGRESS_INTERVAL:
+            last_saved = now
+            saving = asyncio.ensure_future(run_in_threadpool(job_store.update, job_id, progress=dict(progress)))
+    
+    try:
+        split_result = await split_source(*args, on_progress=on_progress, **kwargs)
+    except HTTPException as e:
+        error = {"status_code": e.status_code, "detail": e.detail}
+    except Exception as e:
+        error = {"status_code": 500, "detail": f"Error splitting PDF: {str(e)}"}
+    else:
+        error = None
+    
+    # The final state, with the latest progress, must land after any progress write still going
+    if saving is not None:
+        await asyncio.gather(saving, return_exceptions=True)
+    if error is None:
+        payload = build_payload(split_result)
+        await run_in_threadpool(job_store.update, job_id, status=JOB_DONE, progress=progress, result=payload)
+        job_events.publish(job_id, {"event": "finished", "result": payload})
+    else:
+        await run_in_threadpool(job_store.update, job_id, status=JOB_FAILED, progress=progress, error=error)
+        job_events.publish(job_id, {"event": "failed", "error": error})
+
+def check_response_format(response_format, job):
+    """Reject unknown response formats, and streaming formats in job mode."""
+    if response_format not in RESPONSE_FORMATS:
+        raise HTTPException(status_code=400, detail=f"response_format must be one of: {', '.join(RESPONSE_FORMATS)}.")
+    if job and response_format != "json":
+        raise HTTPException(status_code=400, detail="Job mode only supports response_format=json.")
+
+def check_profile(profile, request, response_format):
+    """Return the profiler a request asked for, or None; only allowed with the admin token or PROFILE_REQUESTS."""
+    if not profile:
+        return None
+    if profile not in PROFILERS:
+        raise HTTPException(status_code=400, detail=f"profile must be one of: {', '.join(PROFILERS)}.")
+    if response_format != "json":
+        raise HTTPException(status_code=400, detail="Profiling only supports response_format=json.")
+    
+    token = request.headers.get("x-profile-token", "")
+    if not PROFILE_REQUESTS and not (PROFILE_TOKEN and hmac.compare_digest(token, PROFILE_TOKEN)):
+        raise HTTPException(status_code=403, detail="Profiling is not enabled for this request.")
+    return profile
+
+async def start_split_job(kind, split_source, *args, **kwargs):
+    """Create a job for split_source(*args, **kwargs), start it and return the 202 response."""
+    job = await run_in_threadpool(job_store.create, kind)
+    job_events.open(job["job_id"])
+    task = asyncio.create_task(run_split_job(job["job_id"], split_source, *args, **kwargs))
+    job_tasks.add(task)
+    task.add_done_callback(job_tasks.discard)
+    
+    return JSONResponse(status_code=202, content={
+        "job_id": job["job_id"],
+        "status": job["status"],
+        "status_url": f"{BASE_URL}/jobs/{job['job_id']}",
+        "result_url": f"{BASE_URL}/jobs/{job['job_id']}/result",
+        "events_url": f"{BASE_URL}/jobs/{job['job_id']}/events"
     })
 
+async def reap_periodically():
+    """Single background task that deletes expired files every CLEANUP_INTERVAL seconds."""
+    while True:
+        await asyncio.sleep(CLEANUP_INTERVAL)
+        try:
+            await run_in_threadpool(cleanup_old_files)
+        except Exception:
+            logger.exception("Error cleaning up old files")
+        job_events.purge(MAX_FILE_AGE)
+
+def upload_too_large_error():
+    return HTTPException(status_code=413, detail=f"The uploaded file is larger than the {MAX_UPLOAD_BYTES} byte limit.")
+
+async def store_request_body(request):
+    """Stream the request body into the source cache and return the blob path."""
+    partial = source_cache.new_partial()
+    spool = PdfSpool(MAX_UPLOAD_BYTES, source_name="The uploaded file", file=partial)
+    try:
+        async for chunk in request.stream():
+            await run_in_threadpool(spool.write, chunk)
+        upload = spool.finish()
+    except DownloadError as e:
+        spool.close()
+        os.unlink(partial.name)
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    except BaseException:
+        spool.close()
+        os.unlink(partial.name)
+        raise
+    
+    partial.close()
+    input_bytes.inc(upload.size, "upload")
+    return await run_in_threadpool(source_cache.commit, partial.name, upload.sha256, upload.size)
+
+async def respond_with_split(kind, source_path, ranges, job, response_format, optimize=False, profile=None):
+    """Split a cached source the way the request asked: as a job, streamed, or as JSON."""
+    if job:
+        return await start_split_job(kind, split_source, source_path, ranges, optimize=optimize, profile=profile)
+    
+    if response_format != "json":
+        return await stream_split_response(source_path, ranges, response_format, optimize)
+    
+    split_result = await split_source(source_path, ranges, optimize=optimize, profile=profile)
+    
+    return JSONResponse(content=build_split_payload(split_result))
+
+@app.on_event("startup")
+async def startup_event():
+    global reaper_task
+    
+    # Create temp directory if it doesn't exist
+    os.makedirs(TEMP_DIR, exist_ok=True)
+    
+    # Index the files already in the artifact store in one pass, then clean up any old files
+    expiry_index.rebuild()
+    cleanup_old_files()
+    reaper_task = asyncio.create_task(reap_periodically())
+    
+    # Start the split workers
+    split_pool.start()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    if reaper_task:
+        reaper_task.cancel()
+    split_pool.shutdown()
+    await http_fetcher.aclose()
+
+@app.get("/")
+async def root():
+    return {"message": "PDF Splitter API is running. Use /docs for API documentation."}
+
+@app.post("/split-pdf-url/")
+async def split_pdf_url(
+    request: Request,
+    url: str = Form(...),
+    ranges: str = Form(None),
+    split_by: str = Form("ranges"),
+    pages_per_part: int = Form(None),
+    target_bytes: int = Form(None),
+    job: bool = Form(False),
+    response_format: str = Form("json"),
+    optimize: bool = Form(False),
+    image_dpi: int = Form(None),
+    image_quality: int = Form(None),
+    profile: str = Form(None)
+):
+    """Split a PDF from a URL by page ranges.
+    
+    With job=true the split runs in the background and a job id is returned right away.
+    With response_format=zip or multipart every part is streamed back in the response.
+    With optimize=true unused objects are dropped, identical ones stored once per part and
+    streams compressed; image_dpi and image_quality also downsample images sharper than
+    image_dpi and re-encode them as JPEG, and imply optimize.
+    split_by=pages, bookmarks or size splits into pages_per_part-page chunks, one part per
+    top-level bookmark, or parts of about target_bytes instead of using ranges.
+    With profile=cprofile or sampling (admin only) the split is profiled and the
+    response gets a summary of where the time went plus a link to the raw profile.
+    """
+    check_response_format(response_format, job)
+    ranges = parse_split_options(split_by, ranges, pages_per_part, target_bytes)
+    optimize = parse_output_profile(optimize, image_dpi, image_quality)
+    profile = check_profile(profile, request, response_format)
+    
+    # Refuse early instead of downloading a file we have no worker for
+    if split_pool.is_full:
+        raise pool_busy_error()
+    
+    if job:
+        return await start_split_job("url", split_url_source, url, ranges, optimize=optimize, profile=profile)
+    
+    if response_format != "json":
+        source_path = await fetch_url_source(url)
+        return await stream_split_response(source_path, ranges, response_format, optimize)
+    
+    split_result = await split_url_source(url, ranges, optimize=optimize, profile=profile)
+    
+    return JSONResponse(content=build_split_payload(split_result))
+
 @app.post("/split-pdf-upload/")
 async def split_pdf_upload(
+    request: Request,
     file: UploadFile = File(...),
-    ranges: str = Form(...),
-    background_tasks: BackgroundTasks = None
+    ranges: str = Form(None),
+    split_by: str = Form("ranges"),
+    pages_per_part: int = Form(None),
+    target_bytes: int = Form(None),
+    job: bool = Form(False),
+    response_format: str = Form("json"),
+    optimize: bool = Form(False),
+    image_dpi: int = Form(None),
+    image_quality: int = Form(None),
+    profile: str = Form(None)
 ):
-    """Split an uploaded PDF by page ranges."""
-    # Clean up old files
-    cleanup_old_files()
+    """Split an uploaded PDF by page ranges.
+    
+    With job=true the split runs in the background and a job id is returned right away.
+    With response_format=zip or multipart every part is streamed back in the response.
+    With optimize=true unused objects are dropped, identical ones stored once per part and
+    streams compressed; image_dpi and image_quality also downsample images sharper than
+    image_dpi and re-encode them as JPEG, and imply optimize.
+    split_by=pages, bookmarks or size splits into pages_per_part-page chunks, one part per
+    top-level bookmark, or parts of about target_bytes instead of using ranges.
+    With profile=cprofile or sampling (admin only) the split is profiled and the
+    response gets a summary of where the time went plus a link to the raw profile.
+    """
+    check_response_format(response_format, job)
+    ranges = parse_split_options(split_by, ranges, pages_per_part, target_bytes)
+    optimize = parse_output_profile(optimize, image_dpi, image_quality)
+    profile = check_profile(profile, request, response_format)
     
     # Verify the file is a PDF
     if not file.content_type or "application/pdf" not in file.content_type.lower():
         raise HTTPException(status_code=400, detail="Uploaded file is not a PDF.")
+    if MAX_UPLOAD_BYTES and file.size and file.size > MAX_UPLOAD_BYTES:
+        raise upload_too_large_error()
     
-    # Save uploaded file to temp location
-    temp_file_path = os.path.join(TEMP_DIR, f"upload_{uuid.uuid4().hex}.pdf")
-    with open(temp_file_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
+    if split_pool.is_full:
+        raise pool_busy_error()
     
-    # Get total pages
-    try:
-        pdf_reader = PyPDF2.PdfReader(temp_file_path)
-        total_pages = len(pdf_reader.pages)
-    except Exception as e:
-        # Clean up the temporary file
-        if os.path.exists(temp_file_path):
-            os.unlink(temp_file_path)
-        raise HTTPException(status_code=400, detail=f"Error reading PDF: {str(e)}")
+    # Save uploaded file to the source cache, where identical uploads share one copy
+    with stage_timer.time("receive"):
+        source_path = await run_in_threadpool(source_cache.add_stream, file.file)
+    input_bytes.inc(os.path.getsize(source_path), "upload")
     
-    # Parse ranges
-    range_tuples = parse_range_input(ranges, total_pages)
-    if not range_tuples:
-        # Clean up the temporary file
-        if os.path.exists(temp_file_path):
-            os.unlink(temp_file_path)
-        raise HTTPException(status_code=400, detail="No valid page ranges specified.")
+    return await respond_with_split("upload", source_path, ranges, job, response_format, optimize, profile)
+
+@app.post("/split-pdf-upload-raw/")
+async def split_pdf_upload_raw(
+    request: Request,
+    ranges: str = None,
+    split_by: str = "ranges",
+    pages_per_part: int = None,
+    target_bytes: int = None,
+    job: bool = False,
+    response_format: str = "json",
+    optimize: bool = False,
+    image_dpi: int = None,
+    image_quality: int = None,
+    profile: str = None
+):
+    """Split a PDF sent as the raw request body (Content-Type: application/pdf).
     
-    # Split the PDF
-    try:
-        output_pdfs = split_pdf(temp_file_path, range_tuples)
-    except Exception as e:
-        # Clean up the temporary file
-        if os.path.exists(temp_file_path):
-            os.unlink(temp_file_path)
-        raise HTTPException(status_code=500, detail=f"Error splitting PDF: {str(e)}")
+    The body goes straight into the source cache as it arrives, without multipart
+    parsing. Options are query parameters with the same meaning as for /split-pdf-upload/.
+    """
+    check_response_format(response_format, job)
+    ranges = parse_split_options(split_by, ranges, pages_per_part, target_bytes)
+    optimize = parse_output_profile(optimize, image_dpi, image_quality)
+    profile = check_profile(profile, request, response_format)
     
-    # Clean up the temporary uploaded file
-    if os.path.exists(temp_file_path):
-        os.unlink(temp_file_path)
+    content_type = request.headers.get("content-type", "")
+    if "application/pdf" not in content_type.lower():
+        raise HTTPException(status_code=400, detail="Request body is not a PDF.")
+    # Refuse a body that says it is too large before reading any of it
+    content_length = request.headers.get("content-length", "")
+    if MAX_UPLOAD_BYTES and content_length.isdigit() and int(content_length) > MAX_UPLOAD_BYTES:
+        raise upload_too_large_error()
     
-    # Save each split PDF and collect download URLs
-    result_files = []
+    if split_pool.is_full:
+        raise pool_busy_error()
     
-    for i, pdf_writer in enumerate(output_pdfs):
-        range_str = f"{range_tuples[i][0]}-{range_tuples[i][1]}"
-        output_path = save_pdf_to_temp(pdf_writer, range_str)
-        filename = os.path.basename(output_path)
-        
-        # Add file to result
-        result_files.append({
-            "range": range_str,
-            "download_url": f"{BASE_URL}/download/{filename}",
-            "filename": f"split_{range_str}.pdf"
-        })
+    with stage_timer.time("receive"):
+        source_path = await store_request_body(request)
+    
+    return await respond_with_split("upload", source_path, ranges, job, response_format, optimize, profile)
+
+class BatchItem(BaseModel):
+    url: str
+    ranges: Optional[str] = None
+    split_by: str = "ranges"
+    pages_per_part: Optional[int] = None
+    target_bytes: Optional[int] = None
+    optimize: bool = False
+    image_dpi: Optional[int] = None
+    image_quality: Optional[int] = None
+
+class BatchRequest(BaseModel):
+    items: List[BatchItem]
+    job: bool = False
+
+@app.post("/split-batch/")
+async def split_pdf_batch(batch: BatchRequest):
+    """Split many PDFs from URLs, each by its own ranges, and return one manifest.
     
-    # Schedule cleanup of temporary files
-    if background_tasks:
-        background_tasks.add_task(cleanup_old_files)
+    Each item takes the same url, ranges, split_by, pages_per_part, target_bytes,
+    optimize, image_dpi and image_quality fields as /split-pdf-url/. Sources are downloaded concurrently
+    and a URL that appears in several items is downloaded and parsed once.
+    Items fail on their own: the manifest lists files or an error per item,
+    in request order. With job=true the batch runs in the background.
+    """
+    if not batch.items:
+        raise HTTPException(status_code=400, detail="items must not be empty.")
+    if len(batch.items) > BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"A batch holds at most {BATCH_MAX_ITEMS} items.")
     
-    return JSONResponse(content={
-        "message": f"Successfully split PDF into {len(output_pdfs)} files.",
-        "total_pages": total_pages,
-        "files": result_files
+    specs = []
+    invalid = {}
+    for index, item in enumerate(batch.items):
+        try:
+            ranges = parse_split_options(item.split_by, item.ranges, item.pages_per_part, item.target_bytes)
+            optimize = parse_output_profile(item.optimize, item.image_dpi, item.image_quality)
+        except HTTPException as e:
+            invalid[index] = failed_entry(index, item.url, e)
+            continue
+        specs.append((index, item.url, ranges, optimize))
+    
+    if split_pool.is_full:
+        raise pool_busy_error()
+    
+    if batch.job:
+        return await start_split_job("batch", split_batch, specs, invalid, build_payload=build_batch_manifest)
+    
+    batch_result = await split_batch(specs, invalid)
+    
+    return JSONResponse(content=build_batch_manifest(batch_result))
+
+@app.get("/cache/stats")
+async def cache_stats():
+    """Hit and miss counters of the source and result caches."""
+    return {
+        "source_cache": await run_in_threadpool(source_cache.get_stats),
+        "result_cache": result_cache.get_stats()
+    }
+
+@app.get("/metrics")
+async def get_metrics():
+    """Stage latencies, bytes, pages, jobs, output directory and cache metrics in the Prometheus text format."""
+    # Gauges take locks that threadpool work holds too (cache stats, expiry index), so render off the event loop
+    body = await run_in_threadpool(metrics.render)
+    return PlainTextResponse(body, media_type="text/plain; version=0.0.4")
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Report the status and progress of a split job, with its result once done."""
+    job = await run_in_threadpool(job_store.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found or expired.")
+    
+    return JSONResponse(content=job)
+
+async def poll_job_events(job_id):
+    """Progress snapshots read from the job store, for jobs started by another worker process."""
+    last_progress = None
+    while True:
+        job = await run_in_threadpool(job_store.get, job_id)
+        if job is None:
+            return
+        if job["progress"] != last_progress:
+            last_progress = job["progress"]
+            yield {"event": "progress", "status": job["status"], "progress": last_progress}
+        if job["status"] == JOB_DONE:
+            yield {"event": "finished", "result": job["result"]}
+            return
+        if job["status"] == JOB_FAILED:
+            yield {"event": "failed", "error": job["error"]}
+            return
+        await asyncio.sleep(JOB_POLL_INTERVAL)
+
+async def job_event_stream(job_id):
+    if job_id in job_events:
+        events = job_events.follow(job_id, SSE_KEEPALIVE)
+    else:
+        events = poll_job_events(job_id)
+    async for event in events:
+        yield format_sse(event)
+
+@app.get("/jobs/{job_id}/events")
+async def get_job_events(job_id: str):
+    """Stream a job's progress as Server-Sent Events until it finishes or fails."""
+    if job_id not in job_events and await run_in_threadpool(job_store.get, job_id) is None:
+        raise HTTPException(status_code=404, detail="Job not found or expired.")
+    
+    return StreamingResponse(job_event_stream(job_id), media_type="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        # Stop nginx from buffering the stream until the job ends
+        "X-Accel-Buffering": "no",
     })
 
+@app.get("/jobs/{job_id}/result")
+async def get_job_result(job_id: str):
+    """Return the same payload as a synchronous split once the job is done."""
+    job = await run_in_threadpool(job_store.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found or expired.")
+    
+    if job["status"] == JOB_FAILED:
+        raise HTTPException(status_code=job["error"]["status_code"], detail=job["error"]["detail"])
+    
+    if job["status"] != JOB_DONE:
+        return JSONResponse(status_code=202, content={
+            "job_id": job_id,
+            "status": job["status"],
+            "progress": job["progress"]
+        })
+    
+    return JSONResponse(content=job["result"])
+
 @app.get("/download/{filename}")
-async def download_file(filename: str):
-    """Download a previously split PDF file."""
-    file_path = os.path.join(TEMP_DIR, filename)
+async def download_file(filename: str, request: Request):
+    """Download a previously split PDF file.
     
-    if not os.path.exists(file_path):
+    Supports Range / If-Range, conditional GETs against a content ETag, and
+    handing the body to the reverse proxy with X-Accel-Redirect or X-Sendfile.
+    With the s3 artifact store this redirects to a presigned URL instead, and
+    the bucket serves the body.
+    """
+    if os.path.basename(filename) != filename or filename.startswith(PARTIAL_PREFIX):
+        raise HTTPException(status_code=404, detail="File not found or expired.")
+    file_path = artifact_store.path(filename)
+    if file_path is not None and not os.path.isfile(file_path):
         raise HTTPException(status_code=404, detail="File not found or expired.")
     
     # Get the original range from the filename to use as the download name
+    media_type = "application/pdf"
+    if filename.startswith("profile_"):
+        download_name = filename
+        media_type = "application/octet-stream"
+    else:
+        try:
+            range_part = filename.split('_')[1]  # Extract the range part (e.g., "1-5")
+            download_name = f"split_{range_part}.pdf"
+        except:
+            download_name = f"split_pdf.pdf"
+    
+    if file_path is None:
+        try:
+            mtime = await run_in_threadpool(artifact_store.mtime, filename)
+        except FileNotFoundError:
+            raise HTTPException(status_code=404, detail="File not found or expired.")
+        # The link lives as long as the file; the redirect itself must not be cached
+        url = artifact_store.download_url(filename, download_name, mtime + MAX_FILE_AGE - time.time())
+        return RedirectResponse(url, status_code=307, headers={"Cache-Control": "no-store"})
+    
+    # Hashing for the ETag reads the file the first time, so keep it off the event loop
     try:
-        range_part = filename.split('_')[1]  # Extract the range part (e.g., "1-5")
-        download_name = f"split_{range_part}.pdf"
-    except:
-        download_name = f"split_pdf.pdf"
-    
-    return FileResponse(
-        path=file_path, 
-        filename=download_name,
-        media_type="application/pdf"
-    )
+        return await run_in_threadpool(
+            file_download_response, request, file_path, download_name, MAX_FILE_AGE,
+            DOWNLOAD_OFFLOAD, DOWNLOAD_OFFLOAD_PREFIX, media_type
+        )
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="File not found or expired.")
 
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
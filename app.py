@@ -1,14 +1,14 @@
 import streamlit as st
-import PyPDF2
 import io
 import base64
-import requests
 import tempfile
 import os
 import re
-import gdown
 import uuid
 import time
+from pdf_utils import split_pdf
+from pdf_backends import open_document, resolve_backend
+from fetch import stream_pdf, stream_gdrive_pdf, DownloadError
 
 # Tạo thư mục tạm thời để lưu trữ các file đã chia
 TEMP_DIR = os.path.join(tempfile.gettempdir(), "pdf_splitter")
@@ -17,6 +17,12 @@ os.makedirs(TEMP_DIR, exist_ok=True)
 # Thời gian hết hạn cho các file tạm (1 giờ)
 MAX_FILE_AGE = 3600
 
+# Kích thước tối đa của file PDF tải từ URL (200 MB)
+MAX_DOWNLOAD_BYTES = 200 * 1024 * 1024
+
+# Thư viện đọc/ghi PDF: pypdf2 (mặc định), pikepdf hoặc pymupdf nếu đã cài
+PDF_BACKEND = resolve_backend(os.environ.get("PDF_BACKEND", "pypdf2"))
+
 def cleanup_old_files():
     """Xóa các file tạm thời cũ hơn MAX_FILE_AGE"""
     current_time = time.time()
@@ -25,103 +31,60 @@ def cleanup_old_files():
         if os.path.isfile(file_path) and (current_time - os.path.getmtime(file_path)) > MAX_FILE_AGE:
             os.remove(file_path)
 
-def download_file_from_url(url):
+def show_progress(event, bar):
+    """Cập nhật thanh tiến trình từ một sự kiện tải file hoặc tách trang."""
+    if event["event"] == "download":
+        if event.get("total"):
+            bar.progress(min(event["bytes"] / event["total"], 1.0),
+                         text=f"Đã tải {event['bytes'] // 1024} / {event['total'] // 1024} KB")
+        else:
+            bar.progress(0.0, text=f"Đã tải {event['bytes'] // 1024} KB")
+    elif event["event"] == "range_split":
+        bar.progress(event["index"] / event["ranges_total"],
+                     text=f"Đã tách {event['index']} / {event['ranges_total']} khoảng (trang {event['range']})")
+
+def progress_hook(text):
+    """Tạo thanh tiến trình mới và trả về hàm nhận sự kiện để cập nhật nó."""
+    bar = st.progress(0.0, text=text)
+    return lambda event: show_progress(event, bar)
+
+def download_file_from_url(url, progress=None):
     """Download file from a given URL.
     
     Args:
         url: URL to download from
+        progress: Optional callable, given "download" event dicts as bytes arrive
         
     Returns:
-        BytesIO object containing the file data
+        Spooled temp file containing the file data
     """
     # Check if it's a Google Drive link
     if "drive.google.com" in url:
-        return download_from_gdrive(url)
+        return download_from_gdrive(url, progress)
     
-    # Regular HTTP URL
+    # Regular HTTP URL, tải theo từng phần và dừng sớm nếu không phải PDF hoặc quá lớn
     try:
-        # Thêm User-Agent để giả lập trình duyệt
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.114 Safari/537.36',
-        }
-        
-        response = requests.get(url, headers=headers, stream=True)
-        response.raise_for_status()
-        
-        content_type = response.headers.get('content-type', '')
-        if 'application/pdf' not in content_type.lower():
-            st.warning(f"Cảnh báo: URL có thể không phải là file PDF (Content-Type: {content_type})")
-        
-        return io.BytesIO(response.content)
-    except Exception as e:
+        return stream_pdf(url, MAX_DOWNLOAD_BYTES, progress=progress)
+    except DownloadError as e:
         st.error(f"Lỗi khi tải file: {str(e)}")
         return None
 
-def download_from_gdrive(url):
+def download_from_gdrive(url, progress=None):
     """Download a file from Google Drive.
     
     Args:
         url: Google Drive URL
+        progress: Optional callable, given "download" event dicts as bytes arrive
         
     Returns:
-        BytesIO object containing the file data
+        Spooled temp file containing the file data
     """
     try:
-        # Create a temporary file
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf') as temp_file:
-            temp_path = temp_file.name
-        
-        # Use gdown to download the file
-        gdown.download(url=url, output=temp_path, quiet=True, fuzzy=True)
-        
-        # Read the file into BytesIO
-        with open(temp_path, 'rb') as f:
-            file_data = io.BytesIO(f.read())
-        
-        # Clean up the temporary file
-        os.unlink(temp_path)
-        
-        return file_data
-    except Exception as e:
+        return stream_gdrive_pdf(url, MAX_DOWNLOAD_BYTES, progress=progress)
+    except DownloadError as e:
         st.error(f"Lỗi khi tải từ Google Drive: {str(e)}")
         return None
 
-def split_pdf(input_pdf, ranges):
-    """Split a PDF file based on the provided page ranges.
-    
-    Args:
-        input_pdf: The input PDF file (binary)
-        ranges: A list of tuples containing (start_page, end_page)
-        
-    Returns:
-        A list of PDF writer objects
-    """
-    pdf_reader = PyPDF2.PdfReader(input_pdf)
-    total_pages = len(pdf_reader.pages)
-    
-    # Create a list to store all the split PDFs
-    output_pdfs = []
-    
-    for page_range in ranges:
-        start_page, end_page = page_range
-        
-        # Adjust for zero-based indexing and ensure within bounds
-        start_idx = max(0, start_page - 1)
-        end_idx = min(end_page, total_pages)
-        
-        if start_idx < total_pages and start_idx <= end_idx:
-            # Create a PDF writer for this range
-            pdf_writer = PyPDF2.PdfWriter()
-            
-            # Add the specified pages
-            for page_num in range(start_idx, end_idx):
-                pdf_writer.add_page(pdf_reader.pages[page_num])
-            
-            # Add to our list of output PDFs
-            output_pdfs.append(pdf_writer)
-    
-    return output_pdfs
-
 def parse_range_input(range_input, max_pages):
     """Parse the range input string and convert to list of tuples.
     
@@ -190,18 +153,14 @@ def api_split_url(url, ranges_str):
         Dict chứa thông tin về các file đã tách
     """
     # Tải file từ URL
-    with st.spinner("Đang tải file..."):
-        pdf_data = download_file_from_url(url)
-        if pdf_data is None:
-            return {"error": "Không thể tải PDF từ URL đã cung cấp"}
+    pdf_data = download_file_from_url(url, progress_hook("Đang tải file..."))
+    if pdf_data is None:
+        return {"error": "Không thể tải PDF từ URL đã cung cấp"}
     
-    # Đọc PDF để lấy tổng số trang
+    # Đọc PDF một lần để lấy tổng số trang, dùng lại khi tách
     try:
-        pdf_reader = PyPDF2.PdfReader(pdf_data)
-        total_pages = len(pdf_reader.pages)
-        
-        # Reset con trỏ file
-        pdf_data.seek(0)
+        document = open_document(pdf_data, PDF_BACKEND)
+        total_pages = document.total_pages
     except Exception as e:
         return {"error": f"Lỗi khi đọc PDF: {str(e)}"}
     
@@ -212,7 +171,7 @@ def api_split_url(url, ranges_str):
     
     # Tách PDF
     try:
-        output_pdfs = split_pdf(pdf_data, ranges)
+        output_pdfs = split_pdf(document, ranges, progress_hook("Đang tách PDF..."))
     except Exception as e:
         return {"error": f"Lỗi khi tách PDF: {str(e)}"}
     
@@ -258,13 +217,11 @@ def main():
         if uploaded_file is not None:
             # Đọc PDF để lấy tổng số trang
             try:
-                pdf_reader = PyPDF2.PdfReader(uploaded_file)
-                total_pages = len(pdf_reader.pages)
+                # Đọc PDF một lần, dùng lại khi tách
+                document = open_document(uploaded_file, PDF_BACKEND)
+                total_pages = document.total_pages
                 st.success(f"Tải lên thành công! PDF có {total_pages} trang.")
                 
-                # Reset con trỏ file
-                uploaded_file.seek(0)
-                
                 # Nhập khoảng trang
                 range_input = st.text_input(
                     "Nhập khoảng trang (ví dụ: 1-5,8-10,15-20):",
@@ -279,7 +236,7 @@ def main():
                             
                             if ranges:
                                 # Tách PDF
-                                output_pdfs = split_pdf(uploaded_file, ranges)
+                                output_pdfs = split_pdf(document, ranges, progress_hook("Đang tách PDF..."))
                                 
                                 if output_pdfs:
                                     st.success(f"Đã tách PDF thành {len(output_pdfs)} file!")
@@ -317,12 +274,12 @@ def main():
         
         if fetch_pdf and url:
             with st.spinner("Đang tải file..."):
-                pdf_data = download_file_from_url(url)
+                pdf_data = download_file_from_url(url, progress_hook("Đang tải file..."))
                 if pdf_data:
                     # Đọc PDF để lấy tổng số trang
                     try:
-                        pdf_reader = PyPDF2.PdfReader(pdf_data)
-                        total_pages = len(pdf_reader.pages)
+                        document = open_document(pdf_data, PDF_BACKEND)
+                        total_pages = document.total_pages
                         st.session_state.pdf_data = pdf_data
                         st.session_state.total_pages = total_pages
                         st.success(f"Tải file thành công! PDF có {total_pages} trang.")
@@ -341,7 +298,7 @@ def main():
                                     
                                     if ranges:
                                         # Tách PDF
-                                        output_pdfs = split_pdf(pdf_data, ranges)
+                                        output_pdfs = split_pdf(document, ranges, progress_hook("Đang tách PDF..."))
                                         
                                         if output_pdfs:
                                             st.success(f"Đã tách PDF thành {len(output_pdfs)} file!")
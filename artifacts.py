@@ -0,0 +1,306 @@
+import contextlib
+import io
+import os
+import shutil
+import uuid
+
+try:
+    import boto3
+    from botocore.exceptions import ClientError
+except ImportError:  # optional: pip install boto3
+    boto3 = None
+
+# S3 multipart parts must be at least 5 MiB, except the last one
+S3_PART_SIZE = 8 * 1024 * 1024
+
+# Names of files a SharedArtifactStore is still writing
+PARTIAL_PREFIX = ".partial_"
+
+ARTIFACT_STORES = ("local", "shared", "s3")
+
+
+def media_type(name):
+    return "application/pdf" if name.endswith(".pdf") else "application/octet-stream"
+
+
+class ArtifactWriter:
+    """File-like writer for one artifact in a directory store.
+
+    Leaving the with block normally finishes the artifact; an exception
+    removes what was written, so a failed part is never served. With a
+    temp_path the bytes go there first and are renamed into place at the end.
+    """
+
+    def __init__(self, path, temp_path=None):
+        self.path = path
+        self.temp_path = temp_path or path
+        self.file = open(self.temp_path, "wb")
+
+    def write(self, data):
+        return self.file.write(data)
+
+    def tell(self):
+        return self.file.tell()
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        return self.file.seek(offset, whence)
+
+    def flush(self):
+        self.file.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.abort()
+        else:
+            self.close()
+
+    def close(self):
+        if self.temp_path != self.path:
+            # Other instances read the file as soon as it has its name
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            self.file.close()
+            os.replace(self.temp_path, self.path)
+        else:
+            self.file.close()
+
+    def abort(self):
+        self.file.close()
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(self.temp_path)
+
+
+class LocalArtifactStore:
+    """Split outputs in a directory of this machine, served by /download/ from disk.
+
+    Only the instance that wrote a file can serve it, so this fits a single
+    server (any number of uvicorn workers on it share the directory).
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, name):
+        """Local path of an artifact, for serving it from disk."""
+        return os.path.join(self.directory, name)
+
+    def open(self, name):
+        """An ArtifactWriter for a new artifact; use it as a context manager."""
+        return ArtifactWriter(self.path(name))
+
+    def save_file(self, local_path, name):
+        """Move a finished local file into the store as name."""
+        shutil.move(local_path, self.path(name))
+
+    def size(self, name):
+        return os.path.getsize(self.path(name))
+
+    def mtime(self, name):
+        """Last write or touch of an artifact; raises FileNotFoundError if it is gone."""
+        return os.stat(self.path(name)).st_mtime
+
+    def touch(self, name, when):
+        """Mark an artifact as used at when, so it outlives the expiry of its first write."""
+        os.utime(self.path(name), (when, when))
+
+    def delete(self, name):
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(self.path(name))
+
+    def list(self):
+        """(name, mtime, size) of every artifact, including partial files left behind by a crash."""
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if entry.is_file():
+                    stat_result = entry.stat()
+                    yield entry.name, stat_result.st_mtime, stat_result.st_size
+
+
+class SharedArtifactStore(LocalArtifactStore):
+    """Split outputs on a filesystem every instance mounts (NFS, EFS, a shared volume).
+
+    Any instance behind the load balancer can serve any file from disk. Files
+    are written under a temporary name and renamed once complete, so another
+    instance never serves half a part.
+    """
+
+    def open(self, name):
+        return ArtifactWriter(self.path(name), self.path(f"{PARTIAL_PREFIX}{uuid.uuid4().hex}_{name}"))
+
+
+class MultipartUploadWriter:
+    """File-like writer that uploads an artifact to S3 while it is being written.
+
+    Every part_size bytes go out as one part of a multipart upload, so at most
+    one part is held in memory; an artifact smaller than one part is sent with
+    a single PUT. Leaving the with block normally completes the upload; an
+    exception aborts it, so a failed part never becomes an object.
+    """
+
+    def __init__(self, client, bucket, key, part_size=S3_PART_SIZE):
+        self.client = client
+        self.bucket = bucket
+        self.key = key
+        self.part_size = part_size
+        self.size = 0
+        self.upload_id = None
+        self.parts = []
+        self._buffer = bytearray()
+
+    def write(self, data):
+        self._buffer += data
+        self.size += len(data)
+        while len(self._buffer) >= self.part_size:
+            self._upload_part(bytes(self._buffer[:self.part_size]))
+            del self._buffer[:self.part_size]
+        return len(data)
+
+    def tell(self):
+        return self.size
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        # Writers that only look for a seek method (pikepdf) never move; uploaded parts cannot be rewritten
+        position = {os.SEEK_SET: offset, os.SEEK_CUR: self.size + offset, os.SEEK_END: self.size + offset}[whence]
+        if position != self.size:
+            raise io.UnsupportedOperation("An S3 upload can only be written front to back.")
+        return position
+
+    def flush(self):
+        # Parts go out once they are full; S3 rejects small parts before the last one
+        pass
+
+    def _upload_part(self, data):
+        if self.upload_id is None:
+            self.upload_id = self.client.create_multipart_upload(
+                Bucket=self.bucket, Key=self.key, ContentType=media_type(self.key)
+            )["UploadId"]
+        number = len(self.parts) + 1
+        response = self.client.upload_part(
+            Bucket=self.bucket, Key=self.key, UploadId=self.upload_id, PartNumber=number, Body=data
+        )
+        self.parts.append({"PartNumber": number, "ETag": response["ETag"]})
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.abort()
+        else:
+            self.close()
+
+    def close(self):
+        if self.upload_id is None:
+            self.client.put_object(
+                Bucket=self.bucket, Key=self.key, Body=bytes(self._buffer), ContentType=media_type(self.key)
+            )
+        else:
+            if self._buffer:
+                self._upload_part(bytes(self._buffer))
+            self.client.complete_multipart_upload(
+                Bucket=self.bucket, Key=self.key, UploadId=self.upload_id, MultipartUpload={"Parts": self.parts}
+            )
+        self._buffer = bytearray()
+
+    def abort(self):
+        if self.upload_id is not None:
+            self.client.abort_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=self.upload_id)
+        self._buffer = bytearray()
+
+
+class S3ArtifactStore:
+    """Split outputs in an S3-compatible bucket (AWS S3, MinIO, R2, ...).
+
+    Split workers upload each part while writing it, and /download/ redirects
+    to a presigned URL, so part bytes never pass back through the API. The
+    client is created per process, since boto3 clients must not cross a fork.
+    Credentials come from the usual AWS environment variables or config files.
+    """
+
+    def __init__(self, bucket, prefix="", endpoint_url=None, region=None, part_size=S3_PART_SIZE):
+        if boto3 is None:
+            raise ValueError("The s3 artifact store needs boto3: pip install boto3.")
+        self.bucket = bucket
+        self.prefix = prefix
+        self.endpoint_url = endpoint_url
+        self.region = region
+        self.part_size = part_size
+        self._client = None
+        self._client_pid = None
+
+    @property
+    def client(self):
+        if self._client is None or self._client_pid != os.getpid():
+            self._client = boto3.client("s3", endpoint_url=self.endpoint_url, region_name=self.region)
+            self._client_pid = os.getpid()
+        return self._client
+
+    def key(self, name):
+        return f"{self.prefix}{name}"
+
+    def path(self, name):
+        """None: nothing is on local disk, clients are sent to download_url instead."""
+        return None
+
+    def open(self, name):
+        return MultipartUploadWriter(self.client, self.bucket, self.key(name), self.part_size)
+
+    def save_file(self, local_path, name):
+        self.client.upload_file(local_path, self.bucket, self.key(name),
+                                ExtraArgs={"ContentType": media_type(name)})
+        os.remove(local_path)
+
+    def _head(self, name):
+        try:
+            return self.client.head_object(Bucket=self.bucket, Key=self.key(name))
+        except ClientError as e:
+            if e.response["Error"]["Code"] in ("404", "NoSuchKey", "NotFound"):
+                raise FileNotFoundError(name)
+            raise
+
+    def size(self, name):
+        return self._head(name)["ContentLength"]
+
+    def mtime(self, name):
+        return self._head(name)["LastModified"].timestamp()
+
+    def touch(self, name, when):
+        # Copying an object onto itself with new metadata resets LastModified, without moving its bytes
+        self._head(name)
+        self.client.copy_object(
+            Bucket=self.bucket, Key=self.key(name), CopySource={"Bucket": self.bucket, "Key": self.key(name)},
+            Metadata={"touched": str(int(when))}, MetadataDirective="REPLACE", ContentType=media_type(name)
+        )
+
+    def delete(self, name):
+        self.client.delete_object(Bucket=self.bucket, Key=self.key(name))
+
+    def list(self):
+        paginator = self.client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self.prefix):
+            for item in page.get("Contents", []):
+                yield item["Key"][len(self.prefix):], item["LastModified"].timestamp(), item["Size"]
+
+    def download_url(self, name, download_name, expires):
+        """A presigned GET URL for the artifact, valid for expires seconds."""
+        return self.client.generate_presigned_url("get_object", ExpiresIn=max(1, int(expires)), Params={
+            "Bucket": self.bucket, "Key": self.key(name),
+            "ResponseContentDisposition": f'attachment; filename="{download_name}"',
+        })
+
+
+def create_artifact_store(backend, directory=None, bucket=None, prefix="", endpoint_url=None, region=None):
+    """Build the artifact store named by backend (one of ARTIFACT_STORES)."""
+    if backend == "local":
+        return LocalArtifactStore(directory)
+    if backend == "shared":
+        return SharedArtifactStore(directory)
+    if backend == "s3":
+        if not bucket:
+            raise ValueError("The s3 artifact store needs a bucket (ARTIFACT_BUCKET).")
+        return S3ArtifactStore(bucket, prefix, endpoint_url, region)
+    raise ValueError(f"Unknown artifact store backend {backend!r}, expected one of: {', '.join(ARTIFACT_STORES)}.")
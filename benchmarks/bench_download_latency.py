@@ -0,0 +1,84 @@
+"""Latency of /download/{filename} while large splits run concurrently.
+
+Usage: python -m benchmarks.bench_download_latency [--pages 500] [--splits 4] [--probes 200]
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import api  # noqa: E402
+from benchmarks.fixtures import make_pdf  # noqa: E402
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+async def run(pages, splits, probes):
+    fixture = make_pdf(os.path.join(tempfile.gettempdir(), "bench_split_fixture.pdf"), pages)
+    with open(fixture, "rb") as f:
+        fixture_bytes = f.read()
+
+    # A small file for the download probes
+    probe_name = "split_1-1_benchprobe.pdf"
+    with api.artifact_store.open(probe_name) as f:
+        f.write(fixture_bytes[:4096])
+
+    await api.startup_event()
+    transport = httpx.ASGITransport(app=api.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+
+        async def split_once():
+            response = await client.post(
+                "/split-pdf-upload/",
+                data={"ranges": ",".join(f"{i}-{i + 9}" for i in range(1, pages, 10))},
+                files={"file": ("fixture.pdf", fixture_bytes, "application/pdf")},
+            )
+            return response.status_code
+
+        async def probe_downloads():
+            latencies = []
+            for _ in range(probes):
+                started = time.perf_counter()
+                response = await client.get(f"/download/{probe_name}")
+                latencies.append((time.perf_counter() - started) * 1000)
+                assert response.status_code == 200
+                await asyncio.sleep(0.005)
+            return latencies
+
+        started = time.perf_counter()
+        results = await asyncio.gather(probe_downloads(), *(split_once() for _ in range(splits)))
+        elapsed = time.perf_counter() - started
+
+    await api.shutdown_event()
+
+    latencies, statuses = results[0], results[1:]
+    print(f"pages={pages} splits={splits} workers={api.SPLIT_WORKERS} max_pending={api.SPLIT_MAX_PENDING}")
+    print(f"split statuses: {sorted(statuses)}  wall={elapsed:.2f}s")
+    print(
+        f"/download/ latency ms: p50={statistics.median(latencies):.2f} "
+        f"p99={percentile(latencies, 99):.2f} max={max(latencies):.2f}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pages", type=int, default=500)
+    parser.add_argument("--splits", type=int, default=4)
+    parser.add_argument("--probes", type=int, default=200)
+    args = parser.parse_args()
+    asyncio.run(run(args.pages, args.splits, args.probes))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+"""URL download throughput: a new connection per download vs. the shared async pool.
+
+A stub server in its own process serves a PDF fixture at a fixed bandwidth per connection,
+with a delay before each new connection is usable (standing in for the TCP and
+TLS handshakes) and before each response. The same downloads run once with
+requests.get, a new connection each time, on a thread pool (how URL sources
+were fetched before), and once through fetch.HttpFetcher.
+
+Usage: python -m benchmarks.bench_fetch [--downloads 40] [--concurrency 4] [--size-kb 512]
+       [--bandwidth-kb 8192] [--handshake-ms 50] [--latency-ms 20]
+"""
+import argparse
+import asyncio
+import http.server
+import multiprocessing
+import os
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fixtures import make_pdf  # noqa: E402
+from fetch import HttpFetcher, PdfSpool  # noqa: E402
+
+# Bytes written per bandwidth step; smaller steps give a smoother rate
+THROTTLE_CHUNK = 16 * 1024
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+class StubServer(http.server.ThreadingHTTPServer):
+    """Serves one body on every path, throttled per connection; counts the connections it accepted."""
+
+    daemon_threads = True
+
+    def __init__(self, body, bandwidth, handshake, latency):
+        super().__init__(("127.0.0.1", 0), StubHandler)
+        self.body = body
+        self.bandwidth = bandwidth
+        self.handshake = handshake
+        self.latency = latency
+        # Shared with the benchmark process, which reads it after the run
+        self.connections = multiprocessing.Value("i", 0)
+
+    def count_connection(self):
+        with self.connections.get_lock():
+            self.connections.value += 1
+
+    def start(self):
+        """Serve from a forked process, so the server does not compete with the client for the GIL."""
+        self.process = multiprocessing.get_context("fork").Process(target=self.serve_forever, daemon=True)
+        self.process.start()
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def stop(self):
+        self.process.terminate()
+        self.process.join()
+        self.server_close()
+
+
+class StubHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Like production servers; otherwise Nagle and delayed ACKs stall reused connections
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        super().setup()
+        self.server.count_connection()
+        time.sleep(self.server.handshake)
+
+    def do_GET(self):
+        body = self.server.body
+        time.sleep(self.server.latency)
+        self.send_response(200)
+        self.send_header("Content-Type", "application/pdf")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        for start in range(0, len(body), THROTTLE_CHUNK):
+            self.wfile.write(body[start:start + THROTTLE_CHUNK])
+            time.sleep(THROTTLE_CHUNK / self.server.bandwidth)
+
+    def log_message(self, *args):
+        pass
+
+
+def download_with_requests(url):
+    """One download the way URL sources were fetched before: requests.get on a fresh connection."""
+    started = time.perf_counter()
+    spool = PdfSpool(0)
+    with requests.get(url, stream=True, timeout=60) as response:
+        response.raise_for_status()
+        for chunk in response.iter_content(64 * 1024):
+            spool.write(chunk)
+    spool.finish()
+    spool.close()
+    return time.perf_counter() - started
+
+
+def run_requests(urls, concurrency):
+    with ThreadPoolExecutor(concurrency) as executor:
+        return list(executor.map(download_with_requests, urls))
+
+
+async def run_fetcher(urls, concurrency):
+    fetcher = HttpFetcher(connections_per_host=concurrency)
+    # Same number of downloads in flight as threads above, so latencies compare
+    slots = asyncio.Semaphore(concurrency)
+
+    async def download(url):
+        async with slots:
+            started = time.perf_counter()
+            (await fetcher.fetch_pdf(url, 0)).file.close()
+            return time.perf_counter() - started
+
+    try:
+        return await asyncio.gather(*(download(url) for url in urls))
+    finally:
+        await fetcher.aclose()
+
+
+def report(name, server, elapsed, latencies, size):
+    print(f"{name:9s} total={elapsed:6.2f}s downloads/s={len(latencies) / elapsed:6.1f} "
+          f"MB/s={len(latencies) * size / elapsed / 1e6:6.2f} "
+          f"p50={statistics.median(latencies) * 1000:7.1f}ms p99={percentile(latencies, 99) * 1000:7.1f}ms "
+          f"connections={server.connections.value}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--downloads", type=int, default=40)
+    parser.add_argument("--concurrency", type=int, default=4, help="threads for requests, connections per host for the pool")
+    parser.add_argument("--size-kb", type=int, default=512)
+    parser.add_argument("--bandwidth-kb", type=int, default=8192, help="per connection, KiB/s")
+    parser.add_argument("--handshake-ms", type=float, default=50)
+    parser.add_argument("--latency-ms", type=float, default=20)
+    args = parser.parse_args()
+
+    # Pad the fixture with image data until it is about the requested size
+    fixture = make_pdf(os.path.join(tempfile.mkdtemp(), "fixture.pdf"), 4, image_bytes=args.size_kb * 1024 // 4)
+    with open(fixture, "rb") as f:
+        body = f.read()
+
+    for name in ("requests", "pool"):
+        server = StubServer(body, args.bandwidth_kb * 1024, args.handshake_ms / 1000, args.latency_ms / 1000)
+        base_url = server.start()
+        urls = [f"{base_url}/fixture-{i}.pdf" for i in range(args.downloads)]
+
+        started = time.perf_counter()
+        if name == "requests":
+            latencies = run_requests(urls, args.concurrency)
+        else:
+            latencies = asyncio.run(run_fetcher(urls, args.concurrency))
+        report(name, server, time.perf_counter() - started, latencies, len(body))
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
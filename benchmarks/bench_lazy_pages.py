@@ -0,0 +1,78 @@
+"""Time and Python heap of splitting a few pages out of very large PDFs.
+
+Compares the eager path (len(reader.pages) flattens the whole page tree
+before any page is copied) with PdfDocument, which takes the page count from
+/Count and looks up only the requested pages.
+
+Usage: python -m benchmarks.bench_lazy_pages [--sizes 2000,6000,20000] [--pages 11]
+"""
+import argparse
+import io
+import mmap
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import PyPDF2
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fixtures import make_pdf  # noqa: E402
+from pdf_utils import PdfDocument, split_pdf  # noqa: E402
+
+
+def eager_split(path, start, end):
+    """The old path: flatten the page tree for the count, then index reader.pages."""
+    with open(path, "rb") as f:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    reader = PyPDF2.PdfReader(mapped)
+    total_pages = len(reader.pages)
+    writer = PyPDF2.PdfWriter()
+    for page_num in range(start - 1, min(end, total_pages)):
+        writer.add_page(reader.pages[page_num])
+    writer.write(io.BytesIO())
+    mapped.close()
+
+
+def lazy_split(path, start, end):
+    document = PdfDocument(path)
+    for writer in split_pdf(document, [(start, end)]):
+        writer.write(io.BytesIO())
+    document.close()
+
+
+def measure(split, path, start, end):
+    # Time and heap are measured in separate runs, since tracing slows the parser down several times
+    started = time.perf_counter()
+    split(path, start, end)
+    elapsed = time.perf_counter() - started
+
+    tracemalloc.start()
+    split(path, start, end)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="2000,6000,20000")
+    parser.add_argument("--pages", type=int, default=11)
+    args = parser.parse_args()
+
+    fixture_dir = tempfile.mkdtemp()
+    for size in (int(n) for n in args.sizes.split(",")):
+        path = make_pdf(os.path.join(fixture_dir, f"fixture_{size}.pdf"), size, lines_per_page=5)
+        # Pages around two thirds in, like 4000-4010 of a 6000-page file
+        start = size * 2 // 3
+        end = start + args.pages - 1
+        for name, split in (("eager", eager_split), ("lazy", lazy_split)):
+            elapsed, peak = measure(split, path, start, end)
+            print(f"{size:6d} pages {name:5s} pages {start}-{end}: "
+                  f"ms={elapsed * 1000:8.1f} peak_heap_mb={peak / 1024 / 1024:7.1f}")
+
+
+if __name__ == "__main__":
+    main()
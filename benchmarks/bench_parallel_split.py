@@ -0,0 +1,61 @@
+"""Wall time of a many-range split with 1, 2, 4 and 8 split workers.
+
+Every run splits the same fixture through api.split_ranges, so ranges are
+grouped and spread over the pool exactly as they are for a request.
+
+Usage: python -m benchmarks.bench_parallel_split [--pages 2000] [--ranges 200] [--workers 1,2,4,8]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import api  # noqa: E402
+from benchmarks.fixtures import make_pdf  # noqa: E402
+from worker_pool import SplitWorkerPool  # noqa: E402
+
+
+def run(fixture, range_tuples, workers, repeat):
+    api.split_pool = SplitWorkerPool(max_workers=workers, max_pending=workers * 2)
+    try:
+        # Warm up: fork the workers before timing
+        asyncio.run(api.split_pool.map(api.count_pages, [(fixture,)] * workers))
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            result = asyncio.run(api.split_ranges(fixture, range_tuples))
+            timings.append(time.perf_counter() - started)
+            for _, filename in result["files"]:
+                api.artifact_store.delete(filename)
+        return min(timings), api.split_task_count(len(range_tuples))
+    finally:
+        api.split_pool.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pages", type=int, default=2000)
+    parser.add_argument("--ranges", type=int, default=200)
+    parser.add_argument("--workers", default="1,2,4,8")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    fixture = make_pdf(os.path.join(tempfile.mkdtemp(), "fixture.pdf"), args.pages)
+    os.makedirs(api.TEMP_DIR, exist_ok=True)
+    step = args.pages // args.ranges
+    range_tuples = [(i * step + 1, (i + 1) * step) for i in range(args.ranges)]
+
+    print(f"{args.pages} pages, {len(range_tuples)} ranges, {os.cpu_count()} CPUs")
+    baseline = None
+    for workers in (int(n) for n in args.workers.split(",")):
+        elapsed, tasks = run(fixture, range_tuples, workers, args.repeat)
+        baseline = baseline or elapsed
+        print(f"workers={workers} tasks={tasks} seconds={elapsed:.2f} speedup={baseline / elapsed:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
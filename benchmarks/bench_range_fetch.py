@@ -0,0 +1,69 @@
+"""Bytes and requests a URL split fetches with range requests, for pages near the start, middle and end.
+
+The remote file is read straight from a local fixture through RangeFile, so
+this counts what would go over the network without timing any of it. Both
+a flat page tree (as PyPDF2 writes it) and a balanced one with a few kids per
+node (as producers that append pages leave it) are measured; the cost should
+not grow with how deep into the file the pages are.
+
+Usage: python -m benchmarks.bench_range_fetch [--pages 400] [--image-kb 40] [--count 3] [--fanout 4]
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fixtures import make_pdf, nest_page_tree  # noqa: E402
+from pdf_utils import PdfDocument  # noqa: E402
+from range_fetch import RangeFile, prefetch_pages, BLOCK_SIZE  # noqa: E402
+
+
+def local_spans(path):
+    """fetch_spans reading the fixture itself, standing in for the HTTP server."""
+    def fetch_spans(spans):
+        with open(path, "rb") as f:
+            return [os.pread(f.fileno(), end - start, start) for start, end in spans]
+    return fetch_spans
+
+
+def fetch_pages(path, first, count, workdir):
+    size = os.path.getsize(path)
+    with open(path, "rb") as f:
+        head = f.read(BLOCK_SIZE)
+    range_file = RangeFile(os.path.join(workdir, "remote.pdf"), size, local_spans(path), head=head)
+    try:
+        document = PdfDocument(range_file)
+        pages = [index for index in range(first - 1, first - 1 + count) if index < document.total_pages]
+        prefetch_pages(document, range_file, pages)
+        return len(head) + range_file.bytes_fetched, range_file.requests
+    finally:
+        range_file.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pages", type=int, default=400)
+    parser.add_argument("--image-kb", type=int, default=40)
+    parser.add_argument("--count", type=int, default=3)
+    parser.add_argument("--fanout", type=int, default=4)
+    args = parser.parse_args()
+
+    fixture_dir = tempfile.mkdtemp()
+    try:
+        flat = make_pdf(os.path.join(fixture_dir, "flat.pdf"), args.pages, image_bytes=args.image_kb * 1024)
+        nested = nest_page_tree(shutil.copy(flat, os.path.join(fixture_dir, "nested.pdf")), args.fanout)
+        for name, path in (("flat", flat), (f"fanout {args.fanout}", nested)):
+            size = os.path.getsize(path)
+            for first in (1, args.pages // 2 - 1, args.pages - args.count - 8):
+                fetched, requests = fetch_pages(path, first, args.count, fixture_dir)
+                print(f"{name:9s} {size / 1024 / 1024:5.1f} MB pages {first}-{first + args.count - 1}: "
+                      f"fetched_kb={fetched / 1024:8.1f} share={fetched / size:6.1%} requests={requests}")
+    finally:
+        shutil.rmtree(fixture_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""Count PyPDF2.PdfReader constructions per split request.
+
+Usage: python -m benchmarks.bench_reader_constructions [--pages 300] [--requests 5]
+"""
+import argparse
+import asyncio
+import functools
+import http.server
+import os
+import sys
+import tempfile
+import threading
+import time
+
+import PyPDF2
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import api  # noqa: E402
+import app  # noqa: E402
+from benchmarks.fixtures import make_pdf  # noqa: E402
+
+constructions = 0
+_original_reader = PyPDF2.PdfReader
+
+
+class CountingReader(_original_reader):
+    def __init__(self, *args, **kwargs):
+        global constructions
+        constructions += 1
+        super().__init__(*args, **kwargs)
+
+
+class QuietHandler(http.server.SimpleHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+def serve_directory(directory):
+    """Serve directory over HTTP on a free local port; returns the base URL."""
+    handler = functools.partial(QuietHandler, directory=directory)
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_address[1]}"
+
+
+async def download(url):
+    try:
+        return await api.download_file_from_url(url)
+    finally:
+        # The fetcher's client belongs to this asyncio.run loop
+        await api.http_fetcher.aclose()
+
+
+def url_request(url, ranges):
+    source_path, error = asyncio.run(download(url))
+    assert error is None, error
+    return api.split_pdf_file(source_path, ranges)
+
+
+def upload_request(path, ranges):
+    with open(path, "rb") as f:
+        source_path = api.source_cache.add_stream(f)
+    return api.split_pdf_file(source_path, ranges)
+
+
+def streamlit_request(url, ranges):
+    result = app.api_split_url(url, ranges)
+    assert "error" not in result, result
+
+
+def measure(name, request, requests):
+    global constructions
+    constructions = 0
+    started = time.perf_counter()
+    for _ in range(requests):
+        request()
+    elapsed = time.perf_counter() - started
+    print(f"{name:8s} readers/request={constructions / requests:.1f} ms/request={elapsed / requests * 1000:.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pages", type=int, default=300)
+    parser.add_argument("--requests", type=int, default=5)
+    args = parser.parse_args()
+
+    fixture_dir = tempfile.mkdtemp()
+    fixture = make_pdf(os.path.join(fixture_dir, "fixture.pdf"), args.pages)
+    base_url = serve_directory(fixture_dir)
+    ranges = f"1-10,{args.pages // 2}-{args.pages // 2 + 10}"
+
+    # Patch the class every module looks up through PyPDF2 at call time
+    PyPDF2.PdfReader = CountingReader
+    try:
+        measure("upload", functools.partial(upload_request, fixture, ranges), args.requests)
+        measure("url", functools.partial(url_request, f"{base_url}/fixture.pdf", ranges), args.requests)
+        measure("app.py", functools.partial(streamlit_request, f"{base_url}/fixture.pdf", ranges), args.requests)
+    finally:
+        PyPDF2.PdfReader = _original_reader
+
+
+if __name__ == "__main__":
+    main()
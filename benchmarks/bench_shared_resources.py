@@ -0,0 +1,64 @@
+"""Output bytes and write time of a 100-chapter split, plain and with optimize=true.
+
+The fixture embeds its own copy of the same font program on every page, so
+every part carries many identical font streams unless they are merged.
+optimize=true spends CPU time to write fewer bytes: on local disk the
+optimized run is expected to be slower, and the extra time is printed as such.
+
+Usage: python -m benchmarks.bench_shared_resources [--pages 1000] [--chapters 100] [--font-bytes 20000] [--repeat 3]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import api  # noqa: E402
+from benchmarks.fixtures import make_pdf  # noqa: E402
+
+
+def run(fixture, range_tuples, optimize):
+    started = time.perf_counter()
+    result = api.split_pdf_file(fixture, range_tuples, optimize=optimize)
+    elapsed = time.perf_counter() - started
+
+    output_bytes = 0
+    for _, filename in result["files"]:
+        output_bytes += api.artifact_store.size(filename)
+        api.artifact_store.delete(filename)
+    return elapsed, output_bytes, result.get("optimization")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pages", type=int, default=1000)
+    parser.add_argument("--chapters", type=int, default=100)
+    parser.add_argument("--font-bytes", type=int, default=20000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    fixture = make_pdf(os.path.join(tempfile.mkdtemp(), "fixture.pdf"), args.pages, font_bytes=args.font_bytes)
+    os.makedirs(api.TEMP_DIR, exist_ok=True)
+    step = args.pages // args.chapters
+    range_tuples = [(i * step + 1, (i + 1) * step) for i in range(args.chapters)]
+
+    # Alternate the modes and keep the fastest run of each, so neither gets a warmer cache
+    plain_seconds = optimized_seconds = float("inf")
+    for _ in range(args.repeat):
+        elapsed, plain_bytes, _ = run(fixture, range_tuples, optimize=False)
+        plain_seconds = min(plain_seconds, elapsed)
+        elapsed, optimized_bytes, stats = run(fixture, range_tuples, optimize=True)
+        optimized_seconds = min(optimized_seconds, elapsed)
+
+    print(f"{args.pages} pages, {args.chapters} parts, source {os.path.getsize(fixture)} bytes")
+    print(f"plain      bytes={plain_bytes} seconds={plain_seconds:.2f}")
+    print(f"optimized  bytes={optimized_bytes} seconds={optimized_seconds:.2f}")
+    print(f"bytes saved={plain_bytes - optimized_bytes} ({1 - optimized_bytes / plain_bytes:.1%}) "
+          f"extra time={optimized_seconds - plain_seconds:+.2f}s ({optimized_seconds / plain_seconds - 1:+.0%})")
+    print(f"optimization stats: {stats}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""Peak RSS and wall time of the upload path, before and after zero-copy handling.
+
+Each variant runs in its own process so ru_maxrss is not shared between them.
+The upload starts as a SpooledTemporaryFile that spilled to disk, like the
+UploadFile python-multipart hands to the endpoint.
+
+Usage: python -m benchmarks.bench_upload_memory [--pages 1000] [--image-bytes 100000]
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.suite import peak_rss_kib  # noqa: E402
+
+VARIANTS = ("legacy", "multipart", "raw")
+RANGES = "1-10,500-510"
+
+
+def spooled_upload(fixture):
+    """Copy the fixture into a spooled temp file, as python-multipart does."""
+    upload = tempfile.SpooledTemporaryFile(max_size=1024 * 1024)
+    with open(fixture, "rb") as f:
+        shutil.copyfileobj(f, upload)
+    upload.seek(0)
+    return upload
+
+
+def run_legacy(fixture):
+    """The original handler: copy to upload_<uuid>.pdf, read it for the count, read it again to split."""
+    import PyPDF2
+
+    import api
+
+    upload = spooled_upload(fixture)
+    started = time.perf_counter()
+    temp_file_path = os.path.join(api.TEMP_DIR, f"upload_{uuid.uuid4().hex}.pdf")
+    with open(temp_file_path, "wb") as buffer:
+        shutil.copyfileobj(upload, buffer)
+    total_pages = len(PyPDF2.PdfReader(temp_file_path).pages)
+    range_tuples = api.parse_range_input(RANGES, total_pages)
+    pdf_reader = PyPDF2.PdfReader(temp_file_path)
+    for start, end in range_tuples:
+        writer = PyPDF2.PdfWriter()
+        for page_num in range(start - 1, end):
+            writer.add_page(pdf_reader.pages[page_num])
+        api.save_pdf_to_temp(writer, f"{start}-{end}")
+    os.unlink(temp_file_path)
+    return time.perf_counter() - started
+
+
+def run_multipart(fixture):
+    """Current /split-pdf-upload/: kernel copy of the spool into the cache, mmap'd parse."""
+    import api
+
+    upload = spooled_upload(fixture)
+    started = time.perf_counter()
+    source_path = api.source_cache.add_stream(upload)
+    api.split_pdf_file(source_path, RANGES)
+    return time.perf_counter() - started
+
+
+def run_raw(fixture):
+    """/split-pdf-upload-raw/: body chunks straight into the cache, no multipart spool."""
+    import api
+    from fetch import CHUNK_SIZE, PdfSpool
+
+    started = time.perf_counter()
+    partial = api.source_cache.new_partial()
+    spool = PdfSpool(0, file=partial)
+    with open(fixture, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            spool.write(chunk)
+    upload = spool.finish()
+    partial.close()
+    source_path = api.source_cache.commit(partial.name, upload.sha256, upload.size)
+    api.split_pdf_file(source_path, RANGES)
+    return time.perf_counter() - started
+
+
+def child(variant, fixture):
+    # Fresh cache per run, so the multipart and raw variants never hit a cached blob
+    os.environ["SOURCE_CACHE_DIR"] = tempfile.mkdtemp()
+    elapsed = globals()[f"run_{variant}"](fixture)
+    peak_kib = peak_rss_kib()
+    print(json.dumps({"variant": variant, "seconds": elapsed, "peak_rss_mb": peak_kib / 1024}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pages", type=int, default=1000)
+    parser.add_argument("--image-bytes", type=int, default=100_000)
+    parser.add_argument("--child", choices=VARIANTS)
+    parser.add_argument("--fixture")
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.child, args.fixture)
+        return
+
+    from benchmarks.fixtures import make_pdf
+
+    fixture = make_pdf(os.path.join(tempfile.gettempdir(), "bench_upload_fixture.pdf"),
+                       args.pages, image_bytes=args.image_bytes)
+    print(f"fixture: {args.pages} pages, {os.path.getsize(fixture) / 1024 / 1024:.1f} MB")
+    for variant in VARIANTS:
+        output = subprocess.run(
+            [sys.executable, "-m", "benchmarks.bench_upload_memory", "--child", variant, "--fixture", fixture],
+            check=True, capture_output=True, text=True,
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        print(f"{variant:10s} wall={result['seconds']:.2f}s peak_rss={result['peak_rss_mb']:.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
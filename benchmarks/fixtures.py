@@ -0,0 +1,230 @@
+"""Synthetic PDF fixtures for the benchmark scripts."""
+import io
+import os
+import re
+
+from PyPDF2 import PdfReader, PdfWriter
+from PyPDF2.generic import (
+    ArrayObject, DecodedStreamObject, DictionaryObject, EncodedStreamObject, NameObject, NumberObject
+)
+
+
+def make_image(writer, size):
+    """Add an uncompressed grayscale image of about `size` random bytes; returns its reference."""
+    side = max(1, int(size ** 0.5))
+    image = DecodedStreamObject()
+    image.set_data(os.urandom(side * side))
+    image.update({
+        NameObject("/Type"): NameObject("/XObject"),
+        NameObject("/Subtype"): NameObject("/Image"),
+        NameObject("/Width"): NumberObject(side),
+        NameObject("/Height"): NumberObject(side),
+        NameObject("/ColorSpace"): NameObject("/DeviceGray"),
+        NameObject("/BitsPerComponent"): NumberObject(8),
+    })
+    return writer._add_object(image)
+
+
+def make_embedded_font(writer, program):
+    """Add a font dictionary embedding `program` as its font file; returns its reference."""
+    font_file = DecodedStreamObject()
+    font_file.set_data(program)
+    descriptor = DictionaryObject({
+        NameObject("/Type"): NameObject("/FontDescriptor"),
+        NameObject("/FontName"): NameObject("/Embedded"),
+        NameObject("/Flags"): NumberObject(32),
+        NameObject("/FontFile"): writer._add_object(font_file),
+    })
+    return writer._add_object(DictionaryObject({
+        NameObject("/Type"): NameObject("/Font"),
+        NameObject("/Subtype"): NameObject("/Type1"),
+        NameObject("/BaseFont"): NameObject("/Helvetica"),
+        NameObject("/FontDescriptor"): writer._add_object(descriptor),
+    }))
+
+
+def make_font_program(size):
+    """Font program bytes: mostly glyph outlines, repetitive, so they compress well."""
+    return b"".join(b"%d %d rlineto " % (i % 97, i % 89) for i in range(size // 16))[:size]
+
+
+def make_scan(writer, width, height, seed):
+    """Add a JPEG page scan of width x height pixels, rows of dark text-like bars on white; returns its reference."""
+    import random
+
+    from PIL import Image, ImageDraw
+
+    scan = Image.new("L", (width, height), 255)
+    draw = ImageDraw.Draw(scan)
+    rows = random.Random(seed)
+    line_height = max(2, height // 110)
+    for top in range(height // 10, height * 9 // 10, line_height * 2):
+        draw.rectangle([width // 10, top, width // 10 + rows.randint(width // 3, width * 8 // 10), top + line_height], fill=30)
+    buffer = io.BytesIO()
+    scan.save(buffer, "JPEG", quality=90)
+
+    image = EncodedStreamObject()
+    image._data = buffer.getvalue()
+    image.update({
+        NameObject("/Type"): NameObject("/XObject"),
+        NameObject("/Subtype"): NameObject("/Image"),
+        NameObject("/Width"): NumberObject(width),
+        NameObject("/Height"): NumberObject(height),
+        NameObject("/ColorSpace"): NameObject("/DeviceGray"),
+        NameObject("/BitsPerComponent"): NumberObject(8),
+        NameObject("/Filter"): NameObject("/DCTDecode"),
+    })
+    return writer._add_object(image)
+
+
+def make_scanned_pdf(path, pages, dpi=300):
+    """Write a PDF of `pages` letter-size page scans at dpi to `path` and return the path.
+
+    Like the output of many scanner drivers, every page shares one resource
+    dictionary naming all the scans, so a part copies every scan of the
+    document unless the unused ones are dropped. Needs Pillow.
+    """
+    writer = PdfWriter()
+    scans = DictionaryObject({
+        NameObject(f"/Scan{page_num}"): make_scan(writer, int(8.5 * dpi), 11 * dpi, page_num)
+        for page_num in range(pages)
+    })
+    resources = writer._add_object(DictionaryObject({NameObject("/XObject"): scans}))
+
+    for page_num in range(pages):
+        writer.add_blank_page(width=612, height=792)
+        page = writer.pages[-1]
+        content = DecodedStreamObject()
+        content.set_data(f"q 612 0 0 792 0 0 cm /Scan{page_num} Do Q".encode("latin-1"))
+        page[NameObject("/Contents")] = writer._add_object(content)
+        page[NameObject("/Resources")] = resources
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "wb") as output_file:
+        writer.write(output_file)
+
+    return path
+
+
+def make_pdf(path, pages, lines_per_page=40, image_bytes=0, font_bytes=0, shared_font_bytes=0):
+    """Write a PDF with `pages` text pages to `path` and return the path.
+
+    With image_bytes, every page also draws its own random image of that size,
+    which is how 1000 pages become a 100 MB file. With font_bytes, every page
+    embeds its own copy of the same uncompressed font program, as some
+    producers do, instead of sharing one font. With shared_font_bytes, all
+    pages share one embedded font program of that size, so every part of a
+    split has to carry it.
+    """
+    writer = PdfWriter()
+
+    font = DictionaryObject({
+        NameObject("/Type"): NameObject("/Font"),
+        NameObject("/Subtype"): NameObject("/Type1"),
+        NameObject("/BaseFont"): NameObject("/Helvetica"),
+    })
+    font_ref = writer._add_object(font)
+    if shared_font_bytes:
+        font_ref = make_embedded_font(writer, make_font_program(shared_font_bytes))
+    font_program = make_font_program(font_bytes)
+
+    for page_num in range(pages):
+        if font_bytes:
+            font_ref = make_embedded_font(writer, font_program)
+        writer.add_blank_page(width=612, height=792)
+        # add_page stores a clone, so edit the page the writer actually holds
+        page = writer.pages[-1]
+
+        # One text line per row so every page carries a real content stream
+        rows = [
+            f"BT /F1 10 Tf 40 {760 - row * 18} Td (Page {page_num + 1} line {row + 1}) Tj ET"
+            for row in range(lines_per_page)
+        ]
+        resources = DictionaryObject({
+            NameObject("/Font"): DictionaryObject({NameObject("/F1"): font_ref}),
+        })
+        if image_bytes:
+            rows.append("q 200 0 0 200 300 300 cm /Im1 Do Q")
+            resources[NameObject("/XObject")] = DictionaryObject({
+                NameObject("/Im1"): make_image(writer, image_bytes),
+            })
+
+        content = DecodedStreamObject()
+        content.set_data("\n".join(rows).encode("latin-1"))
+
+        page[NameObject("/Contents")] = writer._add_object(content)
+        page[NameObject("/Resources")] = resources
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "wb") as output_file:
+        writer.write(output_file)
+
+    return path
+
+
+def nest_page_tree(path, fanout=2):
+    """Rewrite the PDF at `path` so its page tree is balanced with `fanout` kids per node; returns the path.
+
+    Producers that append pages one at a time leave trees many levels deep,
+    which is what page lookups have to descend.
+    """
+    writer = PdfWriter()
+    writer.append(path)
+    root_ref = writer._pages
+    root = root_ref.get_object()
+
+    level = list(root["/Kids"])
+    counts = [1] * len(level)
+    while len(level) > fanout:
+        next_level, next_counts = [], []
+        for i in range(0, len(level), fanout):
+            kids, kid_counts = level[i:i + fanout], counts[i:i + fanout]
+            node_ref = writer._add_object(DictionaryObject({
+                NameObject("/Type"): NameObject("/Pages"),
+                NameObject("/Kids"): ArrayObject(kids),
+                NameObject("/Count"): NumberObject(sum(kid_counts)),
+                NameObject("/Parent"): root_ref,
+            }))
+            for kid in kids:
+                kid.get_object()[NameObject("/Parent")] = node_ref
+            next_level.append(node_ref)
+            next_counts.append(sum(kid_counts))
+        level, counts = next_level, next_counts
+    root[NameObject("/Kids")] = ArrayObject(level)
+
+    with open(path, "wb") as output_file:
+        writer.write(output_file)
+    return path
+
+
+def add_incremental_updates(path, updates):
+    """Append `updates` incremental-update sections to the PDF at `path`; returns the path.
+
+    Each update replaces the content stream of one page and adds an xref
+    section chained to the previous one with /Prev, as editors that save in
+    place do, so the reader has to walk every section.
+    """
+    reader = PdfReader(path)
+    content_ids = [page.raw_get("/Contents").idnum for page in reader.pages]
+    root_id = reader.trailer.raw_get("/Root").idnum
+    size = reader.trailer["/Size"]
+    with open(path, "rb") as f:
+        data = f.read()
+    prev = int(re.findall(rb"startxref\s+(\d+)", data)[-1])
+
+    with open(path, "ab") as f:
+        offset = len(data)
+        for update in range(updates):
+            idnum = content_ids[update * len(content_ids) // updates]
+            body = f"BT /F1 10 Tf 40 40 Td (Revision {update + 1}) Tj ET".encode("latin-1")
+            obj = b"%d 0 obj\n<< /Length %d >>\nstream\n%s\nendstream\nendobj\n" % (idnum, len(body), body)
+            xref_offset = offset + len(obj)
+            section = (
+                b"xref\n%d 1\n%010d 00000 n \n" % (idnum, offset)
+                + b"trailer\n<< /Size %d /Root %d 0 R /Prev %d >>\n" % (size, root_id, prev)
+                + b"startxref\n%d\n%%%%EOF\n" % xref_offset
+            )
+            f.write(obj + section)
+            offset += len(obj) + len(section)
+            prev = xref_offset
+    return path
@@ -0,0 +1,341 @@
+"""Benchmark suite for the split pipeline, with results saved as JSON for comparing runs.
+
+Builds synthetic fixtures (many pages, a heavy shared font, a deep page tree,
+large images, incremental-update xrefs) and times parse_range_input,
+split_pdf, save_pdf_to_temp and the upload endpoints through an in-process
+ASGI client. The fixture cases run once per PDF backend, so engines can be
+compared per workload. Every (case, fixture, backend) runs in its own
+process, so peak RSS belongs to that case alone; for the endpoints it
+includes the split workers.
+
+Usage:
+  python -m benchmarks.suite [--scale 1.0] [--iterations 10] [--backends pypdf2,pikepdf] [--output results.json]
+  python -m benchmarks.suite --compare baseline.json results.json
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# name -> (make_pdf arguments, page tree fanout or None, incremental updates); page counts are scaled by --scale
+FIXTURES = {
+    "many_pages": ({"pages": 2000, "lines_per_page": 5}, None, 0),
+    "shared_fonts": ({"pages": 300, "shared_font_bytes": 2_000_000}, None, 0),
+    "deep_tree": ({"pages": 2000, "lines_per_page": 5}, 2, 0),
+    "large_images": ({"pages": 60, "image_bytes": 1_000_000}, None, 0),
+    "incremental": ({"pages": 500, "lines_per_page": 5}, None, 200),
+}
+
+# Cases timed on every fixture and backend; parse_range_input does not read a PDF and runs once
+FIXTURE_CASES = ("split_pdf", "save_pdf_to_temp", "endpoint_upload", "endpoint_raw")
+CASES = ("parse_range_input",) + FIXTURE_CASES
+
+# Ten ranges of ten pages spread over the document, like chapters picked from a book
+RANGE_COUNT = 10
+RANGE_PAGES = 10
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def build_fixture(name, directory, scale):
+    from benchmarks.fixtures import add_incremental_updates, make_pdf, nest_page_tree
+
+    options, fanout, updates = FIXTURES[name]
+    options = dict(options, pages=max(RANGE_PAGES, int(options["pages"] * scale)))
+    path = make_pdf(os.path.join(directory, f"{name}.pdf"), **options)
+    if fanout:
+        nest_page_tree(path, fanout)
+    if updates:
+        add_incremental_updates(path, max(1, int(updates * scale)))
+    return path
+
+
+def spread_ranges(total_pages):
+    step = max(RANGE_PAGES, total_pages // RANGE_COUNT)
+    return ",".join(
+        f"{start}-{min(start + RANGE_PAGES - 1, total_pages)}"
+        for start in range(1, total_pages + 1, step)
+    )
+
+
+def time_calls(fn, iterations):
+    """Run fn once to warm up, then iterations times; returns the per-call seconds."""
+    fn()
+    timings = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - started)
+    return timings
+
+
+def run_parse_range_input(fixture, iterations, backend):
+    import api
+
+    # A long request: 1000 ranges against a 20000-page document
+    ranges = ",".join(f"{i}-{i + 9}" for i in range(1, 20000, 20))
+    timings = time_calls(lambda: api.parse_range_input(ranges, 20000), iterations * 100)
+    return timings, 0
+
+
+def run_split_pdf(fixture, iterations, backend):
+    import api
+    from pdf_backends import open_document
+    from pdf_utils import split_pdf
+
+    total_pages = open_document(fixture, backend).total_pages
+    range_tuples = api.parse_range_input(spread_ranges(total_pages), total_pages)
+
+    def split():
+        document = open_document(fixture, backend)
+        split_pdf(document, range_tuples)
+        document.close()
+
+    return time_calls(split, iterations), sum(end - start + 1 for start, end in range_tuples)
+
+
+def run_save_pdf_to_temp(fixture, iterations, backend):
+    import api
+    from pdf_backends import open_document
+    from pdf_utils import split_pdf
+
+    document = open_document(fixture, backend)
+    total_pages = document.total_pages
+    range_tuples = api.parse_range_input(spread_ranges(total_pages), total_pages)
+    os.makedirs(api.TEMP_DIR, exist_ok=True)
+
+    # Split outside the timer; only the writes are measured
+    timings = []
+    for iteration in range(iterations + 1):
+        writers = split_pdf(document, range_tuples)
+        started = time.perf_counter()
+        saved = [api.save_pdf_to_temp(writer, f"{start}-{end}") for writer, (start, end) in zip(writers, range_tuples)]
+        elapsed = time.perf_counter() - started
+        for filename, _ in saved:
+            api.artifact_store.delete(filename)
+        if iteration:
+            timings.append(elapsed)
+    document.close()
+    return timings, sum(end - start + 1 for start, end in range_tuples)
+
+
+def run_endpoint(fixture, iterations, raw):
+    import httpx
+
+    import api
+    from pdf_backends import open_document
+
+    # The endpoints use the backend set in PDF_BACKEND by child()
+    total_pages = open_document(fixture, api.PDF_BACKEND).total_pages
+    ranges = spread_ranges(total_pages)
+    with open(fixture, "rb") as f:
+        fixture_bytes = f.read()
+
+    async def run():
+        await api.startup_event()
+        transport = httpx.ASGITransport(app=api.app)
+        try:
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+                timings = []
+                for iteration in range(iterations + 1):
+                    # A distinct trailing comment per request, so neither the source
+                    # nor the result cache turns it into a lookup
+                    body = fixture_bytes + b"%% bench request %d\n" % iteration
+                    started = time.perf_counter()
+                    if raw:
+                        response = await client.post(
+                            "/split-pdf-upload-raw/", params={"ranges": ranges}, content=body,
+                            headers={"Content-Type": "application/pdf"},
+                        )
+                    else:
+                        response = await client.post(
+                            "/split-pdf-upload/", data={"ranges": ranges},
+                            files={"file": ("fixture.pdf", body, "application/pdf")},
+                        )
+                    elapsed = time.perf_counter() - started
+                    response.raise_for_status()
+                    for part in response.json()["files"]:
+                        api.artifact_store.delete(part["download_url"].rsplit("/", 1)[1])
+                    if iteration:
+                        timings.append(elapsed)
+                return timings
+        finally:
+            await api.shutdown_event()
+
+    timings = asyncio.run(run())
+    return timings, sum(end - start + 1 for start, end in api.parse_range_input(ranges, total_pages))
+
+
+def run_endpoint_upload(fixture, iterations, backend):
+    return run_endpoint(fixture, iterations, raw=False)
+
+
+def run_endpoint_raw(fixture, iterations, backend):
+    return run_endpoint(fixture, iterations, raw=True)
+
+
+def peak_rss_kib():
+    """Peak RSS of this process in KiB.
+
+    Read from VmHWM rather than ru_maxrss: on Linux a process started with
+    fork and exec keeps the ru_maxrss of the process that forked it, so every
+    case would report at least the size of the suite that built the fixtures.
+    """
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def child(case, fixture, iterations, backend):
+    # Empty caches for every case, so earlier runs never turn a split into a cache hit
+    cache_dir = tempfile.mkdtemp()
+    os.environ["SOURCE_CACHE_DIR"] = os.path.join(cache_dir, "sources")
+    os.environ["RESULT_CACHE_PATH"] = os.path.join(cache_dir, "results.sqlite3")
+    os.environ["PDF_BACKEND"] = backend
+
+    timings, pages = globals()[f"run_{case}"](fixture, iterations, backend)
+    total = sum(timings)
+    # The children are the split workers; Linux reports ru_maxrss in KiB
+    peak_kib = max(peak_rss_kib(), resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    print(json.dumps({
+        "iterations": len(timings),
+        "ops_per_second": len(timings) / total if total else None,
+        "pages_per_second": pages * len(timings) / total if pages and total else None,
+        "p50_ms": percentile(timings, 50) * 1000,
+        "p99_ms": percentile(timings, 99) * 1000,
+        "peak_rss_mb": peak_kib / 1024,
+    }))
+
+
+def run_case(case, fixture, iterations, backend):
+    output = subprocess.run(
+        [sys.executable, "-m", "benchmarks.suite", "--child", case, "--fixture", fixture or "",
+         "--iterations", str(iterations), "--backend", backend],
+        check=True, capture_output=True, text=True, cwd=ROOT
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def environment():
+    import PyPDF2
+
+    import pdf_backends
+
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=ROOT).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "pypdf2": PyPDF2.__version__,
+        "pikepdf": pdf_backends.pikepdf.__version__ if pdf_backends.pikepdf else None,
+        "pymupdf": pdf_backends.pymupdf.__version__ if pdf_backends.pymupdf else None,
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def compare(baseline_path, results_path):
+    """Print the p50 and throughput change of every case found in both result files."""
+    with open(baseline_path) as f:
+        baseline = {(r["case"], r["fixture"], r["backend"]): r for r in json.load(f)["results"]}
+    with open(results_path) as f:
+        results = json.load(f)["results"]
+
+    print(f"{'case':18s} {'fixture':14s} {'backend':8s} {'p50 ms':>28s}{'ops/s':>18s}")
+    for result in results:
+        before = baseline.get((result["case"], result["fixture"], result["backend"]))
+        if before is None:
+            continue
+        p50_change = result["p50_ms"] / before["p50_ms"] - 1
+        ops_change = result["ops_per_second"] / before["ops_per_second"] - 1
+        print(f"{result['case']:18s} {result['fixture'] or '-':14s} {result['backend']:8s} "
+              f"{before['p50_ms']:8.1f} -> {result['p50_ms']:8.1f} {p50_change:+7.1%}"
+              f"{result['ops_per_second']:10.1f} {ops_change:+7.1%}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scale", type=float, default=1.0, help="multiply fixture page counts")
+    parser.add_argument("--iterations", type=int, default=10)
+    parser.add_argument("--fixtures", default=",".join(FIXTURES))
+    parser.add_argument("--cases", default=",".join(CASES))
+    parser.add_argument("--backends", help="PDF backends to compare (default: every installed one)")
+    parser.add_argument("--output", help="JSON file for the results (default: benchmarks/results/<time>.json)")
+    parser.add_argument("--compare", nargs=2, metavar=("BASELINE", "RESULTS"))
+    parser.add_argument("--child", choices=CASES)
+    parser.add_argument("--fixture")
+    parser.add_argument("--backend", default="pypdf2")
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.child, args.fixture, args.iterations, args.backend)
+        return
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    from pdf_backends import available_backends, resolve_backend
+
+    cases = args.cases.split(",")
+    # A backend that is not installed falls back to pypdf2, which is measured anyway
+    backends = [resolve_backend(name) for name in args.backends.split(",")] if args.backends else available_backends()
+    backends = list(dict.fromkeys(backends))
+    fixture_dir = tempfile.mkdtemp()
+    fixtures = {}
+    for name in args.fixtures.split(","):
+        path = build_fixture(name, fixture_dir, args.scale)
+        fixtures[name] = path
+        print(f"fixture {name}: {os.path.getsize(path) / 1024 / 1024:.1f} MB")
+
+    results = []
+    for case in cases:
+        runs = [(None, None, "pypdf2")] if case == "parse_range_input" else [
+            (name, path, backend) for name, path in fixtures.items() for backend in backends
+        ]
+        for name, path, backend in runs:
+            result = dict(case=case, fixture=name, backend=backend, **run_case(case, path, args.iterations, backend))
+            results.append(result)
+            pages_per_second = result["pages_per_second"]
+            print(f"{case:18s} {name or '-':14s} {backend:8s} ops/s={result['ops_per_second']:9.1f} "
+                  f"pages/s={pages_per_second if pages_per_second else 0:9.1f} "
+                  f"p50={result['p50_ms']:8.2f}ms p99={result['p99_ms']:8.2f}ms "
+                  f"peak_rss={result['peak_rss_mb']:6.1f}MB")
+
+    output = args.output or os.path.join(
+        ROOT, "benchmarks", "results", time.strftime("%Y%m%d-%H%M%S") + ".json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump({
+            "environment": environment(),
+            "options": {"scale": args.scale, "iterations": args.iterations, "backends": backends},
+            "results": results,
+        }, f, indent=2)
+    print(f"results written to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+import functools
+import hashlib
+import os
+import time
+from email.utils import formatdate, parsedate_to_datetime
+
+from fastapi.responses import FileResponse, Response, StreamingResponse
+
+CHUNK_SIZE = 64 * 1024
+
+# Ways to hand the file body to the reverse proxy instead of sending it from Python
+OFFLOAD_HEADERS = {
+    "x-accel-redirect": "X-Accel-Redirect",  # nginx
+    "x-sendfile": "X-Sendfile",  # Apache mod_xsendfile, lighttpd
+}
+
+
+@functools.lru_cache(maxsize=4096)
+def _content_hash(path, size, inode):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def content_etag(path, stat_result):
+    """Strong ETag from the SHA-256 of the file.
+
+    Split outputs are never rewritten in place, so the hash is cached per
+    (path, size, inode); touching a file to extend its life keeps its ETag.
+    """
+    return f'"{_content_hash(path, stat_result.st_size, stat_result.st_ino)}"'
+
+
+def parse_byte_range(header, size):
+    """Parse a Range header into an inclusive (start, end) pair.
+
+    Returns None when the header should be ignored (not bytes, several ranges,
+    which we answer with the full file, or a syntactically invalid range such
+    as a last byte before the first) and raises ValueError when the range
+    cannot be satisfied.
+    """
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+
+    start, _, end = spec.strip().partition("-")
+    if start == "":
+        # Suffix range: the last N bytes
+        try:
+            length = int(end)
+        except ValueError:
+            return None
+        if length <= 0:
+            raise ValueError("Empty suffix range")
+        return max(0, size - length), size - 1
+
+    try:
+        start = int(start)
+        end = int(end) if end else max(start, size - 1)
+    except ValueError:
+        return None
+
+    if start > end:
+        # Invalid rather than unsatisfiable (RFC 7233, 2.1): the header is ignored
+        return None
+    if start >= size:
+        raise ValueError("Range not satisfiable")
+    return start, min(end, size - 1)
+
+
+def _http_date_to_timestamp(value):
+    try:
+        return parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError, IndexError):
+        return None
+
+
+def _etag_matches(header, etag):
+    tags = [tag.strip() for tag in header.split(",")]
+    return "*" in tags or etag in tags or f"W/{etag}" in tags
+
+
+def _iter_file_range(path, start, end):
+    with open(path, "rb") as f:
+        f.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = f.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def file_download_response(request, path, download_name, max_age, offload=None, offload_prefix="/",
+                           media_type="application/pdf"):
+    """Serve a split output with ETag, conditional GET, Range and proxy offload support.
+
+    max_age is how long the file has left before cleanup deletes it; it becomes
+    the Cache-Control max-age so a CDN never keeps a link alive past expiry.
+    offload is a key of OFFLOAD_HEADERS; the proxy then reads the file from
+    offload_prefix + the file name and handles Range itself.
+    """
+    stat_result = os.stat(path)
+    etag = content_etag(path, stat_result)
+    last_modified = formatdate(stat_result.st_mtime, usegmt=True)
+    remaining = max(0, int(stat_result.st_mtime + max_age - time.time()))
+
+    headers = {
+        "ETag": etag,
+        "Last-Modified": last_modified,
+        "Cache-Control": f"public, max-age={remaining}",
+        "Accept-Ranges": "bytes",
+    }
+
+    # Conditional GET: If-None-Match wins over If-Modified-Since
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        if _etag_matches(if_none_match, etag):
+            return Response(status_code=304, headers=headers)
+    else:
+        since = _http_date_to_timestamp(request.headers.get("if-modified-since"))
+        if since is not None and int(stat_result.st_mtime) <= since:
+            return Response(status_code=304, headers=headers)
+
+    if offload in OFFLOAD_HEADERS:
+        headers[OFFLOAD_HEADERS[offload]] = offload_prefix + os.path.basename(path)
+        headers["Content-Disposition"] = f'attachment; filename="{download_name}"'
+        return Response(status_code=200, headers=headers, media_type=media_type)
+
+    byte_range = None
+    range_header = request.headers.get("range")
+    if range_header:
+        # If-Range: only honour the Range if the client still has the same version
+        if_range = request.headers.get("if-range")
+        if if_range is None or if_range == etag or if_range == last_modified:
+            try:
+                byte_range = parse_byte_range(range_header, stat_result.st_size)
+            except ValueError:
+                headers["Content-Range"] = f"bytes */{stat_result.st_size}"
+                return Response(status_code=416, headers=headers)
+
+    if byte_range is None:
+        return FileResponse(path=path, filename=download_name, media_type=media_type,
+                            headers=headers, stat_result=stat_result)
+
+    start, end = byte_range
+    headers["Content-Range"] = f"bytes {start}-{end}/{stat_result.st_size}"
+    headers["Content-Length"] = str(end - start + 1)
+    headers["Content-Disposition"] = f'attachment; filename="{download_name}"'
+    return StreamingResponse(_iter_file_range(path, start, end), status_code=206,
+                             headers=headers, media_type=media_type)
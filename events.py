@@ -0,0 +1,66 @@
+import asyncio
+import json
+import time
+
+# Events that end a job's stream
+FINAL_EVENTS = ("finished", "failed")
+
+
+class JobEventLog:
+    """In-memory history of the progress events of the jobs running in this process.
+
+    Subscribers replay a job's history and then wait for new events, so a client
+    that connects late still sees every stage. Everything runs on the event
+    loop: publishing is a list append plus waking the waiting subscribers.
+    """
+
+    def __init__(self):
+        self._logs = {}
+
+    def open(self, job_id):
+        self._logs[job_id] = {"events": [], "changed": asyncio.Event(), "closed_at": None}
+
+    def __contains__(self, job_id):
+        return job_id in self._logs
+
+    def publish(self, job_id, event):
+        log = self._logs.get(job_id)
+        if log is None or log["closed_at"] is not None:
+            return
+        log["events"].append(event)
+        if event["event"] in FINAL_EVENTS:
+            log["closed_at"] = time.time()
+        # Wake every subscriber waiting on the current Event and give later waits a fresh one
+        log["changed"].set()
+        log["changed"] = asyncio.Event()
+
+    async def follow(self, job_id, keepalive=15):
+        """Yield the job's events from the first one until it finishes; None when idle for keepalive seconds."""
+        index = 0
+        while True:
+            log = self._logs.get(job_id)
+            if log is None:
+                return
+            while index < len(log["events"]):
+                yield log["events"][index]
+                index += 1
+            if log["closed_at"] is not None:
+                return
+            try:
+                await asyncio.wait_for(log["changed"].wait(), timeout=keepalive)
+            except asyncio.TimeoutError:
+                yield None
+
+    def purge(self, max_age):
+        """Drop the logs of jobs that ended more than max_age seconds ago."""
+        cutoff = time.time() - max_age
+        for job_id in [job_id for job_id, log in self._logs.items()
+                       if log["closed_at"] is not None and log["closed_at"] < cutoff]:
+            del self._logs[job_id]
+
+
+def format_sse(event):
+    """Encode an event dict as one Server-Sent Events message, or a comment line for None."""
+    if event is None:
+        return b": keep-alive\n\n"
+    return f"event: {event['event']}\ndata: {json.dumps(event)}\n\n".encode("utf-8")
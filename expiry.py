@@ -0,0 +1,78 @@
+import heapq
+import threading
+import time
+
+
+class ExpiryIndex:
+    """Min-heap of (expiry time, filename, size) for the files in an artifact store.
+
+    Files are added as they are written, so reaping only looks at the files
+    that are due instead of listing the whole store. A file whose mtime
+    was bumped since it was added (a result cache hit touches it) is pushed
+    back with its new expiry instead of being deleted.
+
+    The number and total size of the tracked files are kept up to date as
+    files come and go, for metrics that must not list the store.
+    """
+
+    def __init__(self, store, max_age):
+        self.store = store
+        self.max_age = max_age
+        self._heap = []
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._heap)
+
+    def usage(self):
+        """Number and total size in bytes of the files in the index."""
+        with self._lock:
+            return {"files": len(self._heap), "bytes": self._bytes}
+
+    def add(self, filename, size, mtime=None):
+        """Track a file of size bytes written to the store; mtime defaults to now."""
+        expires_at = (mtime if mtime is not None else time.time()) + self.max_age
+        with self._lock:
+            heapq.heappush(self._heap, (expires_at, filename, size))
+            self._bytes += size
+
+    def rebuild(self):
+        """Rebuild the index from the files in the store in one listing."""
+        entries = [(mtime + self.max_age, name, size) for name, mtime, size in self.store.list()]
+        heapq.heapify(entries)
+        with self._lock:
+            self._heap = entries
+            self._bytes = sum(size for _, _, size in entries)
+
+    def reap(self, now=None):
+        """Delete every file past its expiry and return how many were removed."""
+        now = now if now is not None else time.time()
+
+        # Pop under the lock, touch the store outside it so add() never waits on I/O
+        due = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                item = heapq.heappop(self._heap)
+                due.append(item)
+                self._bytes -= item[2]
+
+        removed = 0
+        extended = []
+        for _, filename, size in due:
+            try:
+                mtime = self.store.mtime(filename)
+            except FileNotFoundError:
+                continue
+            if mtime + self.max_age > now:
+                extended.append((mtime + self.max_age, filename, size))
+                continue
+            self.store.delete(filename)
+            removed += 1
+
+        if extended:
+            with self._lock:
+                for item in extended:
+                    heapq.heappush(self._heap, item)
+                    self._bytes += item[2]
+        return removed
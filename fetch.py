@@ -0,0 +1,396 @@
+import asyncio
+import contextlib
+import hashlib
+import queue
+import re
+import tempfile
+import threading
+from collections import namedtuple
+from urllib.parse import urlsplit
+
+import gdown
+import httpx
+
+try:
+    import h2  # noqa: F401  optional: pip install httpx[http2]
+    HTTP2 = True
+except ImportError:
+    HTTP2 = False
+
+# Add user agent to mimic a browser request
+DEFAULT_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.114 Safari/537.36',
+}
+
+CHUNK_SIZE = 64 * 1024
+
+# Downloads stay in memory up to this size, then spill to a temp file on disk
+SPOOL_MEMORY_SIZE = 8 * 1024 * 1024
+
+# PDF readers accept a little garbage before the header, so look this far for it
+HEADER_SEARCH_SIZE = 1024
+
+# Downloads report progress at most once per this many bytes
+PROGRESS_BYTES = 1024 * 1024
+
+# Idle connections the shared client keeps open, over all hosts
+KEEPALIVE_CONNECTIONS = 32
+
+# Answers worth another try: rate limiting and temporary server or gateway failures
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+# Longest wait between two tries, whatever Retry-After asks for
+MAX_RETRY_DELAY = 30
+
+
+class DownloadError(Exception):
+    """A download that failed or was rejected, with the HTTP status to report."""
+
+    def __init__(self, detail, status_code=400):
+        super().__init__(detail)
+        self.status_code = status_code
+
+
+# What a server that answers range requests told us about a file: its total size,
+# the first bytes and the validators for the requests that follow
+RangeProbe = namedtuple("RangeProbe", ["size", "head", "etag", "last_modified"])
+
+# Content-Range of a 206 answer: first byte, last byte, total size
+_CONTENT_RANGE = re.compile(r"bytes (\d+)-(\d+)/(\d+)")
+
+# A finished download; etag and last_modified are the validators for revalidating it
+Download = namedtuple("Download", ["file", "sha256", "size", "etag", "last_modified"])
+
+
+class PdfSpool:
+    """File-like sink for a streamed download.
+
+    Chunks go to `file`, by default a SpooledTemporaryFile, so only
+    SPOOL_MEMORY_SIZE bytes per download are ever held in RAM. The SHA-256 of
+    the content is computed on the way through. Writing fails as soon as the
+    data is larger than max_bytes or the first bytes are not a PDF header.
+
+    If given, progress is called with a "download" event dict every
+    PROGRESS_BYTES bytes and once more when the download is finished.
+    """
+
+    def __init__(self, max_bytes, source_name="The downloaded file", file=None, progress=None):
+        self.max_bytes = max_bytes
+        self.source_name = source_name
+        self.size = 0
+        self.total = None
+        self.file = file if file is not None else tempfile.SpooledTemporaryFile(max_size=SPOOL_MEMORY_SIZE)
+        self.sha256 = hashlib.sha256()
+        self.progress = progress
+        self._next_report = PROGRESS_BYTES
+        self._head = b""
+
+    def write(self, chunk):
+        self.size += len(chunk)
+        if self.max_bytes and self.size > self.max_bytes:
+            raise DownloadError(
+                f"{self.source_name} is larger than the {self.max_bytes} byte limit.", status_code=413
+            )
+
+        if self._head is not None:
+            self._head += chunk[:HEADER_SEARCH_SIZE]
+            if len(self._head) >= HEADER_SEARCH_SIZE:
+                self._check_header()
+
+        self.sha256.update(chunk)
+        self.file.write(chunk)
+
+        if self.progress and self.size >= self._next_report:
+            self._next_report = self.size + PROGRESS_BYTES
+            self.progress({"event": "download", "bytes": self.size, "total": self.total})
+        return len(chunk)
+
+    def reset(self):
+        """Drop everything written so far, before a download is tried again."""
+        self.file.seek(0)
+        self.file.truncate()
+        self.size = 0
+        self.sha256 = hashlib.sha256()
+        self._next_report = PROGRESS_BYTES
+        self._head = b""
+
+    def _check_header(self):
+        if b"%PDF-" not in self._head[:HEADER_SEARCH_SIZE]:
+            raise DownloadError(f"{self.source_name} is not a valid PDF.")
+        self._head = None
+
+    def finish(self, etag=None, last_modified=None):
+        """Return the Download, with the file rewound to the start, once every chunk is written."""
+        if self._head is not None:
+            self._check_header()
+        if self.progress:
+            self.progress({"event": "download", "bytes": self.size, "total": self.size, "done": True})
+        self.file.seek(0)
+        return Download(self.file, self.sha256.hexdigest(), self.size, etag, last_modified)
+
+    def close(self):
+        self.file.close()
+
+
+class RetryableStatus(Exception):
+    """A 429 or 5xx answer; retry_after is the server's Retry-After in seconds, if it sent one."""
+
+    def __init__(self, response):
+        super().__init__(f"the server answered {response.status_code} {response.reason_phrase}.")
+        value = response.headers.get("Retry-After", "")
+        self.retry_after = int(value) if value.isdigit() else None
+
+
+class _HostSlots:
+    """Download slots of one host, and how many downloads hold or wait for one."""
+
+    def __init__(self, count):
+        self.semaphore = asyncio.Semaphore(count)
+        self.users = 0
+
+
+class HttpFetcher:
+    """Async HTTP client for PDF downloads, shared by every request of a process.
+
+    One connection pool keeps connections to the hosts we hit alive between
+    downloads, and talks HTTP/2 to servers that offer it when h2 is installed.
+    At most connections_per_host downloads from one host run at a time.
+    Connection errors, timeouts and RETRY_STATUSES answers are tried again up
+    to retries times, after backoff, 2 * backoff, ... seconds or the server's
+    Retry-After.
+
+    The client belongs to the event loop it is first used on; aclose() drops
+    it, and the next download starts a new one.
+    """
+
+    def __init__(self, connections_per_host=4, timeout=60, retries=2, backoff=0.5):
+        self.connections_per_host = connections_per_host
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self._client = None
+        self._hosts = {}
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                http2=HTTP2, headers=DEFAULT_HEADERS, follow_redirects=True, timeout=self.timeout,
+                limits=httpx.Limits(max_connections=None, max_keepalive_connections=KEEPALIVE_CONNECTIONS)
+            )
+        return self._client
+
+    @contextlib.asynccontextmanager
+    async def _host_slots(self, url):
+        """Hold one of the connections_per_host slots of url's host for the with block."""
+        host = urlsplit(url).netloc
+        slots = self._hosts.get(host)
+        if slots is None:
+            slots = self._hosts[host] = _HostSlots(self.connections_per_host)
+        slots.users += 1
+        try:
+            async with slots.semaphore:
+                yield
+        finally:
+            slots.users -= 1
+            # Only hosts with downloads running or waiting are kept, so the map stays small
+            if not slots.users and self._hosts.get(host) is slots:
+                del self._hosts[host]
+
+    async def fetch_pdf(self, url, max_bytes, file=None, etag=None, last_modified=None, timeout=None, progress=None):
+        """Stream a PDF from an HTTP(S) URL into `file` (a spooled temp file by default).
+
+        Passing the etag / last_modified of an earlier Download makes this a
+        conditional GET; it then returns None if the server answers 304 Not Modified.
+        Raises DownloadError without reading the body when Content-Length is over max_bytes.
+        timeout overrides the fetcher's own for this download.
+        progress gets "download" events, see PdfSpool; it is called from a worker thread.
+        """
+        headers = {}
+        if etag:
+            headers["If-None-Match"] = etag
+        if last_modified:
+            headers["If-Modified-Since"] = last_modified
+
+        spool = PdfSpool(max_bytes, file=file, progress=progress)
+        try:
+            return await self._with_retries(url, lambda: self._fetch_once(url, headers, spool, timeout), spool.reset)
+        except BaseException:
+            spool.close()
+            raise
+
+    async def _with_retries(self, url, attempt_once, before_retry=None):
+        """Await attempt_once() under url's host slot, trying again on connection errors and RETRY_STATUSES."""
+        try:
+            for attempt in range(self.retries + 1):
+                try:
+                    async with self._host_slots(url):
+                        return await attempt_once()
+                except (httpx.TransportError, RetryableStatus) as e:
+                    if attempt == self.retries:
+                        raise
+                    retry_after = getattr(e, "retry_after", None)
+                    delay = retry_after if retry_after is not None else self.backoff * 2 ** attempt
+                if before_retry:
+                    before_retry()
+                await asyncio.sleep(min(delay, MAX_RETRY_DELAY))
+        except DownloadError:
+            raise
+        except Exception as e:
+            raise DownloadError(f"Error downloading file: {str(e)}")
+
+    async def _fetch_once(self, url, headers, spool, timeout):
+        async with self.client.stream("GET", url, headers=headers,
+                                      timeout=self.timeout if timeout is None else timeout) as response:
+            if response.status_code == 304:
+                spool.close()
+                return None
+            if response.status_code in RETRY_STATUSES:
+                raise RetryableStatus(response)
+            if response.is_error:
+                raise DownloadError(
+                    f"Error downloading file: the server answered {response.status_code} {response.reason_phrase}."
+                )
+
+            max_bytes = spool.max_bytes
+            content_length = response.headers.get("Content-Length")
+            if max_bytes and content_length and content_length.isdigit() and int(content_length) > max_bytes:
+                raise DownloadError(
+                    f"The downloaded file is {content_length} bytes, over the {max_bytes} byte limit.",
+                    status_code=413
+                )
+            if content_length and content_length.isdigit():
+                spool.total = int(content_length)
+
+            async for chunk in response.aiter_bytes(CHUNK_SIZE):
+                # Hashing and writing to disk run off the event loop
+                await asyncio.to_thread(spool.write, chunk)
+
+        return spool.finish(response.headers.get("ETag"), response.headers.get("Last-Modified"))
+
+    async def probe_ranges(self, url, length):
+        """Ask for the first length bytes of url, to find out whether its server answers range requests.
+
+        Returns a RangeProbe, or None if the server sent the whole file (the
+        body is then not read) or no total size.
+        """
+        async def probe_once():
+            headers = {"Range": f"bytes=0-{length - 1}"}
+            async with self.client.stream("GET", url, headers=headers) as response:
+                if response.status_code in RETRY_STATUSES:
+                    raise RetryableStatus(response)
+                if response.is_error:
+                    raise DownloadError(
+                        f"Error downloading file: the server answered {response.status_code} {response.reason_phrase}."
+                    )
+                match = _CONTENT_RANGE.match(response.headers.get("Content-Range", ""))
+                if response.status_code != 206 or match is None or int(match.group(1)) != 0:
+                    return None
+                head = await response.aread()
+                return RangeProbe(int(match.group(3)), head, response.headers.get("ETag"),
+                                  response.headers.get("Last-Modified"))
+
+        return await self._with_retries(url, probe_once)
+
+    async def fetch_range(self, url, start, end, validator=None):
+        """Return bytes start to end - 1 of url.
+
+        validator is the ETag or Last-Modified of an earlier RangeProbe; if the
+        file changed since, the server sends it whole and this raises DownloadError.
+        """
+        async def fetch_once():
+            headers = {"Range": f"bytes={start}-{end - 1}"}
+            if validator:
+                headers["If-Range"] = validator
+            async with self.client.stream("GET", url, headers=headers) as response:
+                if response.status_code in RETRY_STATUSES:
+                    raise RetryableStatus(response)
+                if response.is_error:
+                    raise DownloadError(
+                        f"Error downloading file: the server answered {response.status_code} {response.reason_phrase}."
+                    )
+                match = _CONTENT_RANGE.match(response.headers.get("Content-Range", ""))
+                if response.status_code != 206 or match is None or int(match.group(1)) != start:
+                    raise DownloadError("Error downloading file: the file changed on the server while it was being read.")
+                data = await response.aread()
+            if len(data) != end - start:
+                raise DownloadError(f"Error downloading file: asked for {end - start} bytes, got {len(data)}.")
+            return data
+
+        return await self._with_retries(url, fetch_once)
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+        self._client = None
+        self._hosts = {}
+
+
+class BlockingFetcher:
+    """HttpFetcher for synchronous code such as the Streamlit app.
+
+    The fetcher runs on an event loop in a daemon thread, so its connection
+    pool outlives each call. Progress events are handed back to the calling
+    thread, since Streamlit widgets can only be updated from the script's thread.
+    """
+
+    def __init__(self, **kwargs):
+        self.fetcher = HttpFetcher(**kwargs)
+        self._loop = asyncio.new_event_loop()
+        threading.Thread(target=self._loop.run_forever, daemon=True).start()
+
+    def fetch_pdf(self, url, max_bytes, progress=None, **kwargs):
+        events = queue.SimpleQueue()
+        future = asyncio.run_coroutine_threadsafe(
+            self.fetcher.fetch_pdf(url, max_bytes, progress=events.put if progress else None, **kwargs), self._loop
+        )
+        while progress and not (future.done() and events.empty()):
+            try:
+                progress(events.get(timeout=0.1))
+            except queue.Empty:
+                pass
+        return future.result()
+
+
+# Created on first use, so processes that never call stream_pdf start no thread
+_blocking_fetcher = None
+_blocking_fetcher_lock = threading.Lock()
+
+
+def blocking_fetcher():
+    """The BlockingFetcher shared by every synchronous caller in this process."""
+    global _blocking_fetcher
+    with _blocking_fetcher_lock:
+        if _blocking_fetcher is None:
+            _blocking_fetcher = BlockingFetcher()
+        return _blocking_fetcher
+
+
+def fetch_gdrive_pdf(url, max_bytes, file=None, progress=None):
+    """Download a PDF from Google Drive into `file` (a spooled temp file by default).
+
+    Google Drive gives us no validators, so the Download has no etag or last_modified.
+    """
+    spool = PdfSpool(max_bytes, source_name="The downloaded file from Google Drive", file=file, progress=progress)
+    try:
+        # gdown writes its chunks straight into the spool
+        output = gdown.download(url=url, output=spool, quiet=True, fuzzy=True)
+        if output is None:
+            raise DownloadError("Failed to download file from Google Drive.")
+        return spool.finish()
+    except DownloadError:
+        spool.close()
+        raise
+    except Exception as e:
+        spool.close()
+        raise DownloadError(f"Error downloading from Google Drive: {str(e)}")
+
+
+def stream_pdf(url, max_bytes, timeout=60, progress=None):
+    """Stream a PDF from an HTTP(S) URL through the shared pool and return the spooled temp file."""
+    return blocking_fetcher().fetch_pdf(url, max_bytes, timeout=timeout, progress=progress).file
+
+
+def stream_gdrive_pdf(url, max_bytes, progress=None):
+    """Download a PDF from Google Drive and return the spooled temp file."""
+    return fetch_gdrive_pdf(url, max_bytes, progress=progress).file
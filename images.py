@@ -0,0 +1,85 @@
+import io
+import zlib
+
+try:
+    from PIL import Image
+except ImportError:  # optional: pip install Pillow
+    Image = None
+
+# JPEG quality used when only image_dpi is given and a JPEG has to be written again
+DEFAULT_JPEG_QUALITY = 85
+
+# Images are only downsampled when they are this much sharper than the target, like
+# Ghostscript's DownsampleThreshold; a slightly sharper image is not worth the loss
+RESAMPLE_THRESHOLD = 1.25
+
+# Color spaces that are written back unchanged around 8-bit gray or RGB samples
+IMAGE_MODES = {"/DeviceGray": "L", "/DeviceRGB": "RGB", 1: "L", 3: "RGB"}
+
+
+def available():
+    """Whether images can be downsampled and re-encoded here (Pillow is installed)."""
+    return Image is not None
+
+
+def image_mode(color_space, bits, keys):
+    """"L" or "RGB" for an image this module can rewrite, None for anything else.
+
+    color_space is a device color space name or the component count of an
+    ICCBased one; keys are the other entries of the image dictionary. Masks,
+    decode arrays, indexed and CMYK images are left alone, since re-encoding
+    them as JPEG would change what they look like.
+    """
+    if bits != 8 or not isinstance(color_space, (str, int)):
+        return None
+    if any(key in keys for key in ("/ImageMask", "/Decode", "/Mask", "/Matte")):
+        return None
+    return IMAGE_MODES.get(color_space)
+
+
+def target_size(width, height, page_width, page_height, dpi):
+    """Pixel size to downsample a width x height image to, or None to keep it.
+
+    page_width and page_height are in points, of the largest page that draws
+    the image. The image is assumed to cover at most that page, so its real
+    resolution is at least the one estimated here and never ends up below dpi.
+    """
+    if not dpi or page_width <= 0 or page_height <= 0:
+        return None
+    resolution = min(width * 72 / page_width, height * 72 / page_height)
+    if resolution <= dpi * RESAMPLE_THRESHOLD:
+        return None
+    scale = dpi / resolution
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def rewrite_image(image, size, quality, was_jpeg):
+    """Encode a PIL image for a PDF, downsampled to size if given.
+
+    Returns (filter name, data, width, height). The result is a JPEG when a
+    quality was asked for or the image already was one; otherwise it stays
+    lossless (Flate).
+    """
+    if size is not None and size != image.size:
+        image = image.resize(size, Image.LANCZOS)
+    if quality or was_jpeg:
+        buffer = io.BytesIO()
+        image.save(buffer, "JPEG", quality=quality or DEFAULT_JPEG_QUALITY, optimize=True)
+        return "/DCTDecode", buffer.getvalue(), image.width, image.height
+    return "/FlateDecode", zlib.compress(image.tobytes()), image.width, image.height
+
+
+def open_image(data, filter_name, width, height, mode):
+    """A PIL image of stream data with a single DCTDecode or FlateDecode filter (data already inflated).
+
+    Returns None when the samples do not match the image dictionary.
+    """
+    if filter_name == "/DCTDecode":
+        image = Image.open(io.BytesIO(data))
+        if image.mode != mode or image.size != (width, height):
+            return None
+        image.load()
+        return image
+    if len(data) < width * height * len(mode):
+        return None
+    return Image.frombytes(mode, (width, height), data[:width * height * len(mode)])
@@ -0,0 +1,154 @@
+import abc
+import contextlib
+import copy
+import json
+import sqlite3
+import threading
+import time
+import uuid
+
+# Job statuses
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+
+
+def new_job(kind):
+    """Create the initial record for a split job."""
+    now = time.time()
+    return {
+        "job_id": uuid.uuid4().hex,
+        "kind": kind,
+        "status": JOB_QUEUED,
+        "created_at": now,
+        "updated_at": now,
+        "progress": {
+            "total_pages": None,
+            "ranges_total": None,
+            "ranges_completed": 0,
+            "pages_written": 0,
+            "bytes_downloaded": 0,
+            "bytes_written": 0,
+        },
+        "result": None,
+        "error": None,
+    }
+
+
+class JobStore(abc.ABC):
+    """Where split jobs are kept. Jobs are plain dicts as built by new_job."""
+
+    @abc.abstractmethod
+    def create(self, kind):
+        """Create a queued job of the given kind and return it."""
+
+    @abc.abstractmethod
+    def get(self, job_id):
+        """The job with job_id, or None if it does not exist or expired."""
+
+    @abc.abstractmethod
+    def update(self, job_id, **fields):
+        """Set fields of a job and bump its updated_at; a missing job is ignored."""
+
+    @abc.abstractmethod
+    def purge(self, max_age):
+        """Delete jobs not updated in the last max_age seconds."""
+
+
+class InMemoryJobStore(JobStore):
+    """Job store for a single process; jobs are lost on restart."""
+
+    def __init__(self):
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def create(self, kind):
+        job = new_job(kind)
+        with self._lock:
+            self._jobs[job["job_id"]] = job
+        return copy.deepcopy(job)
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return copy.deepcopy(job)
+
+    def update(self, job_id, **fields):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return
+            job.update(fields)
+            job["updated_at"] = time.time()
+
+    def purge(self, max_age):
+        cutoff = time.time() - max_age
+        with self._lock:
+            for job_id in [job_id for job_id, job in self._jobs.items() if job["updated_at"] < cutoff]:
+                del self._jobs[job_id]
+
+
+class SqliteJobStore(JobStore):
+    """Job store in a SQLite file, so every uvicorn worker on the host sees the same jobs."""
+
+    def __init__(self, path):
+        self.path = path
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "job_id TEXT PRIMARY KEY, updated_at REAL NOT NULL, data TEXT NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_updated_at ON jobs (updated_at)")
+
+    @contextlib.contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def create(self, kind):
+        job = new_job(kind)
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO jobs (job_id, updated_at, data) VALUES (?, ?, ?)",
+                (job["job_id"], job["updated_at"], json.dumps(job))
+            )
+        return job
+
+    def get(self, job_id):
+        with self._connect() as conn:
+            row = conn.execute("SELECT data FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def update(self, job_id, **fields):
+        with self._connect() as conn:
+            # BEGIN IMMEDIATE so concurrent read-modify-write updates don't lose fields
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute("SELECT data FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+            if row is None:
+                return
+            job = json.loads(row[0])
+            job.update(fields)
+            job["updated_at"] = time.time()
+            conn.execute(
+                "UPDATE jobs SET updated_at = ?, data = ? WHERE job_id = ?",
+                (job["updated_at"], json.dumps(job), job_id)
+            )
+
+    def purge(self, max_age):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM jobs WHERE updated_at < ?", (time.time() - max_age,))
+
+
+def create_job_store(backend, sqlite_path=None):
+    """Build the job store named by backend ("memory" or "sqlite")."""
+    if backend == "memory":
+        return InMemoryJobStore()
+    if backend == "sqlite":
+        return SqliteJobStore(sqlite_path)
+    raise ValueError(f"Unknown job store backend: {backend}")
@@ -0,0 +1,192 @@
+import bisect
+import contextlib
+import contextvars
+import threading
+import time
+
+# Upper bounds in seconds, from a cached range lookup up to a multi-minute split
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+# Stage timings of the request being handled, read by ServerTimingMiddleware
+request_timings = contextvars.ContextVar("request_timings", default=None)
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    pairs = ",".join(f'{name}="{str(value)}"' for name, value in labels)
+    return "{" + pairs + "}"
+
+
+class Counter:
+    """Monotonic counter, optionally split by the value of one label."""
+
+    kind = "counter"
+
+    def __init__(self, name, documentation, label=None):
+        self.name = name
+        self.documentation = documentation
+        self.label = label
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, label_value=None):
+        with self._lock:
+            self._values[label_value] = self._values.get(label_value, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+        for label_value, value in sorted(values.items(), key=lambda item: str(item[0])):
+            labels = ((self.label, label_value),) if self.label else ()
+            yield self.name, labels, value
+
+
+class Gauge:
+    """Value read from read() at scrape time, so nothing is tracked between scrapes.
+
+    read returns a number, or a dict of label value -> number when label is set.
+    """
+
+    kind = "gauge"
+
+    def __init__(self, name, documentation, read, label=None):
+        self.name = name
+        self.documentation = documentation
+        self.label = label
+        self.read = read
+
+    def samples(self):
+        value = self.read()
+        if not self.label:
+            yield self.name, (), value
+            return
+        for label_value, item in sorted(value.items()):
+            yield self.name, ((self.label, label_value),), item
+
+
+class Histogram:
+    """Cumulative histogram, optionally split by the value of one label."""
+
+    kind = "histogram"
+
+    def __init__(self, name, documentation, label=None, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.label = label
+        self.buckets = tuple(buckets)
+        # label value -> [per-bucket counts (last one is +Inf), sum]
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, label_value=None):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(label_value)
+            if entry is None:
+                entry = self._values[label_value] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][index] += 1
+            entry[1] += value
+
+    def samples(self):
+        with self._lock:
+            values = {label_value: (list(counts), total) for label_value, (counts, total) in self._values.items()}
+        for label_value, (counts, total) in sorted(values.items(), key=lambda item: str(item[0])):
+            labels = ((self.label, label_value),) if self.label else ()
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                yield f"{self.name}_bucket", labels + (("le", _format_value(bound)),), cumulative
+            yield f"{self.name}_sum", labels, total
+            yield f"{self.name}_count", labels, cumulative
+
+
+class MetricsRegistry:
+    """The metrics of this process, rendered in the Prometheus text format."""
+
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+class StageTimer:
+    """Record how long each stage of a request takes.
+
+    Every stage goes into one histogram labelled by stage, and into the
+    Server-Timing header of the request it ran for, if any.
+    """
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def record(self, stage, seconds):
+        self.histogram.observe(seconds, stage)
+        timings = request_timings.get()
+        if timings is not None:
+            timings[stage] = timings.get(stage, 0.0) + seconds
+
+    @contextlib.contextmanager
+    def time(self, stage):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - started)
+
+
+def format_server_timing(timings):
+    """Server-Timing header value, durations in milliseconds."""
+    return ", ".join(f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in timings.items())
+
+
+class ServerTimingMiddleware:
+    """ASGI middleware that collects the stage timings of each request into a Server-Timing header.
+
+    The header lists the stages that finished before the response started,
+    plus "total", the time from the request arriving to the response starting.
+    A plain ASGI wrapper rather than BaseHTTPMiddleware, so streamed responses
+    are passed through untouched.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        timings = {}
+        token = request_timings.set(timings)
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                timings["total"] = time.perf_counter() - started
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", format_server_timing(timings).encode("latin-1")))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            request_timings.reset(token)
@@ -0,0 +1,288 @@
+import io
+import logging
+import os
+
+try:
+    import pikepdf
+except ImportError:  # optional: pip install pikepdf
+    pikepdf = None
+
+try:
+    import pymupdf
+except ImportError:  # optional: pip install pymupdf
+    pymupdf = None
+
+import images
+from pdf_utils import PdfDocument, LOSSLESS_PROFILE, rewrite_image
+
+logger = logging.getLogger(__name__)
+
+# pypdf2 is pure Python and always available; pikepdf (qpdf) and pymupdf (MuPDF) are C engines
+BACKENDS = ("pypdf2", "pikepdf", "pymupdf")
+
+
+def available_backends():
+    """The backends that can be used in this environment, in BACKENDS order."""
+    installed = {"pypdf2": True, "pikepdf": pikepdf is not None, "pymupdf": pymupdf is not None}
+    return [name for name in BACKENDS if installed[name]]
+
+
+def resolve_backend(name):
+    """Return name if its engine is installed, otherwise fall back to pypdf2.
+
+    Raises ValueError for a name that is not a backend at all, since that is a
+    configuration mistake rather than a missing package.
+    """
+    name = (name or "pypdf2").lower()
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown PDF backend {name!r}, expected one of: {', '.join(BACKENDS)}.")
+    if name not in available_backends():
+        logger.warning("PDF backend %r is not installed, falling back to 'pypdf2'.", name)
+        return "pypdf2"
+    return name
+
+
+class _SizeCounter(io.RawIOBase):
+    """Seekable sink that keeps only the size of what is saved into it."""
+
+    def __init__(self):
+        self.size = 0
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def write(self, data):
+        self._position += len(data)
+        self.size = max(self.size, self._position)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self._position, io.SEEK_END: self.size}[whence]
+        self._position = base + offset
+        return self._position
+
+
+def saved_size(save):
+    """Size of what save(stream) writes, without keeping it."""
+    counter = _SizeCounter()
+    save(counter)
+    return counter.size
+
+
+def open_document(source, backend="pypdf2"):
+    """Parse source (a path or a binary stream) with the given backend.
+
+    Every document has total_pages, extract_pages(start_idx, end_idx) and
+    close(), so split_pdf works the same on all of them.
+    """
+    if backend == "pikepdf":
+        return PikePdfDocument(source)
+    if backend == "pymupdf":
+        return PyMuPdfDocument(source)
+    return PdfDocument(source)
+
+
+class PikePdfDocument:
+    """A PDF opened with pikepdf; qpdf reads objects from the file as they are used."""
+
+    def __init__(self, source):
+        self.source = source
+        if isinstance(source, (str, os.PathLike)):
+            self.pdf = pikepdf.open(source)
+        else:
+            source.seek(0)
+            self.pdf = pikepdf.open(source)
+        self.total_pages = len(self.pdf.pages)
+
+    def extract_pages(self, start_idx, end_idx):
+        """A new part holding pages start_idx to end_idx - 1; resources shared by them are copied once."""
+        part = pikepdf.new()
+        part.pages.extend(self.pdf.pages[start_idx:end_idx])
+        return PikePdfPart(part)
+
+    def bookmark_pages(self):
+        """Zero-based page indexes of the top-level bookmarks."""
+        with self.pdf.open_outline() as outline:
+            for item in outline.root:
+                try:
+                    destination = self._resolve_destination(item)
+                    if isinstance(destination, pikepdf.Array) and len(destination):
+                        yield pikepdf.Page(destination[0]).index
+                except Exception:
+                    continue
+
+    def _resolve_destination(self, item):
+        destination = item.destination
+        # Many producers link bookmarks through a GoTo action instead of /Dest
+        if destination is None and item.action is not None and item.action.get("/S") == "/GoTo":
+            destination = item.action.get("/D")
+        if isinstance(destination, (pikepdf.String, pikepdf.Name)):
+            # Named destination, from the /Dests name tree or the older /Dests dictionary
+            root = self.pdf.Root
+            if "/Names" in root and "/Dests" in root.Names:
+                destination = pikepdf.NameTree(root.Names.Dests).get(str(destination))
+            elif "/Dests" in root:
+                destination = root.Dests.get(str(destination))
+        if isinstance(destination, pikepdf.Dictionary):
+            destination = destination.get("/D")
+        return destination
+
+    def close(self):
+        self.pdf.close()
+
+
+class PikePdfPart:
+    """A split part made by pikepdf, written with PdfWriter's write(stream) interface."""
+
+    # qpdf does not report what it merges, compresses or leaves out
+    UNMEASURED_STATS = ("objects_deduplicated", "objects_dropped", "streams_compressed", "compressions_reused")
+
+    def __init__(self, pdf):
+        self.pdf = pdf
+        self.optimized = False
+        self.plain_size = None
+
+    @property
+    def pages(self):
+        return self.pdf.pages
+
+    def optimize(self, shared):
+        # qpdf does not merge identical objects; it packs objects into compressed object streams,
+        # and leaves out objects nothing refers to when saving
+        self.plain_size = saved_size(self.pdf.save)
+        self.optimized = True
+        self.pdf.remove_unreferenced_resources()
+        if shared.profile != LOSSLESS_PROFILE:
+            self._rewrite_images(shared)
+
+    def _rewrite_images(self, shared):
+        # The largest page each image is drawn on, by object, like the PyPDF2 parts
+        image_pages = {}
+        for page in self.pdf.pages:
+            box = page.mediabox
+            page_size = (float(box[2]) - float(box[0]), float(box[3]) - float(box[1]))
+            for image in page.images.values():
+                width, height = image_pages.get(image.objgen, (None, (0, 0)))[1]
+                image_pages[image.objgen] = (image, (max(width, page_size[0]), max(height, page_size[1])))
+
+        for image, page_size in image_pages.values():
+            filter_name = image.get("/Filter")
+            if isinstance(filter_name, pikepdf.Array):
+                filter_name = filter_name[0] if len(filter_name) == 1 else None
+                if filter_name is None:
+                    continue
+            color_space = image.get("/ColorSpace")
+            if isinstance(color_space, pikepdf.Array) and len(color_space) == 2 and color_space[0] == "/ICCBased":
+                color_space = int(color_space[1].get("/N", 0))
+            elif isinstance(color_space, pikepdf.Name):
+                color_space = str(color_space)
+            mode = images.image_mode(color_space, int(image.get("/BitsPerComponent", 0)), image.keys())
+            result = rewrite_image(
+                shared, image.read_raw_bytes(), str(filter_name) if filter_name is not None else None, mode,
+                int(image.get("/Width", 0)), int(image.get("/Height", 0)), page_size, image.read_bytes
+            )
+            if result is None:
+                continue
+            filter_name, data, width, height = result
+            if "/DecodeParms" in image:
+                del image.DecodeParms
+            image.write(data, filter=pikepdf.Name(filter_name))
+            image.Width, image.Height, image.BitsPerComponent = width, height, 8
+
+    def write(self, stream):
+        if self.optimized:
+            self.pdf.save(stream, compress_streams=True, object_stream_mode=pikepdf.ObjectStreamMode.generate)
+        else:
+            self.pdf.save(stream)
+
+
+class PyMuPdfDocument:
+    """A PDF opened with PyMuPDF."""
+
+    def __init__(self, source):
+        self.source = source
+        if isinstance(source, (str, os.PathLike)):
+            self.doc = pymupdf.open(source, filetype="pdf")
+        else:
+            source.seek(0)
+            self.doc = pymupdf.open(stream=source.read(), filetype="pdf")
+        self.total_pages = self.doc.page_count
+
+    def extract_pages(self, start_idx, end_idx):
+        """A new part holding pages start_idx to end_idx - 1; resources shared by them are copied once."""
+        part = pymupdf.open()
+        part.insert_pdf(self.doc, from_page=start_idx, to_page=end_idx - 1)
+        return PyMuPdfPart(part)
+
+    def bookmark_pages(self):
+        """Zero-based page indexes of the top-level bookmarks."""
+        for level, _, page_number in self.doc.get_toc(simple=True):
+            if level == 1 and page_number > 0:
+                yield page_number - 1
+
+    def close(self):
+        self.doc.close()
+
+
+class PyMuPdfPart:
+    """A split part made by PyMuPDF, written with PdfWriter's write(stream) interface."""
+
+    # MuPDF does not report what it merges, compresses or leaves out, and rewrites images without SharedResources
+    UNMEASURED_STATS = (
+        "objects_deduplicated", "objects_dropped", "streams_compressed", "compressions_reused", "images_reused",
+        "seconds_saved"
+    )
+
+    def __init__(self, doc):
+        self.doc = doc
+        self.optimized = False
+        self.plain_size = None
+
+    @property
+    def pages(self):
+        return range(self.doc.page_count)
+
+    def optimize(self, shared):
+        # Sanitizing the page contents leaves out the resources they never use; garbage=4 then
+        # drops the objects nothing refers to and merges identical ones, deflate compresses the rest
+        self.plain_size = saved_size(self.doc.save)
+        self.optimized = True
+        for page in self.doc:
+            page.clean_contents(sanitize=True)
+        profile = shared.profile
+        if profile != LOSSLESS_PROFILE:
+            # MuPDF measures the resolution each image is drawn at and rewrites the images itself;
+            # it downsamples by halving, so an image can stay somewhat above dpi
+            dpi = profile.image_dpi or 0
+            before = self._image_sizes()
+            self.doc.rewrite_images(
+                dpi_threshold=round(dpi * images.RESAMPLE_THRESHOLD) if dpi else None, dpi_target=dpi,
+                quality=profile.image_quality or images.DEFAULT_JPEG_QUALITY
+            )
+            # A rewritten image is a new object in place of the old one; images it kept stay where they were
+            after = self._image_sizes()
+            rewritten = after.keys() - before.keys()
+            shared.stats["images_rewritten"] += len(rewritten)
+            shared.stats["image_bytes_before"] += sum(before[xref] for xref in before.keys() - after.keys())
+            shared.stats["image_bytes_after"] += sum(after[xref] for xref in rewritten)
+
+    def _image_sizes(self):
+        """Stored size of every image the pages draw, by xref."""
+        return {
+            image[0]: len(self.doc.xref_stream_raw(image[0]))
+            for page in self.doc for image in page.get_images()
+        }
+
+    def write(self, stream):
+        # save() writes front to back through the stream, so the serialized part is never built in memory
+        if self.optimized:
+            self.doc.save(stream, garbage=4, deflate=True)
+        else:
+            self.doc.save(stream)
@@ -0,0 +1,835 @@
+import collections
+import hashlib
+import io
+import mmap
+import os
+import re
+import time
+import zlib
+
+import PyPDF2
+from PyPDF2.generic import (
+    ArrayObject, DictionaryObject, EncodedStreamObject, IndirectObject, NameObject, NullObject, NumberObject,
+    StreamObject
+)
+
+import images
+
+
+# Page attributes a page takes from its /Pages ancestors when it has none of its own
+INHERITABLE_PAGE_ATTRIBUTES = ("/Resources", "/MediaBox", "/CropBox", "/Rotate")
+
+
+class PdfDocument:
+    """A PDF parsed once and shared by validation, page counting and splitting.
+
+    Creating it reads the xref and the root of the page tree, so a PdfDocument
+    that was built without raising has a readable structure. The page count
+    comes from the root /Count and pages are looked up one at a time by
+    descending the tree, so a few pages of a huge document never load the
+    other page objects. A path is memory-mapped rather than read into a
+    BytesIO, so objects are paged in from the file as they are used.
+    """
+
+    def __init__(self, source):
+        self.source = source
+        self._mmap = None
+        if isinstance(source, (str, os.PathLike)):
+            with open(source, "rb") as f:
+                # The mapping stays valid after the file is closed
+                self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            source = self._mmap
+        elif hasattr(source, "seek"):
+            source.seek(0)
+        self.reader = PyPDF2.PdfReader(source)
+        self._root_pages = self.reader.trailer["/Root"].get_object()["/Pages"].get_object()
+
+        count = self._root_pages.get("/Count")
+        if isinstance(count, int) and count >= 0 and not self.reader.is_encrypted:
+            self.total_pages = int(count)
+        else:
+            # No usable /Count: flatten the tree like PyPDF2 does
+            self.total_pages = len(self.reader.pages)
+
+    def extract_pages(self, start_idx, end_idx):
+        """A new PdfWriter holding pages start_idx to end_idx - 1."""
+        pdf_writer = PyPDF2.PdfWriter()
+        for page_num in range(start_idx, end_idx):
+            pdf_writer.add_page(self.get_page(page_num))
+        return pdf_writer
+
+    def bookmark_pages(self):
+        """Zero-based page indexes of the top-level bookmarks."""
+        for item in self.reader.outline:
+            # Nested lists hold the children of the previous bookmark
+            if isinstance(item, list):
+                continue
+            try:
+                yield self.reader.get_destination_page_number(item)
+            except Exception:
+                continue
+
+    def get_page(self, index):
+        """Return page `index` (zero-based), loading only the page tree nodes on its path."""
+        if self.reader.flattened_pages is not None:
+            return self.reader.pages[index]
+        try:
+            page = self._find_page(index)
+        except Exception:
+            page = None
+        # A /Count that disagrees with the tree: fall back to the full walk
+        return page if page is not None else self.reader.pages[index]
+
+    def _find_page(self, index):
+        node = self._root_pages
+        node_ref = None
+        inherited = {}
+        while True:
+            for name in INHERITABLE_PAGE_ATTRIBUTES:
+                if name in node:
+                    inherited[name] = dict.__getitem__(node, name)
+            if node.get("/Type") == "/Page":
+                if index != 0:
+                    return None
+                page = PyPDF2.PageObject(self.reader, node_ref if isinstance(node_ref, IndirectObject) else None)
+                page.update(node)
+                for name, value in inherited.items():
+                    if name not in page:
+                        page[NameObject(name)] = value
+                return page
+
+            kids = node["/Kids"]
+            # A node whose count equals its number of kids holds one page per kid, unless it mixes
+            # empty /Pages nodes with larger ones, which writers do not produce: index directly,
+            # so a lookup only loads the nodes on its path. When that kid is a /Pages node, count
+            # through the kids below instead
+            if node.get("/Count") == len(kids) and index < len(kids):
+                kid = kids[index].get_object()
+                if kid.get("/Type") == "/Page":
+                    node, node_ref, index = kid, kids[index], 0
+                    continue
+
+            for kid_ref in kids:
+                kid = kid_ref.get_object()
+                count = kid.get("/Count", 1) if kid.get("/Type") == "/Pages" else 1
+                if index < count:
+                    node, node_ref = kid, kid_ref
+                    break
+                index -= count
+            else:
+                return None
+
+    def close(self):
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+
+
+def split_pdf(input_pdf, ranges, progress=None):
+    """Split a PDF file based on the provided page ranges.
+
+    Args:
+        input_pdf: A document from pdf_backends.open_document (a PdfDocument by
+            default), or a path / binary stream to parse with PyPDF2
+        ranges: A list of tuples containing (start_page, end_page)
+        progress: Optional callable, given a "range_split" event dict after each range
+
+    Returns:
+        A list of PDF writer objects: PyPDF2 PdfWriters, or the other backend's
+        parts, which have the same write(stream) method and pages
+    """
+    document = input_pdf if hasattr(input_pdf, "extract_pages") else PdfDocument(input_pdf)
+    total_pages = document.total_pages
+
+    # Create a list to store all the split PDFs
+    output_pdfs = []
+
+    for page_range in ranges:
+        start_page, end_page = page_range
+
+        # Adjust for zero-based indexing and ensure within bounds
+        start_idx = max(0, start_page - 1)
+        end_idx = min(end_page, total_pages)
+
+        if start_idx < total_pages and start_idx <= end_idx:
+            # Create a PDF writer holding the specified pages
+            pdf_writer = document.extract_pages(start_idx, end_idx)
+
+            # Add to our list of output PDFs
+            output_pdfs.append(pdf_writer)
+
+            if progress:
+                progress({"event": "range_split", "range": f"{start_page}-{end_page}",
+                          "index": len(output_pdfs), "ranges_total": len(ranges)})
+
+    return output_pdfs
+
+
+def partition_ranges(ranges, parts):
+    """Split a list of (start_page, end_page) tuples into at most `parts` consecutive groups.
+
+    Groups hold roughly the same number of pages rather than the same number of
+    ranges, and concatenating them gives back the original list, so per-group
+    results can be joined in request order.
+    """
+    parts = max(1, min(parts, len(ranges)))
+    pages = [max(0, end - start + 1) for start, end in ranges]
+    pages_left = sum(pages)
+
+    groups = []
+    current = []
+    current_pages = 0
+    for i, page_range in enumerate(ranges):
+        current.append(page_range)
+        current_pages += pages[i]
+        groups_left = parts - len(groups) - 1
+        ranges_left = len(ranges) - i - 1
+        # Close the group once it has its share of the pages still unassigned,
+        # but leave at least one range for each remaining group
+        if groups_left and (current_pages >= pages_left / (groups_left + 1) or ranges_left == groups_left):
+            groups.append(current)
+            pages_left -= current_pages
+            current = []
+            current_pages = 0
+    if current:
+        groups.append(current)
+    return groups
+
+
+# A server-side way of choosing the page ranges:
+# ("pages", N) makes N-page chunks, ("bookmarks", None) one part per top-level
+# bookmark and ("size", N) parts of about N bytes each
+SplitStrategy = collections.namedtuple("SplitStrategy", ["mode", "value"])
+
+# Rough size of a page dictionary and its cross-reference entry in an output file
+PAGE_OVERHEAD_BYTES = 200
+
+
+def chunk_ranges(total_pages, pages_per_part):
+    """Consecutive (start_page, end_page) tuples of pages_per_part pages covering the document."""
+    return [
+        (start, min(start + pages_per_part - 1, total_pages))
+        for start in range(1, total_pages + 1, pages_per_part)
+    ]
+
+
+def bookmark_ranges(document):
+    """One (start_page, end_page) tuple per top-level bookmark, in page order.
+
+    Pages before the first bookmark become a part of their own. Returns an
+    empty list when the PDF has no usable bookmarks.
+    """
+    starts = set()
+    for page_index in document.bookmark_pages():
+        if 0 <= page_index < document.total_pages:
+            starts.add(page_index + 1)
+
+    if not starts:
+        return []
+    starts.add(1)
+    starts = sorted(starts)
+    ends = [start - 1 for start in starts[1:]] + [document.total_pages]
+    return list(zip(starts, ends))
+
+
+def _page_objects(reader, value, sizes, children, found):
+    """Add every object number reachable from value to found, recording stream sizes.
+
+    sizes and children are memoized across calls, so every object of the
+    document is loaded at most once however many pages share it.
+    """
+    if isinstance(value, IndirectObject):
+        idnum = value.idnum
+        if idnum in found:
+            return
+        found.add(idnum)
+        if idnum not in children:
+            obj = reader.get_object(value)
+            # Never follow links back into the page tree
+            if isinstance(obj, DictionaryObject) and obj.get("/Type") in ("/Page", "/Pages"):
+                sizes[idnum] = 0
+                children[idnum] = []
+                return
+            sizes[idnum] = len(obj._data) if isinstance(obj, StreamObject) else 0
+            children[idnum] = [obj]
+        for child in children[idnum]:
+            _page_objects(reader, child, sizes, children, found)
+    elif isinstance(value, DictionaryObject):
+        for key, item in dict.items(value):
+            if key not in ("/Parent", "/P"):
+                _page_objects(reader, item, sizes, children, found)
+    elif isinstance(value, ArrayObject):
+        for item in value:
+            _page_objects(reader, item, sizes, children, found)
+
+
+def size_ranges(document, target_bytes):
+    """Consecutive (start_page, end_page) tuples whose parts come out at about target_bytes.
+
+    Each page's size is estimated from the raw length of the streams it uses
+    (contents, fonts, images), counting a resource shared by several pages of
+    a part only once. A page bigger than the target gets a part of its own.
+    """
+    reader = document.reader
+    sizes = {}
+    children = {}
+    ranges = []
+    start = None
+    part_objects = set()
+    part_bytes = 0
+
+    for page_num, page in enumerate(reader.pages, start=1):
+        page_objects = set()
+        for key, item in dict.items(page):
+            if key not in ("/Parent", "/Annots"):
+                _page_objects(reader, item, sizes, children, page_objects)
+
+        added = page_objects - part_objects
+        added_bytes = sum(sizes[idnum] for idnum in added) + PAGE_OVERHEAD_BYTES
+        if start is not None and part_bytes + added_bytes > target_bytes:
+            ranges.append((start, page_num - 1))
+            start = None
+
+        if start is None:
+            start = page_num
+            part_objects = set(page_objects)
+            part_bytes = sum(sizes[idnum] for idnum in page_objects) + PAGE_OVERHEAD_BYTES
+        else:
+            part_objects |= added
+            part_bytes += added_bytes
+
+    if start is not None:
+        ranges.append((start, document.total_pages))
+    return ranges
+
+
+def strategy_ranges(document, strategy):
+    """Compute the (start_page, end_page) tuples of a SplitStrategy for a parsed document."""
+    if strategy.mode == "pages":
+        return chunk_ranges(document.total_pages, strategy.value)
+    if strategy.mode == "bookmarks":
+        return bookmark_ranges(document)
+    if strategy.mode == "size":
+        # The estimate reads raw stream lengths through PyPDF2's lazy objects, whatever the backend
+        if not isinstance(document, PdfDocument):
+            document = PdfDocument(document.source)
+        return size_ranges(document, strategy.value)
+    raise ValueError(f"Unknown split strategy: {strategy.mode}")
+
+# Objects that must stay separate even when identical, e.g. a page can only appear once in the page tree
+UNIQUE_TYPES = ("/Page", "/Pages", "/Catalog", "/Annot")
+
+# What optimize does to every part: streams are always compressed and unused or duplicate
+# objects dropped; with image_dpi, images sharper than that are downsampled, and with
+# image_quality they are re-encoded as JPEG at that quality
+OutputProfile = collections.namedtuple("OutputProfile", ["image_dpi", "image_quality"])
+LOSSLESS_PROFILE = OutputProfile(None, None)
+
+# Resource categories whose unused entries are dropped from a page; they hold the big streams
+PRUNED_RESOURCES = ("/XObject", "/Font")
+
+_NAME = re.compile(rb"/([^\s/\[\]<>(){}%]+)")
+# Bytes that end a name in a content stream
+_NAME_END = frozenset(b" \t\n\r\f\v/[]<>(){}%")
+
+
+class SharedResources:
+    """Stream hashes, compressed stream data and rewritten images shared by every part of one split request.
+
+    Parts cloned from the same source share the same stream data objects, so a
+    font or image is hashed, compressed or downsampled once per request however
+    many parts embed it. `stats` adds up what optimize_part saved over all parts;
+    get_stats leaves out the ones in `unmeasured`, which the engine that made
+    the parts cannot tell. profile is the OutputProfile to apply; anything else
+    means LOSSLESS_PROFILE.
+    """
+
+    def __init__(self, profile=None):
+        self.profile = profile if isinstance(profile, OutputProfile) else LOSSLESS_PROFILE
+        self._digests = {}
+        self._compressed = {}
+        self._compress_seconds = 0.0
+        self._images = {}
+        self._image_seconds = 0.0
+        self.stats = {
+            "objects_deduplicated": 0,
+            "objects_dropped": 0,
+            "streams_compressed": 0,
+            "compressions_reused": 0,
+            "images_rewritten": 0,
+            "images_reused": 0,
+            "image_bytes_before": 0,
+            "image_bytes_after": 0,
+            "bytes_saved": 0,
+            "output_bytes": 0,
+        }
+        self.unmeasured = set()
+
+    def digest(self, data):
+        """SHA-256 of stream data, hashed once per data object."""
+        entry = self._digests.get(id(data))
+        # Keeping the data in the entry stops its id from being reused while cached
+        if entry is None or entry[0] is not data:
+            entry = (data, hashlib.sha256(data).digest())
+            self._digests[id(data)] = entry
+        return entry[1]
+
+    def compressed(self, data):
+        """Flate-compressed data, or None when compressing does not make it smaller."""
+        key = self.digest(data)
+        if key in self._compressed:
+            self.stats["compressions_reused"] += 1
+            return self._compressed[key]
+
+        started = time.perf_counter()
+        packed = zlib.compress(data)
+        self._compress_seconds += time.perf_counter() - started
+        if len(packed) >= len(data):
+            packed = None
+        self._compressed[key] = packed
+        return packed
+
+    def rewritten_image(self, data, size, rewrite):
+        """rewrite() for image stream data going out at size, or None when that does not make it smaller.
+
+        Computed once per request for the same data and size.
+        """
+        key = (self.digest(data), size)
+        if key in self._images:
+            self.stats["images_reused"] += 1
+            return self._images[key]
+
+        started = time.perf_counter()
+        try:
+            result = rewrite()
+        except Exception:
+            # An image Pillow cannot read is written as it was
+            result = None
+        self._image_seconds += time.perf_counter() - started
+        if result is not None and len(result[1]) >= len(data):
+            result = None
+        self._images[key] = result
+        return result
+
+    def get_stats(self):
+        stats = dict(self.stats)
+        # Time the reused compressions and images would have taken, at the average cost of the others
+        seconds = 0.0
+        for reused, fresh, spent in ((stats["compressions_reused"], len(self._compressed), self._compress_seconds),
+                                     (stats["images_reused"], len(self._images), self._image_seconds)):
+            if fresh:
+                seconds += reused * spent / fresh
+        stats["seconds_saved"] = round(seconds, 6)
+        for name in self.unmeasured:
+            stats.pop(name, None)
+        return stats
+
+
+def rewrite_image(shared, data, filter_name, mode, width, height, page_size, decode):
+    """(filter name, data, width, height) to replace an image stream with under shared's profile, or None to keep it.
+
+    data is the stream as stored, with a single filter_name (or None) and the
+    samples in mode ("L" or "RGB"); decode() returns them without the filter,
+    except for JPEG data, which Pillow reads as it is. page_size is the
+    (width, height) in points of the largest page the image is drawn on.
+    """
+    profile = shared.profile
+    if mode is None or filter_name not in (None, "/FlateDecode", "/DCTDecode") or not images.available():
+        return None
+    size = images.target_size(width, height, page_size[0], page_size[1], profile.image_dpi)
+    if size is None and not profile.image_quality:
+        return None
+
+    def rewrite():
+        image = images.open_image(
+            data if filter_name == "/DCTDecode" else decode(), filter_name, width, height, mode
+        )
+        if image is None:
+            return None
+        return images.rewrite_image(image, size, profile.image_quality, filter_name == "/DCTDecode")
+
+    result = shared.rewritten_image(data, size, rewrite)
+    if result is not None:
+        shared.stats["images_rewritten"] += 1
+        shared.stats["image_bytes_before"] += len(data)
+        shared.stats["image_bytes_after"] += len(result[1])
+    return result
+
+
+_kinds = {}
+
+
+def _kind(value):
+    """"ref", "dict", "array" or "other" for a PDF object.
+
+    PyPDF2's object classes derive from a typing Protocol, which makes every
+    isinstance check against them slow, so the answer is cached per class.
+    """
+    cls = type(value)
+    kind = _kinds.get(cls)
+    if kind is None:
+        if issubclass(cls, IndirectObject):
+            kind = "ref"
+        elif issubclass(cls, DictionaryObject):
+            kind = "dict"
+        elif issubclass(cls, ArrayObject):
+            kind = "array"
+        else:
+            kind = "other"
+        _kinds[cls] = kind
+    return kind
+
+
+def _fingerprint(value, writer):
+    """Hashable description of a PDF object, equal for objects that would be written the same."""
+    kind = _kind(value)
+    if kind == "ref":
+        return ("R", value.idnum) if value.pdf is writer else ("R", id(value.pdf), value.idnum)
+    if kind == "dict":
+        # dict.items gives the stored references instead of resolving them
+        return ("D", tuple(sorted((key, _fingerprint(item, writer)) for key, item in dict.items(value))))
+    if kind == "array":
+        return ("A", tuple(_fingerprint(item, writer) for item in value))
+    return (type(value).__name__, value if isinstance(value, (str, bytes, int, float)) else repr(value))
+
+
+def _serialized_size(obj):
+    buffer = io.BytesIO()
+    obj.write_to_stream(buffer, None)
+    return buffer.tell()
+
+
+def _references(value, writer, found):
+    """Add the object numbers value refers to in writer to found."""
+    kind = _kind(value)
+    if kind == "ref":
+        if value.pdf is writer:
+            found.add(value.idnum)
+    elif kind == "dict":
+        for item in dict.values(value):
+            _references(item, writer, found)
+    elif kind == "array":
+        for item in value:
+            _references(item, writer, found)
+    return found
+
+
+def _replace_references(obj, replaced, writer):
+    """Point every reference to a replaced object number at the object kept instead."""
+    kind = _kind(obj)
+    if kind == "dict":
+        items = dict.items(obj)
+    elif kind == "array":
+        items = enumerate(obj)
+    else:
+        return
+    for key, value in list(items):
+        if _kind(value) == "ref":
+            if value.pdf is writer and value.idnum in replaced:
+                obj[key] = IndirectObject(replaced[value.idnum], 0, writer)
+        else:
+            _replace_references(value, replaced, writer)
+
+
+def _get(obj, key, default=None):
+    """obj[key] with a reference followed, or default; DictionaryObject.get returns references as they are."""
+    return obj[key] if key in obj else default
+
+
+def _content_names(stream, wanted):
+    """The names of wanted that a content stream uses, or None when it cannot be read or uses escaped names.
+
+    A page has a few resource names and draws with many more, so each wanted
+    name is searched for in the data rather than every name collected.
+    """
+    try:
+        data = stream.get_data()
+    except Exception:
+        return None
+    if b"#" in data:
+        names = set()
+        for match in _NAME.finditer(data):
+            if b"#" in match.group(1):
+                return None
+            names.add("/" + match.group(1).decode("latin-1"))
+        return names & wanted
+
+    names = set()
+    for name in wanted:
+        try:
+            token = name.encode("latin-1")
+        except UnicodeEncodeError:
+            return None
+        start = data.find(token)
+        while start != -1:
+            end = start + len(token)
+            if end == len(data) or data[end] in _NAME_END:
+                names.add(name)
+                break
+            start = data.find(token, end)
+    return names
+
+
+def _used_names(page, resources):
+    """Names of the page's fonts and XObjects its drawing uses, or None if that cannot be told.
+
+    Besides the page contents these are the names in form XObjects and
+    annotation appearances that have no resources of their own, since
+    viewers look those up in the page's.
+    """
+    xobjects = _get(resources, "/XObject")
+    wanted = set()
+    for category in PRUNED_RESOURCES:
+        entries = _get(resources, category)
+        if isinstance(entries, DictionaryObject):
+            wanted.update(dict.keys(entries))
+    if not wanted:
+        return wanted
+
+    contents = _get(page, "/Contents")
+    streams = [item.get_object() for item in contents] if isinstance(contents, ArrayObject) else [contents]
+    page_streams = {id(stream) for stream in streams}
+    for annotation in _get(page, "/Annots") or []:
+        appearances = _get(annotation.get_object(), "/AP")
+        if isinstance(appearances, DictionaryObject):
+            for appearance in appearances.values():
+                appearance = appearance.get_object()
+                states = [appearance] if isinstance(appearance, StreamObject) else appearance.values()
+                streams.extend(state.get_object() for state in states)
+
+    names = set()
+    # Once every name is known to be used, the other streams cannot change what is kept
+    while streams and names != wanted:
+        stream = streams.pop()
+        if stream is None:
+            continue
+        if not isinstance(stream, StreamObject):
+            return None
+        if id(stream) not in page_streams and "/Resources" in stream:
+            continue
+        found = _content_names(stream, wanted - names)
+        if found is None:
+            return None
+        for name in found:
+            xobject = _get(xobjects, name) if isinstance(xobjects, DictionaryObject) else None
+            if isinstance(xobject, StreamObject) and _get(xobject, "/Subtype") == "/Form":
+                streams.append(xobject)
+        names |= found
+    return names
+
+
+def _prune_page(page, image_pages):
+    """Drop the fonts and XObjects a page never uses, and note the size of the pages its images are drawn on.
+
+    image_pages maps the object number of every image drawn to the largest
+    (width, height) in points of the pages drawing it.
+    """
+    resources = _get(page, "/Resources")
+    if not isinstance(resources, DictionaryObject):
+        return
+    try:
+        names = _used_names(page, resources)
+    except Exception:
+        # A malformed annotation or content array: keep every resource
+        names = None
+    if names is not None:
+        pruned = DictionaryObject(dict.items(resources))
+        for category in PRUNED_RESOURCES:
+            entries = _get(resources, category)
+            if isinstance(entries, DictionaryObject):
+                kept = {key: value for key, value in dict.items(entries) if key in names}
+                if len(kept) < len(entries):
+                    pruned[NameObject(category)] = DictionaryObject(kept)
+        # A shared resource dictionary is left as it is for the other pages
+        if pruned != resources:
+            page[NameObject("/Resources")] = pruned
+            resources = pruned
+
+    try:
+        page_size = (float(page.mediabox.width), float(page.mediabox.height))
+    except Exception:
+        return
+    _collect_images(resources, page_size, image_pages, set())
+
+
+def _collect_images(resources, page_size, image_pages, seen):
+    xobjects = _get(resources, "/XObject")
+    if not isinstance(xobjects, DictionaryObject):
+        return
+    for reference in dict.values(xobjects):
+        if not isinstance(reference, IndirectObject) or reference.idnum in seen:
+            continue
+        seen.add(reference.idnum)
+        xobject = reference.get_object()
+        if not isinstance(xobject, StreamObject):
+            continue
+        if _get(xobject, "/Subtype") == "/Image":
+            width, height = image_pages.get(reference.idnum, (0, 0))
+            image_pages[reference.idnum] = (max(width, page_size[0]), max(height, page_size[1]))
+        elif isinstance(_get(xobject, "/Resources"), DictionaryObject):
+            _collect_images(xobject["/Resources"], page_size, image_pages, seen)
+
+
+def _rewrite_images(writer, shared, image_pages):
+    """Downsample and re-encode the images of a PdfWriter under shared's profile."""
+    objects = writer._objects
+    for idnum, page_size in image_pages.items():
+        image = objects[idnum - 1]
+        if not isinstance(image, StreamObject):
+            continue
+        filter_name = _get(image, "/Filter")
+        if isinstance(filter_name, ArrayObject):
+            filter_name = filter_name[0] if len(filter_name) == 1 else "/Multiple"
+        color_space = _get(image, "/ColorSpace")
+        if isinstance(color_space, ArrayObject) and len(color_space) == 2 and color_space[0] == "/ICCBased":
+            color_space = _get(color_space[1].get_object(), "/N")
+        mode = images.image_mode(color_space, _get(image, "/BitsPerComponent"), image)
+        result = rewrite_image(
+            shared, image._data, filter_name, mode, int(_get(image, "/Width", 0)), int(_get(image, "/Height", 0)),
+            page_size, image.get_data
+        )
+        if result is None:
+            continue
+
+        filter_name, data, width, height = result
+        shared.stats["bytes_saved"] += len(image._data) - len(data)
+        rewritten = EncodedStreamObject()
+        for key, value in dict.items(image):
+            if key not in ("/Filter", "/DecodeParms", "/Length"):
+                rewritten[key] = value
+        rewritten[NameObject("/Filter")] = NameObject(filter_name)
+        rewritten[NameObject("/Width")] = NumberObject(width)
+        rewritten[NameObject("/Height")] = NumberObject(height)
+        rewritten[NameObject("/BitsPerComponent")] = NumberObject(8)
+        rewritten._data = data
+        objects[idnum - 1] = rewritten
+
+
+def _drop_unreachable(writer, shared):
+    """Write every object the document no longer refers to as null, keeping the numbering."""
+    objects = writer._objects
+    reachable = set()
+    pending = [ref.idnum for ref in (writer._root, writer._info) if ref is not None]
+    while pending:
+        idnum = pending.pop()
+        if idnum not in reachable:
+            reachable.add(idnum)
+            pending.extend(_references(objects[idnum - 1], writer, set()))
+
+    for i, obj in enumerate(objects):
+        if i + 1 in reachable or obj is None or isinstance(obj, NullObject):
+            continue
+        shared.stats["objects_dropped"] += 1
+        shared.stats["bytes_saved"] += len(obj._data) if isinstance(obj, StreamObject) else _serialized_size(obj)
+        objects[i] = NullObject()
+
+
+def optimize_writer(writer, shared):
+    """Apply shared's OutputProfile to a PdfWriter before it is saved.
+
+    Fonts and XObjects that no page draws are dropped from the page resources,
+    and with image options the images are downsampled or re-encoded. Streams
+    without a filter are then Flate-compressed through `shared`, so data seen
+    in an earlier part is not compressed again. Objects with the same content
+    are merged into one, and finally objects nothing refers to any more are
+    dropped; the slots of merged and dropped objects are written as null so
+    the cross-reference table keeps its numbering.
+    """
+    objects = writer._objects
+
+    image_pages = {}
+    for page in writer.pages:
+        _prune_page(page, image_pages)
+    if shared.profile != LOSSLESS_PROFILE:
+        _rewrite_images(writer, shared, image_pages)
+
+    for i, obj in enumerate(objects):
+        if not isinstance(obj, StreamObject) or "/Filter" in obj or "/DecodeParms" in obj or not obj._data:
+            continue
+        packed = shared.compressed(obj._data)
+        if packed is None:
+            continue
+        encoded = EncodedStreamObject()
+        for key, value in obj.items():
+            encoded[key] = value
+        encoded[NameObject("/Filter")] = NameObject("/FlateDecode")
+        encoded._data = packed
+        objects[i] = encoded
+        shared.stats["streams_compressed"] += 1
+        shared.stats["bytes_saved"] += len(obj._data) - len(packed)
+
+    protected = {ref.idnum for ref in (writer._root, writer._info, writer._pages) if ref is not None}
+
+    # Which objects refer to each object number, so merges only revisit the objects they touch
+    referrers = {}
+    for i, obj in enumerate(objects):
+        for idnum in _references(obj, writer, set()):
+            referrers.setdefault(idnum, set()).add(i + 1)
+
+    candidates = [
+        i + 1 for i, obj in enumerate(objects)
+        if i + 1 not in protected and isinstance(obj, DictionaryObject) and obj.get("/Type") not in UNIQUE_TYPES
+    ]
+    kept = {}
+    keys = {}
+    sizes = {}
+    # Merging objects can make the objects that refer to them identical too, so
+    # repeat with the objects that changed until nothing more merges
+    while candidates:
+        replaced = {}
+        for idnum in candidates:
+            obj = objects[idnum - 1]
+            previous = keys.pop(idnum, None)
+            if previous is not None:
+                del kept[previous]
+
+            key = _fingerprint(obj, writer)
+            if isinstance(obj, StreamObject):
+                key += (shared.digest(obj._data),)
+            if key in kept:
+                replaced[idnum] = kept[key]
+                shared.stats["objects_deduplicated"] += 1
+                # Every copy is written the same, so measure one of them
+                if key not in sizes:
+                    sizes[key] = _serialized_size(obj)
+                shared.stats["bytes_saved"] += sizes[key]
+            else:
+                kept[key] = idnum
+                keys[idnum] = key
+
+        if not replaced:
+            break
+        changed = set()
+        for idnum, kept_idnum in replaced.items():
+            objects[idnum - 1] = NullObject()
+            users = referrers.pop(idnum, set())
+            referrers.setdefault(kept_idnum, set()).update(users)
+            changed.update(users)
+        changed.difference_update(replaced)
+        for idnum in changed:
+            _replace_references(objects[idnum - 1], replaced, writer)
+        candidates = [idnum for idnum in sorted(changed) if idnum in keys]
+
+    _drop_unreachable(writer, shared)
+
+
+def optimize_part(part, shared):
+    """Optimize a part returned by split_pdf before it is written, whichever backend made it.
+
+    PyPDF2 parts are rewritten here and fill in all of shared's stats; the
+    other backends switch on their engine's own cleanup and compression and
+    leave the stats they cannot measure out of get_stats.
+    """
+    if isinstance(part, PyPDF2.PdfWriter):
+        optimize_writer(part, shared)
+    else:
+        part.optimize(shared)
+        shared.unmeasured.update(part.UNMEASURED_STATS)
+
+
+def record_output(part, shared, size):
+    """Add an optimized part written at size bytes to shared's stats."""
+    shared.stats["output_bytes"] += size
+    if not isinstance(part, PyPDF2.PdfWriter):
+        # The engine does not say what each step saved, so compare with the part as it was before optimize
+        shared.stats["bytes_saved"] += part.plain_size - size
@@ -0,0 +1,157 @@
+import mmap
+import re
+from collections import namedtuple
+
+# PDF writers put startxref and %%EOF at the very end; allow some trailing garbage
+TAIL_SIZE = 4096
+
+# Bounds on the walk, so a crafted file cannot make the pre-flight itself expensive
+MAX_XREF_SECTIONS = 32
+MAX_DICT_BYTES = 64 * 1024
+
+# Page tree nodes followed down the first kids; real documents are a handful of levels deep
+MAX_TREE_DEPTH = 64
+
+# What a pre-flight scan found; None where the file could not be read cheaply
+PdfSummary = namedtuple("PdfSummary", ["page_count", "object_count", "tree_depth"])
+
+_STARTXREF = re.compile(rb"startxref\s+(\d+)")
+_SUBSECTION = re.compile(rb"\s*(\d+)\s+(\d+)[ \t]*\r?\n?")
+_ENTRY = re.compile(rb"(\d{10}) (\d{5}) ([nf])")
+_XREF_STREAM = re.compile(rb"\s*\d+\s+\d+\s+obj\s*<<")
+_DICT_BRACKETS = re.compile(rb"<<|>>")
+
+
+class PreflightScanner:
+    """Read the trailer, the xref and the root of the page tree without parsing the PDF.
+
+    Objects are found through classic xref tables, one entry at a time, so the
+    cost does not grow with the number of objects. Files with cross-reference
+    streams only give their object count; the full parse checks the rest.
+    """
+
+    def __init__(self, data):
+        self.data = data
+        self.trailer = None
+        # (first object number, entry count, offset of the first entry), newest section first
+        self.subsections = []
+
+    def read_xref(self):
+        tail_start = max(0, len(self.data) - TAIL_SIZE)
+        matches = list(_STARTXREF.finditer(self.data, tail_start))
+        if not matches:
+            return False
+        offset = int(matches[-1].group(1))
+
+        for _ in range(MAX_XREF_SECTIONS):
+            if self.data[offset:offset + 4] != b"xref":
+                # A cross-reference stream: its dictionary doubles as the trailer
+                if self.trailer is None and _XREF_STREAM.match(self.data, offset):
+                    self.trailer = self.read_dict(self.data.find(b"<<", offset))
+                return self.trailer is not None
+
+            position = offset + 4
+            while True:
+                header = _SUBSECTION.match(self.data, position)
+                if header is None:
+                    break
+                first, count = int(header.group(1)), int(header.group(2))
+                self.subsections.append((first, count, header.end()))
+                position = header.end() + count * 20
+
+            trailer_at = self.data.find(b"trailer", position, position + 1024)
+            if trailer_at < 0:
+                return self.trailer is not None
+            trailer = self.read_dict(self.data.find(b"<<", trailer_at))
+            if self.trailer is None:
+                self.trailer = trailer
+            prev = _int_value(trailer, b"Prev")
+            if prev is None:
+                return True
+            offset = prev
+        return self.trailer is not None
+
+    def read_dict(self, start):
+        """The top-level entries of the dictionary starting at start, with nested dictionaries cut out."""
+        if start < 0:
+            return b""
+        depth = 0
+        parts = []
+        position = start
+        for bracket in _DICT_BRACKETS.finditer(self.data, start, start + MAX_DICT_BYTES):
+            if depth == 1:
+                parts.append(self.data[position:bracket.start()])
+            depth += 1 if bracket.group() == b"<<" else -1
+            position = bracket.end()
+            if depth == 0:
+                return b" ".join(parts)
+        return b" ".join(parts)
+
+    def object_dict(self, number):
+        """The dictionary of object number, if a classic xref table says where it is."""
+        for first, count, entries in self.subsections:
+            if first <= number < first + count:
+                entry = _ENTRY.match(self.data, entries + (number - first) * 20)
+                if entry is None or entry.group(3) == b"f":
+                    return None
+                offset = int(entry.group(1))
+                # Only trust the entry if it points at the object it claims to
+                if not re.match(rb"\s*%d\s+\d+\s+obj" % number, self.data[offset:offset + 64]):
+                    return None
+                return self.read_dict(self.data.find(b"<<", offset, offset + 64))
+        return None
+
+    def summary(self):
+        if not self.read_xref():
+            return PdfSummary(None, None, None)
+        object_count = _int_value(self.trailer, b"Size")
+
+        root = _ref_value(self.trailer, b"Root")
+        catalog = self.object_dict(root) if root is not None else None
+        pages = _ref_value(catalog, b"Pages") if catalog else None
+        node = self.object_dict(pages) if pages is not None else None
+        if node is None:
+            return PdfSummary(None, object_count, None)
+        page_count = _int_value(node, b"Count")
+
+        # Walk down the first kid of every level, which is where a nested tree goes deepest first
+        depth = 1
+        while depth <= MAX_TREE_DEPTH:
+            kids = re.search(rb"/Kids\s*\[\s*(\d+)\s+\d+\s+R", node)
+            if kids is None:
+                break
+            node = self.object_dict(int(kids.group(1)))
+            if node is None or not re.search(rb"/Type\s*/Pages\b", node):
+                break
+            depth += 1
+        return PdfSummary(page_count, object_count, depth)
+
+
+def _int_value(entries, key):
+    match = re.search(rb"/%s\s+(\d+)" % key, entries or b"")
+    return int(match.group(1)) if match else None
+
+
+def _ref_value(entries, key):
+    match = re.search(rb"/%s\s+(\d+)\s+\d+\s+R" % key, entries or b"")
+    return int(match.group(1)) if match else None
+
+
+def scan_pdf(path):
+    """Page count, object count and page tree depth of the PDF at path, from its trailer and xref.
+
+    Reads a few small regions of the file through an mmap, so it costs about
+    the same for a 10-page and a 10-million-page document. Anything that cannot
+    be read this way is None; the split worker checks it after the full parse.
+    """
+    with open(path, "rb") as f:
+        try:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # Empty file
+            return PdfSummary(None, None, None)
+    with data:
+        try:
+            return PreflightScanner(data).summary()
+        except (ValueError, IndexError, OverflowError):
+            return PdfSummary(None, None, None)
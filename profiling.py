@@ -0,0 +1,172 @@
+import cProfile
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+
+# cprofile traces every call and writes a pstats file; sampling reads the stack
+# every SAMPLE_INTERVAL seconds and writes a speedscope file
+PROFILERS = ("cprofile", "sampling")
+PROFILE_SUFFIXES = {"cprofile": ".pstats", "sampling": ".speedscope.json"}
+SAMPLE_INTERVAL = 0.001
+
+# Functions whose inclusive time shows which kind of work dominates a split:
+# (category, file name, function name). Categories can overlap, e.g. writing
+# resolves the objects it has not read yet.
+HOTSPOTS = (
+    ("object_resolution", "_reader.py", "get_object"),
+    ("decompression", "filters.py", "decode_stream_data"),
+    ("page_copy", "_writer.py", "add_page"),
+    ("writing", "_writer.py", "write"),
+    ("optimize", "pdf_utils.py", "optimize_writer"),
+)
+
+# How many functions the summary lists
+TOP_FUNCTIONS = 15
+
+
+def _short_path(filename):
+    """Path from the package root, e.g. PyPDF2/_reader.py, instead of the install location."""
+    for marker in ("site-packages" + os.sep, "dist-packages" + os.sep):
+        if marker in filename:
+            return filename.split(marker, 1)[1]
+    return os.path.basename(filename)
+
+
+def _hotspot(filename, name):
+    for category, hotspot_file, hotspot_name in HOTSPOTS:
+        if name == hotspot_name and filename.endswith(hotspot_file):
+            return category
+    return None
+
+
+def _describe(filename, line, name):
+    if filename == "~":
+        # Built-in functions have no source location
+        return name
+    return f"{_short_path(filename)}:{line}({name})"
+
+
+def _cprofile_summary(profiler):
+    stats = pstats.Stats(profiler).stats
+    categories = dict.fromkeys([category for category, _, _ in HOTSPOTS], 0.0)
+    for (filename, _, name), (_, _, _, cumulative, _) in stats.items():
+        category = _hotspot(filename, name)
+        if category:
+            categories[category] += cumulative
+
+    top = sorted(stats.items(), key=lambda item: item[1][2], reverse=True)[:TOP_FUNCTIONS]
+    return categories, [{
+        "function": _describe(*key),
+        "calls": calls,
+        "self_seconds": round(self_seconds, 6),
+        "cumulative_seconds": round(cumulative, 6),
+    } for key, (_, calls, self_seconds, cumulative, _) in top]
+
+
+class StackSampler(threading.Thread):
+    """Record the stack of one thread every interval seconds.
+
+    Each sample is weighted by the time since the previous one, so a sample
+    that waited for the GIL still counts for the time it stood for.
+    """
+
+    def __init__(self, thread_id, interval=SAMPLE_INTERVAL):
+        super().__init__(daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.frames = {}
+        self.samples = []
+        self.weights = []
+        self._stopped = threading.Event()
+
+    def run(self):
+        last = time.perf_counter()
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            now = time.perf_counter()
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                key = (code.co_filename, code.co_firstlineno, code.co_name)
+                stack.append(self.frames.setdefault(key, len(self.frames)))
+                frame = frame.f_back
+            stack.reverse()
+            self.samples.append(stack)
+            self.weights.append(now - last)
+            last = now
+
+    def stop(self):
+        self._stopped.set()
+        self.join()
+
+    def speedscope(self, name):
+        """The samples as a speedscope file (https://www.speedscope.app/file-format-schema.json)."""
+        frames = [{"name": key[2], "file": _short_path(key[0]), "line": key[1]} for key in self.frames]
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": name,
+            "exporter": "pdf_splitter",
+            "shared": {"frames": frames},
+            "profiles": [{
+                "type": "sampled",
+                "name": name,
+                "unit": "seconds",
+                "startValue": 0,
+                "endValue": sum(self.weights),
+                "samples": self.samples,
+                "weights": self.weights,
+            }],
+        }
+
+    def summary(self):
+        keys = list(self.frames)
+        categories = dict.fromkeys([category for category, _, _ in HOTSPOTS], 0.0)
+        self_seconds = {}
+        for stack, weight in zip(self.samples, self.weights):
+            if not stack:
+                continue
+            # Inclusive time: count each category once per sample however deep it recurses
+            for category in {_hotspot(keys[index][0], keys[index][2]) for index in stack} - {None}:
+                categories[category] += weight
+            self_seconds[stack[-1]] = self_seconds.get(stack[-1], 0.0) + weight
+
+        top = sorted(self_seconds.items(), key=lambda item: item[1], reverse=True)[:TOP_FUNCTIONS]
+        return categories, [{
+            "function": _describe(*keys[index]),
+            "self_seconds": round(seconds, 6),
+        } for index, seconds in top]
+
+
+def profile_call(mode, output_path, fn, *args, **kwargs):
+    """Run fn(*args, **kwargs) under the given profiler and add a "profile" summary to its result dict.
+
+    The raw profile is written to output_path: pstats for cprofile, speedscope
+    JSON for sampling.
+    """
+    started = time.perf_counter()
+    if mode == "sampling":
+        sampler = StackSampler(threading.get_ident())
+        sampler.start()
+        try:
+            result = fn(*args, **kwargs)
+        finally:
+            sampler.stop()
+        with open(output_path, "w") as f:
+            json.dump(sampler.speedscope(os.path.basename(output_path)), f)
+        categories, top = sampler.summary()
+    else:
+        profiler = cProfile.Profile()
+        result = profiler.runcall(fn, *args, **kwargs)
+        profiler.dump_stats(output_path)
+        categories, top = _cprofile_summary(profiler)
+
+    result["profile"] = {
+        "mode": mode,
+        "seconds": round(time.perf_counter() - started, 6),
+        "categories": {category: round(seconds, 6) for category, seconds in categories.items()},
+        "top_functions": top,
+    }
+    return result
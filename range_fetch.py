@@ -0,0 +1,219 @@
+import bisect
+import os
+
+from PyPDF2.generic import ArrayObject, DictionaryObject, IndirectObject
+
+from fetch import DownloadError
+
+# Remote files are fetched in aligned blocks of this size; one read never asks for a block twice
+BLOCK_SIZE = 64 * 1024
+
+# Longest read-ahead when a file is read front to back, in blocks
+MAX_READAHEAD_BLOCKS = 64
+
+# Keys PdfWriter.add_page leaves out when it copies a page, at every level below it
+SKIPPED_KEYS = ("/Parent", "/StructParents")
+
+
+class RangeFile:
+    """Read-only file over a remote PDF, filled in with HTTP range requests as it is read.
+
+    Every fetched block is written at its own offset into a sparse local file
+    at path, as large as the remote one. Wherever this file was read, the local
+    file holds the same bytes, so a parser that reads the same objects from
+    the local file sees the remote PDF; the rest of the file is never fetched.
+
+    fetch_spans is called with a list of (start, end) byte spans and returns
+    their contents in the same order; it may fetch them concurrently.
+    """
+
+    def __init__(self, path, size, fetch_spans, max_bytes=0, head=b""):
+        self.path = path
+        self.size = size
+        self.fetch_spans = fetch_spans
+        self.max_bytes = max_bytes
+        self.position = 0
+        self.bytes_fetched = 0
+        self.requests = 0
+        self._blocks = set()
+        self._block_count = -(-size // BLOCK_SIZE)
+        self._next_block = None
+        self._readahead = 1
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o600)
+        os.ftruncate(self._fd, size)
+        # The probe already brought the first bytes; keep the whole blocks among them
+        whole = len(head) // BLOCK_SIZE * BLOCK_SIZE if len(head) < size else size
+        if whole:
+            self._store(0, head[:whole])
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        if whence == os.SEEK_CUR:
+            offset += self.position
+        elif whence == os.SEEK_END:
+            offset += self.size
+        self.position = max(0, offset)
+        return self.position
+
+    def tell(self):
+        return self.position
+
+    def read(self, n=-1):
+        end = self.size if n is None or n < 0 else min(self.size, self.position + n)
+        if end <= self.position:
+            return b""
+        first, last = self.position // BLOCK_SIZE, (end - 1) // BLOCK_SIZE
+        if first not in self._blocks:
+            # Reading on where the last fetch ended, like an xref table: fetch more ahead each time
+            self._readahead = min(self._readahead * 2, MAX_READAHEAD_BLOCKS) if first == self._next_block else 1
+            last = max(last, min(first + self._readahead, self._block_count) - 1)
+        self._fetch_blocks(range(first, last + 1))
+        data = os.pread(self._fd, end - self.position, self.position)
+        self.position += len(data)
+        return data
+
+    def prefetch(self, spans):
+        """Fetch the blocks of every (start, end) span in one round of requests, ahead of reading them."""
+        blocks = set()
+        for start, end in spans:
+            start, end = max(0, start), min(self.size, end)
+            if start < end:
+                blocks.update(range(start // BLOCK_SIZE, (end - 1) // BLOCK_SIZE + 1))
+        self._fetch_blocks(sorted(blocks))
+
+    def _fetch_blocks(self, blocks):
+        # Neighbouring missing blocks go out as one request
+        spans = []
+        for block in blocks:
+            if block in self._blocks:
+                continue
+            start, end = block * BLOCK_SIZE, min(self.size, (block + 1) * BLOCK_SIZE)
+            if spans and spans[-1][1] == start:
+                spans[-1][1] = end
+            else:
+                spans.append([start, end])
+        if not spans:
+            return
+
+        fetched = sum(end - start for start, end in spans)
+        if self.max_bytes and self.bytes_fetched + fetched > self.max_bytes:
+            raise DownloadError(f"The downloaded file is larger than the {self.max_bytes} byte limit.", status_code=413)
+        for (start, _), data in zip(spans, self.fetch_spans([tuple(span) for span in spans])):
+            self._store(start, data)
+        self.bytes_fetched += fetched
+        self.requests += len(spans)
+        self._next_block = -(-spans[-1][1] // BLOCK_SIZE)
+
+    def _store(self, start, data):
+        os.pwrite(self._fd, data, start)
+        self._blocks.update(range(start // BLOCK_SIZE, -(-(start + len(data)) // BLOCK_SIZE)))
+
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+
+class ObjectSpans:
+    """Where the objects of a PDF are in its file, from the reader's xref.
+
+    An object is taken to run up to the next object's offset, which holds for
+    the files PDF writers produce; a longer object is fetched on reading.
+    """
+
+    def __init__(self, reader):
+        self.reader = reader
+        self.offsets = sorted(
+            offset for entries in reader.xref.values() for offset in entries.values() if isinstance(offset, int)
+        )
+
+    def span(self, reference):
+        if reference.idnum in self.reader.xref_objStm:
+            # A compressed object: what has to be read is its object stream
+            stream_number, _ = self.reader.xref_objStm[reference.idnum]
+            offset = self.reader.xref.get(0, {}).get(stream_number)
+        else:
+            offset = self.reader.xref.get(reference.generation, {}).get(reference.idnum)
+        if not isinstance(offset, int):
+            return None
+        following = bisect.bisect_right(self.offsets, offset)
+        end = self.offsets[following] if following < len(self.offsets) else offset + BLOCK_SIZE
+        return offset, end
+
+    def spans(self, references):
+        return [span for span in map(self.span, references) if span is not None]
+
+
+def prefetch_page_tree(document, range_file, spans, page_indexes):
+    """Fetch the page tree nodes on the way to the given pages, one round of requests per tree level.
+
+    Follows PdfDocument.get_page: a node whose /Count equals its number of
+    kids only needs the kids asked for; any other node is counted through,
+    which needs its kids up to the last index asked for, since every kid but
+    an empty /Pages node holds at least one page. Whatever a tree that does
+    not fit this still needs is read when the page is looked up.
+    """
+    level = [(document.reader.trailer["/Root"]["/Pages"], sorted(set(page_indexes)))]
+    while level:
+        references = []
+        for node, indexes in level:
+            kids = node["/Kids"]
+            if node.get("/Count") == len(kids):
+                references.extend(kids[index] for index in indexes if index < len(kids))
+            else:
+                references.extend(kids[:indexes[-1] + 1])
+        range_file.prefetch(spans.spans(reference for reference in references if isinstance(reference, IndirectObject)))
+
+        next_level = []
+        for node, indexes in level:
+            kids = node["/Kids"]
+            if node.get("/Count") == len(kids):
+                continue
+            first = 0
+            for kid in kids[:indexes[-1] + 1]:
+                kid = kid.get_object()
+                count = kid.get("/Count", 1) if kid.get("/Type") == "/Pages" else 1
+                below = [index - first for index in indexes if first <= index < first + count]
+                if below and kid.get("/Type") == "/Pages":
+                    next_level.append((kid, below))
+                first += count
+        level = next_level
+
+
+def prefetch_pages(document, range_file, page_indexes):
+    """Read every object PdfWriter copies for the given pages of document, a PdfDocument over range_file.
+
+    The page tree nodes leading to the pages are fetched first, then the
+    objects the pages use, breadth first; the references found on one level
+    are fetched together before they are parsed, so the number of request
+    rounds grows with the depth of the page tree and of the object graph, not
+    with the number of objects or how far into the file the pages are.
+    """
+    spans = ObjectSpans(document.reader)
+    if page_indexes:
+        prefetch_page_tree(document, range_file, spans, page_indexes)
+    seen = set()
+    level = []
+    for index in page_indexes:
+        page = document.get_page(index)
+        if page.indirect_reference is not None:
+            seen.add((page.indirect_reference.idnum, page.indirect_reference.generation))
+        level.append(page)
+
+    while level:
+        references = []
+        values = level
+        while values:
+            nested = []
+            for value in values:
+                if isinstance(value, IndirectObject):
+                    key = (value.idnum, value.generation)
+                    if key not in seen:
+                        seen.add(key)
+                        references.append(value)
+                elif isinstance(value, DictionaryObject):
+                    nested.extend(item for name, item in value.items() if name not in SKIPPED_KEYS)
+                elif isinstance(value, ArrayObject):
+                    nested.extend(value)
+            values = nested
+        range_file.prefetch(spans.spans(references))
+        level = [reference.get_object() for reference in references]
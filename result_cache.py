@@ -0,0 +1,112 @@
+import contextlib
+import sqlite3
+import threading
+import time
+
+
+class ResultCache:
+    """Remembers which split output in the artifact store holds (source sha256, page range).
+
+    Entries live exactly as long as their output files: a hit touches the file,
+    so cleanup by mtime and this index agree on what is still there, and purge
+    drops entries older than max_age together with the files cleanup removes.
+    The page count of each source is kept too, so ranges can be normalized
+    without opening the PDF.
+    """
+
+    def __init__(self, path, artifacts, max_age):
+        self.path = path
+        self.artifacts = artifacts
+        self.max_age = max_age
+
+        # Counters for this process, per requested range
+        self.stats = {"hits": 0, "misses": 0}
+        self._stats_lock = threading.Lock()
+
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS documents ("
+                "sha256 TEXT PRIMARY KEY, total_pages INTEGER NOT NULL, updated_at REAL NOT NULL)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS parts ("
+                "sha256 TEXT NOT NULL, range TEXT NOT NULL, filename TEXT NOT NULL, "
+                "updated_at REAL NOT NULL, PRIMARY KEY (sha256, range))"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS parts_updated_at ON parts (updated_at)")
+
+    @contextlib.contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def get_total_pages(self, sha256):
+        """Page count of the source, or None if it was never split."""
+        with self._connect() as conn:
+            row = conn.execute("SELECT total_pages FROM documents WHERE sha256 = ?", (sha256,)).fetchone()
+        return row[0] if row else None
+
+    def get_parts(self, sha256, range_strs):
+        """Return {range: filename} for the ranges whose output still exists.
+
+        Every hit gets its file touched, so it has a full MAX_FILE_AGE left.
+        """
+        now = time.time()
+        found = {}
+        with self._connect() as conn:
+            for range_str in set(range_strs):
+                row = conn.execute(
+                    "SELECT filename FROM parts WHERE sha256 = ? AND range = ? AND updated_at > ?",
+                    (sha256, range_str, now - self.max_age)
+                ).fetchone()
+                if row is None:
+                    continue
+                try:
+                    self.artifacts.touch(row[0], now)
+                except FileNotFoundError:
+                    continue
+                conn.execute(
+                    "UPDATE parts SET updated_at = ? WHERE sha256 = ? AND range = ?",
+                    (now, sha256, range_str)
+                )
+                found[range_str] = row[0]
+            if found:
+                conn.execute("UPDATE documents SET updated_at = ? WHERE sha256 = ?", (now, sha256))
+
+        with self._stats_lock:
+            hits = sum(1 for range_str in range_strs if range_str in found)
+            self.stats["hits"] += hits
+            self.stats["misses"] += len(range_strs) - hits
+        return found
+
+    def store(self, sha256, total_pages, files):
+        """Record the page count of a source and its new (range, filename) outputs."""
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO documents (sha256, total_pages, updated_at) VALUES (?, ?, ?)",
+                (sha256, total_pages, now)
+            )
+            conn.executemany(
+                "INSERT OR REPLACE INTO parts (sha256, range, filename, updated_at) VALUES (?, ?, ?, ?)",
+                [(sha256, range_str, filename, now) for range_str, filename in files]
+            )
+
+    def purge(self, max_age):
+        """Forget outputs older than max_age seconds, which cleanup deletes from the store."""
+        cutoff = time.time() - max_age
+        with self._connect() as conn:
+            conn.execute("DELETE FROM parts WHERE updated_at < ?", (cutoff,))
+            conn.execute("DELETE FROM documents WHERE updated_at < ?", (cutoff,))
+
+    def get_stats(self):
+        with self._stats_lock:
+            stats = dict(self.stats)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_ratio"] = stats["hits"] / lookups if lookups else 0.0
+        return stats
@@ -0,0 +1,210 @@
+import contextlib
+import hashlib
+import io
+import mmap
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+from fetch import CHUNK_SIZE
+
+
+class SourceCache:
+    """On-disk cache of source PDFs, content-addressed by SHA-256.
+
+    Every source, downloaded or uploaded, is stored once as blobs/<sha256>.pdf,
+    so identical files share one blob. URLs map to a blob together with the
+    ETag / Last-Modified they were served with, so a later request for the same
+    URL can revalidate with a conditional GET instead of downloading again.
+
+    Blobs are evicted least recently used first once the cache is over
+    max_bytes. Blobs used in the last min_age seconds are never evicted, so a
+    split worker never loses the file it is about to open.
+    """
+
+    def __init__(self, directory, max_bytes, min_age=60):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.min_age = min_age
+        self.blob_dir = os.path.join(directory, "blobs")
+        os.makedirs(self.blob_dir, exist_ok=True)
+        self.index_path = os.path.join(directory, "index.sqlite3")
+
+        # Counters for this process
+        self.stats = {"hits": 0, "misses": 0, "deduplicated": 0, "evictions": 0}
+        self._stats_lock = threading.Lock()
+
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS blobs ("
+                "sha256 TEXT PRIMARY KEY, size INTEGER NOT NULL, last_used REAL NOT NULL)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS urls ("
+                "url TEXT PRIMARY KEY, sha256 TEXT NOT NULL, etag TEXT, last_modified TEXT)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS blobs_last_used ON blobs (last_used)")
+
+    @contextlib.contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.index_path, timeout=30)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _count(self, name):
+        with self._stats_lock:
+            self.stats[name] += 1
+
+    def blob_path(self, sha256):
+        return os.path.join(self.blob_dir, f"{sha256}.pdf")
+
+    def sha256_of(self, path):
+        """Content hash of a blob, from its file name."""
+        return os.path.splitext(os.path.basename(path))[0]
+
+    def lookup_url(self, url):
+        """Return the cached entry for url as a dict, or None if it is not cached."""
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT sha256, etag, last_modified FROM urls WHERE url = ?", (url,)
+            ).fetchone()
+        if row is None or not os.path.exists(self.blob_path(row[0])):
+            return None
+        return {"sha256": row[0], "etag": row[1], "last_modified": row[2], "path": self.blob_path(row[0])}
+
+    def record_hit(self, sha256):
+        """Count a URL served from the cache and mark its blob as recently used."""
+        self._count("hits")
+        with self._connect() as conn:
+            conn.execute("UPDATE blobs SET last_used = ? WHERE sha256 = ?", (time.time(), sha256))
+
+    def record_miss(self):
+        self._count("misses")
+
+    def new_partial(self):
+        """Open a temp file in the cache directory for a download in progress."""
+        return tempfile.NamedTemporaryFile(dir=self.directory, prefix="partial_", suffix=".pdf", delete=False)
+
+    def commit(self, partial_path, sha256, size, url=None, etag=None, last_modified=None):
+        """Move a finished partial file into the cache and return the blob path.
+
+        If the blob already exists the partial file (which may be None) is dropped
+        instead. With a url the blob is also recorded as that URL's current content.
+        """
+        path = self.blob_path(sha256)
+        if os.path.exists(path):
+            if partial_path is not None:
+                os.unlink(partial_path)
+            self._count("deduplicated")
+        else:
+            os.replace(partial_path, path)
+
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO blobs (sha256, size, last_used) VALUES (?, ?, ?) "
+                "ON CONFLICT(sha256) DO UPDATE SET last_used = excluded.last_used",
+                (sha256, size, time.time())
+            )
+            if url is not None:
+                conn.execute(
+                    "INSERT OR REPLACE INTO urls (url, sha256, etag, last_modified) VALUES (?, ?, ?, ?)",
+                    (url, sha256, etag, last_modified)
+                )
+
+        self.evict()
+        return path
+
+    def add_stream(self, file_obj):
+        """Copy a file-like object into the cache and return the blob path.
+
+        A SpooledTemporaryFile (what UploadFile holds) is copied without going
+        through Python buffers: the in-memory buffer is hashed and written as
+        is, and a spool that spilled to disk is hashed through an mmap and
+        copied by the kernel with sendfile.
+        """
+        # SpooledTemporaryFile keeps its BytesIO or real file in _file
+        raw = getattr(file_obj, "_file", file_obj)
+        if isinstance(raw, io.BytesIO):
+            with raw.getbuffer() as view:
+                return self.add_bytes(view)
+
+        try:
+            fd = raw.fileno()
+            size = os.fstat(fd).st_size
+        except (AttributeError, OSError, io.UnsupportedOperation):
+            return self.add_chunks(iter(lambda: file_obj.read(CHUNK_SIZE), b""))
+        if size == 0:
+            return self.add_bytes(b"")
+
+        with mmap.mmap(fd, 0, access=mmap.ACCESS_READ) as mapped:
+            sha256 = hashlib.sha256(mapped).hexdigest()
+        if os.path.exists(self.blob_path(sha256)):
+            return self.commit(None, sha256, size)
+
+        with self.new_partial() as partial:
+            offset = 0
+            while offset < size:
+                sent = os.sendfile(partial.fileno(), fd, offset, size - offset)
+                if sent == 0:
+                    break
+                offset += sent
+        return self.commit(partial.name, sha256, size)
+
+    def add_bytes(self, data):
+        """Store a bytes-like object in the cache and return the blob path."""
+        sha256 = hashlib.sha256(data).hexdigest()
+        if os.path.exists(self.blob_path(sha256)):
+            return self.commit(None, sha256, len(data))
+        with self.new_partial() as partial:
+            partial.write(data)
+        return self.commit(partial.name, sha256, len(data))
+
+    def add_chunks(self, chunks):
+        """Store data from an iterable of byte chunks, hashing as it is written."""
+        digest = hashlib.sha256()
+        size = 0
+        with self.new_partial() as partial:
+            for chunk in chunks:
+                digest.update(chunk)
+                partial.write(chunk)
+                size += len(chunk)
+        return self.commit(partial.name, digest.hexdigest(), size)
+
+    def evict(self):
+        """Delete least recently used blobs until the cache fits in max_bytes."""
+        with self._connect() as conn:
+            total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM blobs").fetchone()[0]
+            if total <= self.max_bytes:
+                return
+            candidates = conn.execute(
+                "SELECT sha256, size FROM blobs WHERE last_used < ? ORDER BY last_used",
+                (time.time() - self.min_age,)
+            ).fetchall()
+            for sha256, size in candidates:
+                if total <= self.max_bytes:
+                    break
+                conn.execute("DELETE FROM blobs WHERE sha256 = ?", (sha256,))
+                conn.execute("DELETE FROM urls WHERE sha256 = ?", (sha256,))
+                with contextlib.suppress(FileNotFoundError):
+                    os.unlink(self.blob_path(sha256))
+                total -= size
+                self._count("evictions")
+
+    def get_stats(self):
+        """Counters for this process plus the current size of the shared cache."""
+        with self._connect() as conn:
+            entries, total = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM blobs").fetchone()
+        with self._stats_lock:
+            stats = dict(self.stats)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_ratio"] = stats["hits"] / lookups if lookups else 0.0
+        stats["entries"] = entries
+        stats["bytes"] = total
+        stats["max_bytes"] = self.max_bytes
+        return stats
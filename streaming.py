@@ -0,0 +1,79 @@
+import time
+import zipfile
+
+# Ends the data of a multipart/mixed body part
+MULTIPART_PART_END = b"\r\n"
+
+
+class _Collector:
+    """Write-only sink; zipfile treats it as unseekable and writes data descriptors."""
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def take(self):
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+class ZipStreamWriter:
+    """Build a ZIP archive (stored, no recompression) one member at a time.
+
+    Each call returns the bytes to send next, so an archive can be streamed
+    while later members are still being produced.
+    """
+
+    def __init__(self):
+        self._sink = _Collector()
+        self._zip = zipfile.ZipFile(self._sink, mode="w", compression=zipfile.ZIP_STORED, allowZip64=True)
+        self._member = None
+
+    def begin(self, name, size):
+        """Start a member of size bytes and return its local header; its data follows with write()."""
+        info = zipfile.ZipInfo(name, date_time=time.localtime()[:6])
+        info.compress_type = zipfile.ZIP_STORED
+        # The expected size decides whether the member needs ZIP64 fields
+        info.file_size = size
+        self._member = self._zip.open(info, mode="w")
+        return self._sink.take()
+
+    def write(self, data):
+        """Add data to the member started last and return it, to send next."""
+        self._member.write(data)
+        return self._sink.take()
+
+    def end(self):
+        """Finish the member started last and return its data descriptor."""
+        self._member.close()
+        self._member = None
+        return self._sink.take()
+
+    def close(self):
+        """Return the central directory that ends the archive."""
+        self._zip.close()
+        return self._sink.take()
+
+
+def multipart_part_header(boundary, filename, length, content_type="application/pdf"):
+    """Headers of a multipart/mixed body part of length bytes; MULTIPART_PART_END follows its data."""
+    headers = (
+        f"--{boundary}\r\n"
+        f"Content-Type: {content_type}\r\n"
+        f'Content-Disposition: attachment; filename="{filename}"\r\n'
+        f"Content-Length: {length}\r\n"
+        "\r\n"
+    )
+    return headers.encode("latin-1")
+
+
+def multipart_end(boundary):
+    """Closing delimiter of a multipart/mixed response."""
+    return f"--{boundary}--\r\n".encode("latin-1")
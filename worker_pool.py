@@ -0,0 +1,190 @@
+import asyncio
+import contextlib
+import functools
+import multiprocessing
+import os
+import signal
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+
+# How often run_with_progress forwards events from the workers, in seconds
+PROGRESS_POLL_INTERVAL = 0.2
+
+
+class PoolBusyError(Exception):
+    """Raised when the pool already has as many jobs as it is allowed to queue."""
+
+
+# Queue shared by every worker process for progress events, set by _init_worker
+_worker_events = None
+
+
+def _init_worker(event_queue):
+    global _worker_events
+    _worker_events = event_queue
+
+
+@contextlib.contextmanager
+def blocked_signals(*signums):
+    """Hold back signums on this thread for the with block; one that arrives meanwhile is delivered after it.
+
+    For work that a signal handler raising an exception must not leave half
+    done, like a message half written into a pipe other processes read.
+    """
+    if not hasattr(signal, "pthread_sigmask"):
+        yield
+        return
+    previous = signal.pthread_sigmask(signal.SIG_BLOCK, signums)
+    try:
+        yield
+    finally:
+        signal.pthread_sigmask(signal.SIG_SETMASK, previous)
+
+
+class QueueReporter:
+    """Picklable progress callback that forwards events from a worker to the parent."""
+
+    def __init__(self, token):
+        self.token = token
+
+    def __call__(self, event):
+        # A deadline alarm in the middle of the write would leave the shared
+        # pipe holding half a message, and the parent stuck reading the rest
+        with blocked_signals(signal.SIGALRM):
+            _worker_events.put((self.token, event))
+
+
+class SplitWorkerPool:
+    """Process pool for CPU-bound PDF work with a bounded number of pending jobs.
+
+    Jobs are submitted from the event loop, so the pending counter needs no lock.
+    Once `max_pending` jobs are running or queued, `run` raises PoolBusyError
+    instead of letting the backlog grow without limit.
+    """
+
+    def __init__(self, max_workers=None, max_pending=None):
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.max_pending = max_pending or self.max_workers * 2
+        self.pending = 0
+        self._executor = None
+        self._events = None
+        self._listeners = {}
+
+    def start(self):
+        if self._executor is None:
+            # Fork keeps worker start-up cheap; the workers only need module-level functions
+            context = multiprocessing.get_context("fork" if os.name == "posix" else "spawn")
+            # SimpleQueue writes synchronously, so a job's events are readable before its result
+            self._events = context.SimpleQueue()
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=context,
+                initializer=_init_worker,
+                initargs=(self._events,)
+            )
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+            self._events.close()
+            self._events = None
+
+    @property
+    def is_full(self):
+        return self.pending >= self.max_pending
+
+    @property
+    def free_slots(self):
+        return max(0, self.max_pending - self.pending)
+
+    async def run(self, fn, *args, **kwargs):
+        """Run `fn(*args, **kwargs)` in a worker process and return its result."""
+        if self.is_full:
+            raise PoolBusyError(f"Split worker pool is full ({self.pending}/{self.max_pending} jobs).")
+
+        self.start()
+        return await self._submit(functools.partial(fn, *args, **kwargs))
+
+    async def run_with_progress(self, fn, on_progress, *args, **kwargs):
+        """Like `run`, passing `fn` a `progress` callback whose events reach `on_progress`.
+
+        `on_progress` is called on the event loop, in the order the worker sent the events.
+        """
+        token = uuid.uuid4().hex
+        self._listeners[token] = on_progress
+
+        task = asyncio.ensure_future(self.run(fn, *args, progress=QueueReporter(token), **kwargs))
+        try:
+            while True:
+                done, _ = await asyncio.wait({task}, timeout=PROGRESS_POLL_INTERVAL)
+                # Drain after the task finishes too, so the last events are not lost
+                self._drain()
+                if done:
+                    return task.result()
+        finally:
+            del self._listeners[token]
+            if not task.done():
+                task.cancel()
+
+    async def map(self, fn, arg_tuples, on_progress=None, return_exceptions=False, **kwargs):
+        """Run `fn(*args, **kwargs)` for every tuple in `arg_tuples` in parallel; results come back in order.
+
+        The calls are admitted all together or not at all, so one request never
+        holds part of the pool while the rest of it is rejected. With
+        `on_progress`, every call gets the same `progress` callback. With
+        `return_exceptions`, every call runs to the end and a failed one gives
+        its exception in the results, as with `asyncio.gather`, so the caller
+        can clean up after the others.
+        """
+        if self.pending + len(arg_tuples) > self.max_pending:
+            raise PoolBusyError(
+                f"Split worker pool is full ({self.pending}/{self.max_pending} jobs, {len(arg_tuples)} requested)."
+            )
+
+        self.start()
+        token = None
+        if on_progress:
+            token = uuid.uuid4().hex
+            self._listeners[token] = on_progress
+            kwargs["progress"] = QueueReporter(token)
+
+        futures = [self._submit(functools.partial(fn, *args, **kwargs)) for args in arg_tuples]
+        gathered = asyncio.gather(*futures, return_exceptions=return_exceptions)
+        try:
+            while True:
+                done, _ = await asyncio.wait({gathered}, timeout=PROGRESS_POLL_INTERVAL if token else None)
+                if token:
+                    self._drain()
+                if done:
+                    return gathered.result()
+        finally:
+            if token:
+                del self._listeners[token]
+            if not gathered.done():
+                # Cancels the calls still waiting; what gather ends with then is of no interest
+                gathered.cancel()
+                gathered.add_done_callback(lambda future: future.cancelled() or future.exception())
+
+    def _submit(self, call):
+        """Submit `call` to the executor; it counts as pending until a worker is done with it.
+
+        Cancelling the returned asyncio future does not stop a call a worker
+        already started, so the count follows the executor's own future.
+        """
+        loop = asyncio.get_running_loop()
+        self.pending += 1
+        future = self._executor.submit(call)
+        future.add_done_callback(lambda _: loop.call_soon_threadsafe(self._release))
+        return asyncio.wrap_future(future, loop=loop)
+
+    def _release(self):
+        self.pending -= 1
+
+    def _drain(self):
+        """Dispatch every queued event to its listener; events of any job may be waiting."""
+        while self._events is not None and not self._events.empty():
+            token, event = self._events.get()
+            listener = self._listeners.get(token)
+            if listener:
+                listener(event)